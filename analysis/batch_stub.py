@@ -0,0 +1,168 @@
+"""
+本地 Batch API 模擬客戶端
+- 模擬 OpenAI / Azure OpenAI 客戶端的 files 與 batches 介面
+- 不需網路與 API 金鑰，用於測試批次分析流程
+- 上傳的檔案與批次狀態保存在 <BATCH_DIR>/stub/，之後的 --batch-stub 程序可以續接資料庫中記錄的批次；
+  找不到的批次回報為 failed，讓其中的文章回到待分析佇列
+"""
+import os
+import sys
+import json
+import uuid
+from types import SimpleNamespace
+
+# 將專案根目錄加入系統路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import BATCH_DIR
+from utils.helpers import ensure_directory
+
+# 模擬回應時用來估算相關度的關鍵字
+MORTGAGE_KEYWORDS = ["房貸", "貸款", "利率", "銀行", "寬限期", "成數", "月付"]
+
+
+def _stub_analysis(user_content):
+    """依關鍵字出現次數產生固定的分析結果"""
+    hits = sum(user_content.count(keyword) for keyword in MORTGAGE_KEYWORDS)
+    return {
+        "relevance_score": min(100, hits * 10),
+        "structured_data": {}
+    }
+
+
+class _StubStore:
+    """以目錄保存模擬的檔案與批次狀態"""
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        ensure_directory(store_dir)
+
+    def _path(self, key, extension):
+        """檔案或批次在目錄中的路徑"""
+        return os.path.join(self.store_dir, f"{key}{extension}")
+
+    def write_file(self, file_id, text):
+        """保存檔案內容"""
+        with open(self._path(file_id, ".jsonl"), 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    def read_file(self, file_id):
+        """讀取檔案內容"""
+        with open(self._path(file_id, ".jsonl"), 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def load_batch(self, batch_id):
+        """讀取批次狀態，不存在時回傳 None"""
+        try:
+            with open(self._path(batch_id, ".json"), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_batch(self, batch_id, batch):
+        """保存批次狀態"""
+        with open(self._path(batch_id, ".json"), 'w', encoding='utf-8') as f:
+            json.dump(batch, f)
+
+
+class _StubFiles:
+    """模擬 client.files"""
+
+    def __init__(self, store):
+        self._store = store
+
+    def create(self, file, purpose):
+        """上傳檔案，回傳含 id 的物件"""
+        data = file.read()
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        file_id = f"file-stub-{uuid.uuid4().hex[:12]}"
+        self._store.write_file(file_id, data)
+        return SimpleNamespace(id=file_id, purpose=purpose)
+
+    def content(self, file_id):
+        """下載檔案內容"""
+        return SimpleNamespace(text=self._store.read_file(file_id))
+
+
+class _StubBatches:
+    """模擬 client.batches"""
+
+    def __init__(self, store, polls_to_complete):
+        self._store = store
+        self._polls_to_complete = polls_to_complete
+
+    def create(self, input_file_id, endpoint, completion_window, **kwargs):
+        """建立批次"""
+        batch_id = f"batch-stub-{uuid.uuid4().hex[:12]}"
+        self._store.save_batch(batch_id, {
+            "input_file_id": input_file_id,
+            "polls": 0,
+            "output_file_id": None,
+        })
+        return SimpleNamespace(id=batch_id, status="validating", output_file_id=None, error_file_id=None)
+
+    def retrieve(self, batch_id):
+        """查詢批次狀態，輪詢指定次數後完成；找不到的批次（例如模擬資料已刪除）回報為 failed"""
+        batch = self._store.load_batch(batch_id)
+        if batch is None:
+            return SimpleNamespace(id=batch_id, status="failed", output_file_id=None, error_file_id=None)
+        batch["polls"] += 1
+        if batch["polls"] >= self._polls_to_complete and batch["output_file_id"] is None:
+            batch["output_file_id"] = self._run(batch["input_file_id"])
+        self._store.save_batch(batch_id, batch)
+        if batch["output_file_id"] is None:
+            return SimpleNamespace(id=batch_id, status="in_progress", output_file_id=None, error_file_id=None)
+        return SimpleNamespace(id=batch_id, status="completed", output_file_id=batch["output_file_id"], error_file_id=None)
+
+    def _run(self, input_file_id):
+        """處理輸入檔案的每一行並產生輸出檔案"""
+        output_lines = []
+        for line in self._store.read_file(input_file_id).splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            messages = request["body"]["messages"]
+            user_content = messages[-1]["content"]
+            prompt_chars = sum(len(message["content"]) for message in messages)
+            output_lines.append(json.dumps({
+                "id": f"batch-req-{uuid.uuid4().hex[:12]}",
+                "custom_id": request["custom_id"],
+                "response": {
+                    "status_code": 200,
+                    "body": {
+                        "choices": [{
+                            "message": {
+                                "role": "assistant",
+                                "content": json.dumps(_stub_analysis(user_content), ensure_ascii=False)
+                            }
+                        }],
+                        "usage": {
+                            "prompt_tokens": prompt_chars,
+                            "completion_tokens": 20,
+                            "total_tokens": prompt_chars + 20,
+                            "prompt_tokens_details": {"cached_tokens": 0}
+                        }
+                    }
+                },
+                "error": None
+            }, ensure_ascii=False))
+
+        output_file_id = f"file-stub-{uuid.uuid4().hex[:12]}"
+        self._store.write_file(output_file_id, "\n".join(output_lines))
+        return output_file_id
+
+
+class LocalBatchClient:
+    """本地模擬的 Batch API 客戶端，可注入 GPTAnalyzer 取代真正的 API 客戶端"""
+
+    def __init__(self, polls_to_complete=1, store_dir=None):
+        """初始化模擬客戶端
+
+        polls_to_complete: 批次需被查詢幾次後才會顯示為完成
+        store_dir: 保存模擬檔案與批次狀態的目錄，預設為 <BATCH_DIR>/stub
+        """
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        store = _StubStore(store_dir or os.path.join(project_root, BATCH_DIR, "stub"))
+        self.files = _StubFiles(store)
+        self.batches = _StubBatches(store, polls_to_complete)
@@ -0,0 +1,96 @@
+"""
+長文切段工具
+- 估算文字的 token 數（安裝 tiktoken 且能載入編碼時使用 tiktoken，否則以字元類型估算）
+- 依段落邊界將長文切成不超過 token 上限的片段
+"""
+import re
+import logging
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken 為可選套件
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# 粗估時使用：中日韓文字約 1 字 1 token，其餘字元約 4 字元 1 token
+_CJK_PATTERN = re.compile(r'[　-ヿ㐀-䶿一-鿿豈-﫿＀-￯]')
+_PARAGRAPH_PATTERN = re.compile(r'\n\s*\n|\n')
+_SENTENCE_PATTERN = re.compile(r'(?<=[。！？!?；;])')
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model):
+    """取得模型對應的 tiktoken 編碼器；未安裝或無法載入編碼檔（例如離線）時回傳 None
+
+    結果依模型快取，載入失敗只會記錄一次，之後都改用字元類型估算
+    """
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"無法載入 tiktoken 編碼，改以字元類型估算 token 數: {e}")
+        return None
+
+
+def count_tokens(text, model="gpt-3.5-turbo"):
+    """計算文字的 token 數"""
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+
+def _split_oversized(text, max_tokens, model):
+    """將超過上限的單一段落依句子切開，仍過長的句子則依字元數硬切"""
+    pieces = []
+    for sentence in _SENTENCE_PATTERN.split(text):
+        if not sentence:
+            continue
+        if count_tokens(sentence, model) <= max_tokens:
+            pieces.append(sentence)
+            continue
+        # 以平均每字元 token 數估算切點
+        step = max(1, int(len(sentence) * max_tokens / count_tokens(sentence, model)))
+        pieces.extend(sentence[i:i + step] for i in range(0, len(sentence), step))
+    return pieces
+
+
+def split_into_chunks(text, max_tokens, model="gpt-3.5-turbo"):
+    """依段落邊界將文字切成每段不超過 max_tokens 的片段"""
+    if count_tokens(text, model) <= max_tokens:
+        return [text]
+
+    paragraphs = []
+    for paragraph in _PARAGRAPH_PATTERN.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if count_tokens(paragraph, model) > max_tokens:
+            paragraphs.extend(_split_oversized(paragraph, max_tokens, model))
+        else:
+            paragraphs.append(paragraph)
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for paragraph in paragraphs:
+        # 段落之間的換行約佔 1 token
+        paragraph_tokens = count_tokens(paragraph, model) + 1
+        if current and current_tokens + paragraph_tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current = []
+            current_tokens = 0
+        current.append(paragraph)
+        current_tokens += paragraph_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
@@ -8,31 +8,43 @@ import sys
 import json
 import logging
 from datetime import datetime
-import re
 import time
-from openai import OpenAI, AzureOpenAI
+import uuid
+import socket
+from concurrent.futures import ThreadPoolExecutor
 
 # 將專案根目錄加入系統路徑
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from config.settings import (
+    BATCH_DIR, BATCH_MAX_REQUESTS, BATCH_COMPLETION_WINDOW, BATCH_POLL_INTERVAL,
+    MAX_INPUT_TOKENS, CHUNK_WORKERS, ANALYSIS_CLAIM_SIZE, ANALYSIS_LEASE_SECONDS, COMMENTS_FOR_ANALYSIS
+)
 from database.db_manager import DatabaseManager
-
-# 設定日誌
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    filename=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logs', 'analysis.log'),
-    encoding='utf-8'  # 確保 UTF-8 編碼配置正確
+from analysis.prompts import (
+    PROMPT_VERSION, build_messages, build_response_format, build_chunk_content, build_post_content
 )
+from analysis.response_parser import AnalysisParseError, parse_analysis, merge_analyses
+from analysis.chunker import count_tokens, split_into_chunks
+from utils.helpers import ensure_directory
+
 logger = logging.getLogger(__name__)
 
 class GPTAnalyzer:
     """使用 GPT 分析 Dcard 房屋文章的類別"""
     
-    def __init__(self, api_key=None, model="gpt-3.5-turbo", endpoint_url=None, api_version="2024-12-01-preview", deployment=None):
-        """初始化 GPT 分析器"""
-        self.db = DatabaseManager()
-        self.db.connect()
+    def __init__(self, api_key=None, model="gpt-3.5-turbo", endpoint_url=None, api_version="2024-12-01-preview", deployment=None, client=None, db=None):
+        """初始化 GPT 分析器
+
+        client: 可選，自訂的 API 客戶端（例如測試用的 LocalBatchClient）
+        db: 可選，共用的 DatabaseManager（常駐模式下與爬蟲共用同一個連線）
+        """
+        self.db = db or DatabaseManager()
+        if not self.db.conn:
+            self.db.connect()
+        self.db.initialize_db()
+        # 認領文章時使用的工作程序識別碼
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
         
         # 設定 OpenAI API key
         self.api_key = api_key or os.environ.get("OPENAI_API_KEY")
@@ -46,7 +58,12 @@ class GPTAnalyzer:
         self.api_version = api_version
         
         # 初始化 API 客戶端
-        if self.endpoint_url and "azure" in self.endpoint_url:
+        if client is not None:
+            logger.info(f"使用自訂 API 客戶端: {type(client).__name__}")
+            self.client = client
+            self.is_azure = False
+        elif self.endpoint_url and "azure" in self.endpoint_url:
+            from openai import AzureOpenAI
             logger.info(f"使用 Azure OpenAI API，端點: {self.endpoint_url}")
             self.client = AzureOpenAI(
                 api_version=api_version,
@@ -55,132 +72,371 @@ class GPTAnalyzer:
             )
             self.is_azure = True
         else:
+            from openai import OpenAI
             logger.info("使用標準 OpenAI API")
             self.client = OpenAI(api_key=self.api_key)
             self.is_azure = False
     
-    def analyze_posts(self):
-        """分析所有尚未分析過的文章"""
-        logger.info("開始使用 GPT 分析文章...")
-        
-        # 取得所有未分析的文章
-        posts = self.db.get_posts_for_analysis()
+    def analyze_posts(self, stop_event=None):
+        """分析所有尚未分析過的文章
+
+        以租約方式分批認領文章，多個分析程序可同時處理同一個資料庫而不會重複分析。
+        分析失敗的文章會釋放租約並累加嘗試次數，在重試次數上限內重新被認領。
+        stop_event: 可選，threading.Event，設定後在目前文章分析完成後停止並釋放其餘租約
+        """
+        logger.info(f"開始使用 GPT 分析文章... (工作程序: {self.worker_id})")
         
-        if not posts:
+        success_count = 0
+        attempt_count = 0
+        claimed_count = 0
+        try:
+            while stop_event is None or not stop_event.is_set():
+                posts = self.db.claim_posts_for_analysis(self.worker_id, ANALYSIS_CLAIM_SIZE, ANALYSIS_LEASE_SECONDS)
+                if not posts:
+                    break
+                claimed_count += len(posts)
+                posts = self.attach_comments(posts)
+                # 以實際送出的內容（含留言）計算 token 數，切段時直接沿用
+                sizes = self.presize_posts(posts)
+                
+                last_renewed = time.monotonic()
+                for position, post in enumerate(posts):
+                    if stop_event is not None and stop_event.is_set():
+                        logger.info("收到停止訊號，結束分析")
+                        break
+                    post_id, title, content = post[0], post[1], post[2]
+                    
+                    # 處理時間超過租約的三分之一時，延長本批尚未完成文章的租約
+                    if time.monotonic() - last_renewed > ANALYSIS_LEASE_SECONDS / 3:
+                        self.db.renew_leases(self.worker_id, [p[0] for p in posts[position:]], ANALYSIS_LEASE_SECONDS)
+                        last_renewed = time.monotonic()
+                    
+                    attempt_count += 1
+                    try:
+                        # 分析文章與房貸主題的相關程度
+                        relevance_score, structured_data, usage = self.analyze_with_gpt(title, content, sizes[post_id])
+                        
+                        # 儲存分析結果
+                        structured_data_json = json.dumps(structured_data, ensure_ascii=False)
+                        if self.db.update_post_analysis(post_id, relevance_score, structured_data_json, usage):
+                            success_count += 1
+                            logger.info(f"成功分析文章: {title}")
+                        else:
+                            # 寫入失敗也計入嘗試次數，避免同一篇文章無限次重新認領並重複付費
+                            self.db.record_analysis_failures([(post_id, "寫入分析結果失敗")])
+                        
+                    except Exception as e:
+                        logger.error(f"分析文章 '{title}' 時發生錯誤: {e}")
+                        # 失敗的文章回到待分析佇列，超過重試次數上限者不會再被認領
+                        self.db.record_analysis_failures([(post_id, e)])
+                    finally:
+                        self.db.release_leases(self.worker_id, [post_id])
+                    
+                    # 防止 API 請求過於頻繁
+                    time.sleep(1)
+        finally:
+            # 中斷時釋放尚未完成的租約，讓其他程序可立即認領
+            self.db.release_leases(self.worker_id)
+                
+        if claimed_count == 0:
             logger.info("沒有需要分析的文章")
             return True
+        logger.info(f"成功分析 {success_count}/{attempt_count} 次分析請求")
+        return success_count > 0
+    
+    @property
+    def request_model(self):
+        """請求與記錄使用的模型名稱：Azure OpenAI 以部署名稱指定模型"""
+        return self.deployment if self.is_azure else self.model
+    
+    def build_request(self, title, content):
+        """建立分析單篇文章的 chat.completions 請求參數"""
+        return {
+            "messages": build_messages(title, content),
+            "temperature": 0.3,
+            "max_tokens": 1000,
+            "response_format": build_response_format(self.request_model),
+            "model": self.request_model
+        }
+    
+    def build_usage(self, usage, mode):
+        """將 API 回應的 usage（物件或批次輸出中的 dict）轉為資料庫記錄格式"""
+        if usage is None:
+            return None
+        if not isinstance(usage, dict):
+            usage = usage.model_dump() if hasattr(usage, "model_dump") else vars(usage)
+        details = usage.get("prompt_tokens_details") or {}
+        if not isinstance(details, dict):
+            details = vars(details)
+        return {
+            "prompt_version": PROMPT_VERSION,
+            "analysis_model": self.request_model,
+            "analysis_mode": mode,
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "completion_tokens": usage.get("completion_tokens"),
+            "cached_tokens": details.get("cached_tokens") or 0
+        }
+    
+    def parse_response(self, response_text):
+        """從 GPT 回應文字解析相關度分數與結構化數據，格式不符時拋出 AnalysisParseError"""
+        relevance_score, structured_data = parse_analysis(response_text)
+        logger.info(f"GPT 分析完成: 相關度分數 = {relevance_score}")
+        return relevance_score, structured_data
+    
+    def attach_comments(self, posts):
+        """將各篇文章已抓取的留言附加在內容之後，回傳新的 (id, title, content) 列表"""
+        comments = {}
+        # 分段查詢，避免超過 SQLite 單一查詢的參數數量上限
+        for start in range(0, len(posts), 500):
+            comments.update(self.db.get_post_comments([post[0] for post in posts[start:start + 500]], COMMENTS_FOR_ANALYSIS))
+        if comments:
+            logger.info(f"{len(comments)}/{len(posts)} 篇文章附加留言一併分析")
+        return [(post[0], post[1], build_post_content(post[2], comments.get(post[0]))) for post in posts]
+    
+    def presize_posts(self, posts):
+        """計算待分析文章（已附加留言的內容）的 token 數，回傳 {文章ID: token 數}
+
+        結果傳給 split_content，未超過上限的文章不必再計算一次
+        """
+        sizes = {post[0]: count_tokens(post[2] or "", self.model) for post in posts}
+        long_count = sum(1 for size in sizes.values() if size > MAX_INPUT_TOKENS)
+        logger.info(
+            f"待分析內容約 {sum(sizes.values())} tokens，"
+            f"其中 {long_count} 篇超過 {MAX_INPUT_TOKENS} tokens 將切段分析"
+        )
+        return sizes
+    
+    def split_content(self, content, token_count=None):
+        """將文章內容切段，回傳各段要送出的內容；不需切段時只有一段
+
+        token_count: 可選，presize_posts 預先算好的 token 數，未超過上限時不再重新計算
+        """
+        if token_count is not None and token_count <= MAX_INPUT_TOKENS:
+            return [content]
+        chunks = split_into_chunks(content, MAX_INPUT_TOKENS, self.model)
+        if len(chunks) == 1:
+            return chunks
+        return [build_chunk_content(chunk, index, len(chunks)) for index, chunk in enumerate(chunks, 1)]
+    
+    def request_analysis(self, title, content):
+        """送出單一分析請求，回傳 (相關度分數, 結構化數據, token 用量)"""
+        # 發送 API 請求
+        response = self.client.chat.completions.create(**self.build_request(title, content))
+        usage = self.build_usage(getattr(response, "usage", None), "sync")
         
-        logger.info(f"共有 {len(posts)} 篇文章需要分析")
+        # 解析回應
+        response_text = response.choices[0].message.content or ""
+        relevance_score, structured_data = self.parse_response(response_text)
+        return relevance_score, structured_data, usage
+    
+    def analyze_with_gpt(self, title, content, token_count=None):
+        """使用 GPT 分析文章標題和內容，回傳 (相關度分數, 結構化數據, token 用量)
+
+        超過 MAX_INPUT_TOKENS 的長文會依段落切段並行分析後合併。
+        token_count: 可選，預先算好的內容 token 數
+        API 呼叫失敗或回應格式不符時拋出例外，由呼叫端決定是否重試
+        """
+        chunks = self.split_content(content, token_count)
+        if len(chunks) == 1:
+            return self.request_analysis(title, chunks[0])
         
-        success_count = 0
-        for post in posts:
-            post_id, title, content = post[0], post[1], post[2]
-            
-            if not content:
-                logger.warning(f"文章內容為空: {title}")
-                continue
+        logger.info(f"文章 '{title}' 過長，切為 {len(chunks)} 段分析")
+        with ThreadPoolExecutor(max_workers=min(CHUNK_WORKERS, len(chunks))) as executor:
+            outputs = list(executor.map(lambda chunk: self.request_analysis(title, chunk), chunks))
+        
+        relevance_score, structured_data = merge_analyses([(score, data) for score, data, _ in outputs])
+        usage = merge_usage([usage for _, _, usage in outputs])
+        logger.info(f"長文合併分析完成: 相關度分數 = {relevance_score}")
+        return relevance_score, structured_data, usage
+    
+    def analyze_posts_batch(self, wait=True, poll_interval=BATCH_POLL_INTERVAL):
+        """使用 Batch API 離線分析所有尚未分析的文章
+
+        會先續接資料庫中尚未結束的批次；若沒有，才為待分析文章建立新批次。
+        wait 為 True 時會持續輪詢直到所有批次結束並寫回結果。
+        """
+        logger.info("開始使用 Batch API 分析文章...")
+        
+        if not self.db.get_open_batches():
+            posts = [post for post in self.db.get_posts_for_batch() if post[2]]
+            if not posts:
+                logger.info("沒有需要分析的文章")
+                return True
             
-            try:
-                # 分析文章與房貸主題的相關程度
-                relevance_score, structured_data = self.analyze_with_gpt(title, content)
-                
-                # 儲存分析結果
-                structured_data_json = json.dumps(structured_data, ensure_ascii=False)
-                if self.db.update_post_analysis(post_id, relevance_score, structured_data_json):
-                    success_count += 1
-                    logger.info(f"成功分析文章: {title}")
-                
-                # 防止 API 請求過於頻繁
-                time.sleep(1)
-                
-            except Exception as e:
-                logger.error(f"分析文章 '{title}' 時發生錯誤: {e}")
-                
-        logger.info(f"成功分析 {success_count}/{len(posts)} 篇文章")
-        return success_count > 0
+            logger.info(f"共有 {len(posts)} 篇文章需要批次分析")
+            posts = self.attach_comments(posts)
+            sizes = self.presize_posts(posts)
+            for start in range(0, len(posts), BATCH_MAX_REQUESTS):
+                if not self.submit_batch(posts[start:start + BATCH_MAX_REQUESTS], sizes):
+                    return False
+        else:
+            logger.info("發現尚未結束的批次，繼續追蹤")
+        
+        applied_count = self.poll_batches()
+        while wait and self.db.get_open_batches():
+            time.sleep(poll_interval)
+            applied_count += self.poll_batches()
+        
+        logger.info(f"批次分析共寫回 {applied_count} 篇文章")
+        return applied_count > 0 or not wait
     
-    def analyze_with_gpt(self, title, content):
-        """使用 GPT 分析文章標題和內容"""
+    def submit_batch(self, posts, sizes=None):
+        """將文章寫成 JSONL 批次檔並提交至 Batch API
+
+        sizes: 可選，presize_posts 回傳的 {文章ID: token 數}
+        """
+        sizes = sizes or {}
+        batch_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), BATCH_DIR)
+        ensure_directory(batch_dir)
+        input_path = os.path.join(batch_dir, f"batch_input_{datetime.now().strftime('%Y%m%d%H%M%S%f')}.jsonl")
+        # Azure OpenAI 的批次端點不含 /v1 前綴
+        endpoint = "/chat/completions" if self.is_azure else "/v1/chat/completions"
+        
         try:
-            # 將標題與內容結合起來進行分析
-            text_to_analyze = f"標題: {title}\n\n內容: {content}"
-            
-            # 定義系統提示詞
-            system_prompt = """
-            你是一位專業的房地產與房貸分析專家。請分析提供的Dcard房屋版文章，執行兩項任務:
+            request_count = 0
+            with open(input_path, 'w', encoding='utf-8') as f:
+                for post_id, title, content in posts:
+                    chunks = self.split_content(content, sizes.get(post_id))
+                    for index, chunk in enumerate(chunks, 1):
+                        # 長文的每一段各自成為一個請求：post-<文章ID>-<段落序號>-<總段數>
+                        custom_id = f"post-{post_id}" if len(chunks) == 1 else f"post-{post_id}-{index}-{len(chunks)}"
+                        f.write(json.dumps({
+                            "custom_id": custom_id,
+                            "method": "POST",
+                            "url": endpoint,
+                            "body": self.build_request(title, chunk)
+                        }, ensure_ascii=False))
+                        f.write("\n")
+                        request_count += 1
             
-            1. 評估文章與「房貸」主題的相關程度，給出0-100的分數。
-               - 0分表示完全無關
-               - 100分表示非常相關，主要討論房貸
-            
-            2. 從文章中提取結構化資訊(如有提及)，包括:
-               - 房貸金額
-               - 房貸利率
-               - 貸款年限
-               - 貸款成數
-               - 月付金額
-               - 提到的銀行名稱列表
+            with open(input_path, 'rb') as f:
+                input_file = self.client.files.create(file=f, purpose="batch")
+            batch = self.client.batches.create(
+                input_file_id=input_file.id,
+                endpoint=endpoint,
+                completion_window=BATCH_COMPLETION_WINDOW
+            )
+            logger.info(f"已提交批次 {batch.id}，共 {len(posts)} 篇文章、{request_count} 個請求")
+            return self.db.record_batch(batch.id, input_path, batch.status, [post[0] for post in posts])
+        except Exception as e:
+            logger.error(f"提交批次失敗: {e}")
+            return False
+    
+    def poll_batches(self):
+        """查詢所有尚未結束的批次，已完成者寫回資料庫，回傳寫回的文章數"""
+        applied_count = 0
+        for batch_id, _, _ in self.db.get_open_batches():
+            try:
+                batch = self.client.batches.retrieve(batch_id)
+            except Exception as e:
+                logger.error(f"查詢批次 {batch_id} 失敗: {e}")
+                continue
             
-            請以JSON格式回覆，不要包含解釋，範例:
-            {
-                "relevance_score": 85,
-                "structured_data": {
-                    "房貸金額": "500萬",
-                    "房貸利率": "1.31%",
-                    "貸款年限": "30年",
-                    "貸款成數": "80成",
-                    "月付金額": "21000",
-                    "提到的銀行": ["台銀", "土銀"]
-                }
-            }
-            """
+            if batch.status != "completed":
+                self.db.update_batch_status(batch_id, batch.status)
+                continue
             
-            # 發送 API 請求
-            if self.is_azure:
-                response = self.client.chat.completions.create(
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": text_to_analyze}
-                    ],
-                    temperature=0.3,
-                    max_tokens=1000,
-                    model=self.deployment
-                )
-            else:
-                response = self.client.chat.completions.create(
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": text_to_analyze}
-                    ],
-                    temperature=0.3,
-                    max_tokens=1000,
-                    model=self.model
+            self.db.update_batch_status(batch_id, batch.status, batch.output_file_id)
+            try:
+                count = self.apply_batch_results(batch_id, batch.output_file_id)
+            except Exception as e:
+                # 非預期的錯誤每次輪詢都會重現，將批次標記為失敗，文章計入嘗試次數後回到待分析佇列
+                logger.error(f"寫回批次 {batch_id} 結果失敗: {e}")
+                self.db.record_analysis_failures(
+                    [(post_id, f"寫回批次結果失敗: {e}") for post_id in self.db.get_batch_post_ids(batch_id)]
                 )
+                self.db.update_batch_status(batch_id, "failed")
+                continue
+            if count is not None:
+                applied_count += count
+                self.db.update_batch_status(batch_id, "applied")
+        return applied_count
+    
+    def apply_batch_results(self, batch_id, output_file_id):
+        """下載批次輸出檔案並以單一交易寫回分析結果，回傳成功筆數，下載或寫入失敗時回傳 None
+
+        沒有成功結果的文章會累加嘗試次數，留待下一個批次重新分析
+        """
+        output_text = ""
+        if output_file_id:
+            try:
+                output_text = self.client.files.content(output_file_id).text
+            except Exception as e:
+                logger.error(f"下載批次輸出檔案 {output_file_id} 失敗: {e}")
+                return None
+        else:
+            # 全部請求皆失敗時不會有輸出檔案
+            logger.warning(f"批次 {batch_id} 沒有輸出檔案")
+        
+        chunk_outputs = {}
+        chunk_totals = {}
+        errors = {}
+        for line in output_text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+                custom_id = item["custom_id"]
+                parts = custom_id.split("-")
+                post_id = int(parts[1])
+                index, total = (int(parts[2]), int(parts[3])) if len(parts) == 4 else (1, 1)
+            except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+                # 無法對應到文章的輸出行略過；其文章會在下方以「沒有結果」記錄失敗
+                logger.error(f"批次 {batch_id} 輸出行格式不符，已略過: {e}")
+                continue
+            chunk_totals[post_id] = total
+            response = item.get("response") or {}
+            if item.get("error") or response.get("status_code") != 200:
+                logger.error(f"批次請求 {custom_id} 失敗: {item.get('error')}")
+                errors[post_id] = item.get("error") or f"HTTP {response.get('status_code')}"
+                continue
             
-            # 解析回應
-            response_text = response.choices[0].message.content.strip()
-            
-            # 查找並提取 JSON 部分
-            json_match = re.search(r'{.*}', response_text, re.DOTALL)
-            if json_match:
-                json_text = json_match.group(0)
-                result = json.loads(json_text)
-                
-                # 提取相關度分數和結構化數據
-                relevance_score = result.get("relevance_score", 0)
-                structured_data = result.get("structured_data", {})
-                
-                logger.info(f"GPT 分析完成: 相關度分數 = {relevance_score}")
-                return relevance_score, structured_data
-            else:
-                logger.error("無法從 GPT 回應中解析 JSON 結果")
-                return 0, {}
-            
-        except Exception as e:
-            logger.error(f"GPT 分析失敗: {e}")
-            return 0, {}
+            try:
+                body = response["body"]
+                relevance_score, structured_data = self.parse_response(body["choices"][0]["message"]["content"] or "")
+                usage = self.build_usage(body.get("usage"), "batch")
+            except (AnalysisParseError, KeyError, IndexError, TypeError, AttributeError) as e:
+                logger.error(f"批次請求 {custom_id} 回應格式不符: {e}")
+                errors[post_id] = e
+                continue
+            chunk_outputs.setdefault(post_id, {})[index] = (relevance_score, structured_data, usage)
+        
+        results = []
+        for post_id, outputs in chunk_outputs.items():
+            # 長文須所有段落都成功才合併寫回
+            if post_id in errors or len(outputs) != chunk_totals[post_id]:
+                continue
+            ordered = [outputs[index] for index in sorted(outputs)]
+            relevance_score, structured_data = merge_analyses([(score, data) for score, data, _ in ordered])
+            usage = merge_usage([usage for _, _, usage in ordered])
+            results.append((post_id, relevance_score, json.dumps(structured_data, ensure_ascii=False), usage))
+        
+        if results and not self.db.bulk_update_post_analysis(results):
+            return None
+        
+        succeeded = {result[0] for result in results}
+        failures = [
+            (post_id, errors.get(post_id, "批次輸出中沒有此文章的結果"))
+            for post_id in self.db.get_batch_post_ids(batch_id)
+            if post_id not in succeeded
+        ]
+        if failures:
+            self.db.record_analysis_failures(failures)
+        return len(results)
+
+def merge_usage(usages):
+    """加總多個請求的 token 用量"""
+    usages = [usage for usage in usages if usage]
+    if not usages:
+        return None
+    merged = dict(usages[0])
+    for key in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+        merged[key] = sum(usage.get(key) or 0 for usage in usages)
+    return merged
 
 if __name__ == "__main__":
+    from utils.logging_config import setup_logging
+    setup_logging('analysis')
     # 可以在這裡設置 API 金鑰或使用環境變數
     endpoint_url = os.getenv("ENDPOINT_URL")
     api_key = os.getenv("OPENAI_API_KEY")
@@ -0,0 +1,83 @@
+"""
+GPT 分析使用的提示詞模板
+- 系統提示詞在模組載入時組好一次，所有請求共用完全相同的前綴
+- OpenAI 的 prompt caching 只對至少 PROMPT_CACHE_MIN_TOKENS（1024）token 的相同前綴生效；
+  目前系統提示詞約 250 token，不同文章之間不會命中快取，只有完全相同的長請求（例如解析失敗後重試）
+  才可能命中。實際命中率請以 utils/cost_report.py 的快取欄位確認
+- 修改提示詞內容時必須同時調整 PROMPT_VERSION，分析結果會記錄所使用的版本
+"""
+from config.settings import JSON_SCHEMA_MODEL_PREFIXES
+
+PROMPT_VERSION = "v4"
+
+SYSTEM_PROMPT = "\n".join([
+    "你是一位專業的房地產與房貸分析專家。請分析提供的Dcard房屋版文章，執行兩項任務:",
+    "1. 評估文章與「房貸」主題的相關程度，給出0-100的分數。0分表示完全無關，100分表示非常相關，主要討論房貸。",
+    "2. 從文章中提取結構化資訊(如有提及)，包括: 房貸金額、房貸利率、貸款年限、貸款成數、月付金額、提到的銀行名稱列表。",
+    "文章內容後可能附有網友留言（以樓層標示），留言中分享的利率與銀行經驗也請一併評估與提取。",
+    "請以JSON格式回覆，不要包含解釋，範例:",
+    '{"relevance_score":85,"structured_data":{"房貸金額":"500萬","房貸利率":"1.31%","貸款年限":"30年",'
+    '"貸款成數":"8成","月付金額":"21000","提到的銀行":["台銀","土銀"]}}',
+])
+
+USER_PROMPT_TEMPLATE = "標題: {title}\n\n內容: {content}"
+# 長文切段後，每段內容前加上段落位置說明
+CHUNK_CONTENT_TEMPLATE = "（長文第 {index}/{total} 段）\n{content}"
+# 文章內容後附加的留言區塊，每則留言一行
+COMMENTS_TEMPLATE = "{content}\n\n留言:\n{comments}"
+COMMENT_LINE_TEMPLATE = "B{floor}: {content}"
+
+# 結構化資訊的欄位，除「提到的銀行」為字串陣列外，其餘皆為字串或 null
+STRUCTURED_TEXT_FIELDS = ["房貸金額", "房貸利率", "貸款年限", "貸款成數", "月付金額"]
+STRUCTURED_LIST_FIELD = "提到的銀行"
+
+# Structured Outputs 使用的 JSON Schema（strict 模式要求所有欄位皆為 required）
+ANALYSIS_JSON_SCHEMA = {
+    "name": "mortgage_post_analysis",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "relevance_score": {"type": "integer"},
+            "structured_data": {
+                "type": "object",
+                "properties": {
+                    **{field: {"type": ["string", "null"]} for field in STRUCTURED_TEXT_FIELDS},
+                    STRUCTURED_LIST_FIELD: {"type": "array", "items": {"type": "string"}},
+                },
+                "required": STRUCTURED_TEXT_FIELDS + [STRUCTURED_LIST_FIELD],
+                "additionalProperties": False,
+            },
+        },
+        "required": ["relevance_score", "structured_data"],
+        "additionalProperties": False,
+    },
+}
+
+
+def build_response_format(model):
+    """依模型選擇回應格式：支援 Structured Outputs 的模型使用 JSON Schema，其餘使用 JSON mode"""
+    if model and model.startswith(JSON_SCHEMA_MODEL_PREFIXES):
+        return {"type": "json_schema", "json_schema": ANALYSIS_JSON_SCHEMA}
+    return {"type": "json_object"}
+
+
+def build_chunk_content(content, index, total):
+    """組出切段後單一段落的內容，index 從 1 開始"""
+    return CHUNK_CONTENT_TEMPLATE.format(index=index, total=total, content=content)
+
+
+def build_post_content(content, comments):
+    """將留言附加在文章內容之後，comments 為 [(樓層, 留言內容), ...]"""
+    if not comments:
+        return content
+    lines = "\n".join(COMMENT_LINE_TEMPLATE.format(floor=floor, content=" ".join(text.split())) for floor, text in comments)
+    return COMMENTS_TEMPLATE.format(content=content or "", comments=lines)
+
+
+def build_messages(title, content):
+    """組出 chat.completions 的 messages，固定的系統提示詞放在最前面"""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": USER_PROMPT_TEMPLATE.format(title=title, content=content)}
+    ]
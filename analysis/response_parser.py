@@ -0,0 +1,85 @@
+"""
+GPT 分析回應的解析與驗證
+- 依 analysis/prompts.py 定義的欄位驗證回應，不符合時拋出 AnalysisParseError
+- 安裝 orjson 時使用 orjson 解析，否則退回標準函式庫 json
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson 為可選套件
+    orjson = None
+
+from analysis.prompts import STRUCTURED_TEXT_FIELDS, STRUCTURED_LIST_FIELD
+
+
+class AnalysisParseError(ValueError):
+    """GPT 回應無法解析或不符合預期格式"""
+
+
+def loads(text):
+    """解析 JSON 文字"""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def parse_analysis(response_text):
+    """解析並驗證 GPT 回應，回傳 (relevance_score, structured_data)
+
+    structured_data 一律包含所有欄位，未提及的欄位為 None（銀行列表為空列表）
+    """
+    if not response_text or not response_text.strip():
+        raise AnalysisParseError("回應內容為空")
+
+    try:
+        result = loads(response_text)
+    except ValueError as e:
+        raise AnalysisParseError(f"回應不是合法的 JSON: {e}") from e
+
+    if not isinstance(result, dict):
+        raise AnalysisParseError("回應的最外層不是 JSON 物件")
+
+    relevance_score = result.get("relevance_score")
+    if isinstance(relevance_score, bool) or not isinstance(relevance_score, (int, float)):
+        raise AnalysisParseError(f"relevance_score 不是數字: {relevance_score!r}")
+    if not 0 <= relevance_score <= 100:
+        raise AnalysisParseError(f"relevance_score 超出 0-100 範圍: {relevance_score}")
+
+    raw_data = result.get("structured_data")
+    if not isinstance(raw_data, dict):
+        raise AnalysisParseError("structured_data 不是 JSON 物件")
+
+    structured_data = {}
+    for field in STRUCTURED_TEXT_FIELDS:
+        value = raw_data.get(field)
+        if value is not None and not isinstance(value, (str, int, float)):
+            raise AnalysisParseError(f"欄位 {field} 的型別不正確: {value!r}")
+        structured_data[field] = str(value) if value is not None and value != "" else None
+
+    banks = raw_data.get(STRUCTURED_LIST_FIELD) or []
+    if not isinstance(banks, list) or not all(isinstance(bank, str) for bank in banks):
+        raise AnalysisParseError(f"欄位 {STRUCTURED_LIST_FIELD} 不是字串列表: {banks!r}")
+    structured_data[STRUCTURED_LIST_FIELD] = banks
+
+    return int(round(relevance_score)), structured_data
+
+
+def merge_analyses(results):
+    """合併同一篇文章各段落的分析結果
+
+    results 為 (relevance_score, structured_data) 的序列（依段落順序）：
+    相關度取各段最高分，文字欄位取第一個有值的段落，銀行列表依出現順序去重
+    """
+    relevance_score = max(score for score, _ in results)
+    structured_data = {field: None for field in STRUCTURED_TEXT_FIELDS}
+    banks = []
+    for _, data in results:
+        for field in STRUCTURED_TEXT_FIELDS:
+            if structured_data[field] is None and data.get(field) is not None:
+                structured_data[field] = data[field]
+        for bank in data.get(STRUCTURED_LIST_FIELD, []):
+            if bank not in banks:
+                banks.append(bank)
+    structured_data[STRUCTURED_LIST_FIELD] = banks
+    return relevance_score, structured_data
@@ -0,0 +1,488 @@
+"""
+相似文章索引模組
+- 以雜湊字元 n-gram 建立 TF-IDF 特徵，再以隨機化 SVD 降維，不依賴外部嵌入服務
+- 向量存放於 float32 的 memory-mapped 檔案，小型語料使用暴力搜尋，大型語料建立 IVF 分群索引
+- 爬蟲新增文章時可透過 DatabaseManager.add_insert_listener 即時加入索引，
+  重新抓取到編輯後的內容時透過 add_update_listener 重新計算該文章的向量；
+  IDF 與 SVD 投影在建立索引時固定，語料變化較大時請重新執行 build
+- 多個程序可能同時寫入索引，附加或更新向量時以檔案鎖保護，並在鎖內重新讀取 meta.json
+用法:
+    python analysis/similarity.py build
+    python analysis/similarity.py sync
+    python analysis/similarity.py query "新青安 寬限期 利率" [--top 10]
+    python analysis/similarity.py query --post-id 123
+"""
+import os
+import re
+import sys
+import json
+import shutil
+import logging
+import argparse
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+# 將專案根目錄加入系統路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import (
+    SIMILARITY_INDEX_DIR, SIMILARITY_N_FEATURES, SIMILARITY_NGRAMS, SIMILARITY_MAX_CHARS,
+    SIMILARITY_DIM, SIMILARITY_FIT_SAMPLE, SIMILARITY_IVF_MIN_POSTS, SIMILARITY_IVF_NPROBE
+)
+from database.db_manager import DatabaseManager
+from utils.logging_config import setup_logging
+from utils.helpers import ensure_directory
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+_HASH_MULTIPLIER = np.uint64(1000003)
+_MIX_MULTIPLIER = np.uint64(0xBF58476D1CE4E5B9)
+
+
+def hash_ngrams(text, n_features=SIMILARITY_N_FEATURES, ngrams=SIMILARITY_NGRAMS, max_chars=SIMILARITY_MAX_CHARS):
+    """將文字的字元 n-gram 雜湊為特徵索引（以 NumPy 向量化計算，跨程序結果一致）"""
+    text = _WHITESPACE_PATTERN.sub(' ', text.lower())[:max_chars]
+    codepoints = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    parts = []
+    for n in ngrams:
+        count = len(codepoints) - n + 1
+        if count <= 0:
+            continue
+        hashes = np.full(count, n, dtype=np.uint64)
+        for offset in range(n):
+            hashes = (hashes * _HASH_MULTIPLIER) ^ codepoints[offset:offset + count]
+        hashes ^= hashes >> np.uint64(29)
+        hashes *= _MIX_MULTIPLIER
+        hashes ^= hashes >> np.uint64(32)
+        parts.append(hashes % np.uint64(n_features))
+    if not parts:
+        return np.empty(0, dtype=np.int64)
+    return np.concatenate(parts).astype(np.int64)
+
+
+def term_frequencies(text, n_features=SIMILARITY_N_FEATURES):
+    """計算文字的 (特徵索引, 次線性詞頻)"""
+    indices, counts = np.unique(hash_ngrams(text, n_features), return_counts=True)
+    return indices, (1 + np.log(counts)).astype(np.float32)
+
+
+def _post_text(title, content):
+    """組出建立索引用的文字"""
+    return f"{title or ''}\n{content or ''}"
+
+
+def randomized_svd(docs, n_features, dim, n_oversample=10, n_iter=2, seed=42):
+    """對以 (索引, 權重) 表示的稀疏文件矩陣做隨機化 SVD，回傳 (dim x n_features) 的投影矩陣"""
+    rng = np.random.default_rng(seed)
+    width = min(dim + n_oversample, len(docs))
+    omega = rng.standard_normal((n_features, width)).astype(np.float32)
+
+    def left_multiply(basis):
+        # 回傳 X @ basis，X 為文件矩陣
+        result = np.empty((len(docs), basis.shape[1]), dtype=np.float32)
+        for row, (indices, weights) in enumerate(docs):
+            result[row] = weights @ basis[indices]
+        return result
+
+    sample = left_multiply(omega)
+    for _ in range(n_iter):
+        q, _ = np.linalg.qr(sample)
+        transposed = np.zeros((n_features, width), dtype=np.float32)
+        for row, (indices, weights) in enumerate(docs):
+            transposed[indices] += np.outer(weights, q[row])
+        q_t, _ = np.linalg.qr(transposed)
+        sample = left_multiply(q_t)
+
+    q, _ = np.linalg.qr(sample)
+    small = np.zeros((width, n_features), dtype=np.float32)
+    for row, (indices, weights) in enumerate(docs):
+        small[:, indices] += np.outer(q[row], weights)
+    _, _, vt = np.linalg.svd(small, full_matrices=False)
+    return np.ascontiguousarray(vt[:dim], dtype=np.float32)
+
+
+def spherical_kmeans(vectors, n_clusters, n_iter=10, seed=42, chunk_size=20000):
+    """對已正規化的向量做球面 k-means，回傳 (群中心, 每個向量所屬的群)"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for _ in range(n_iter):
+        for start in range(0, len(vectors), chunk_size):
+            assignments[start:start + chunk_size] = np.argmax(vectors[start:start + chunk_size] @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        # 空的群保留原本的中心
+        centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids).astype(np.float32)
+    return centroids, assignments
+
+
+@contextmanager
+def _file_lock(path):
+    """以獨占檔案鎖保護區塊（POSIX 使用 fcntl，Windows 使用 msvcrt）"""
+    with open(path, 'a+b') as lock_file:
+        try:
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+        except ImportError:
+            import msvcrt
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class SimilarityIndex:
+    """相似文章向量索引"""
+
+    def __init__(self, index_dir=None):
+        """初始化索引，若索引檔案已存在則載入"""
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.index_dir = index_dir or os.path.join(project_root, SIMILARITY_INDEX_DIR)
+        self.meta = None
+        self.idf = None
+        self.components = None
+        self.centroids = None
+        self.list_offsets = None
+        self._vectors = None
+        self._ids = None
+        self._mapped_count = -1
+        if self.exists():
+            self.load()
+
+    def _path(self, name, index_dir=None):
+        """索引目錄中的檔案路徑"""
+        return os.path.join(index_dir or self.index_dir, name)
+
+    def _lock(self):
+        """索引的寫入鎖；鎖檔放在索引目錄旁，重新建立索引替換目錄時仍然有效"""
+        ensure_directory(os.path.dirname(os.path.abspath(self.index_dir)))
+        return _file_lock(self.index_dir + ".lock")
+
+    def exists(self):
+        """索引是否已建立"""
+        return os.path.exists(self._path("meta.json"))
+
+    def load(self):
+        """載入模型參數與索引資訊，向量檔案以 memory map 延遲讀取"""
+        with open(self._path("meta.json"), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        model = np.load(self._path("model.npz"))
+        self.idf = model["idf"]
+        self.components = model["components"]
+        if self.meta.get("ivf_indexed", 0) and os.path.exists(self._path("ivf.npz")):
+            ivf = np.load(self._path("ivf.npz"))
+            self.centroids = ivf["centroids"]
+            self.list_offsets = ivf["list_offsets"]
+        self._mapped_count = -1
+
+    def _reload_meta(self):
+        """重新讀取磁碟上的 meta.json（須持有寫入鎖）；索引已被重新建立時一併重新載入模型，回傳索引是否存在"""
+        if not self.exists():
+            self.meta = None
+            return False
+        with open(self._path("meta.json"), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if self.meta is None or meta.get("built_at") != self.meta.get("built_at"):
+            self.load()
+        else:
+            self.meta = meta
+        return True
+
+    def _save_meta(self, meta, index_dir=None):
+        """以原子方式寫入 meta.json"""
+        path = self._path("meta.json", index_dir)
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=4)
+        os.replace(path + ".tmp", path)
+
+    def _mapped(self):
+        """取得目前筆數的向量與 ID memory map"""
+        count = self.meta["count"]
+        if count != self._mapped_count:
+            if count:
+                self._vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode='r', shape=(count, self.meta["dim"]))
+                self._ids = np.memmap(self._path("ids.i64"), dtype=np.int64, mode='r', shape=(count,))
+            else:
+                self._vectors = np.empty((0, self.meta["dim"]), dtype=np.float32)
+                self._ids = np.empty(0, dtype=np.int64)
+            self._mapped_count = count
+        return self._vectors, self._ids
+
+    def embed(self, text, idf=None, components=None):
+        """將文字轉為正規化後的低維向量"""
+        idf = self.idf if idf is None else idf
+        components = self.components if components is None else components
+        indices, tf = term_frequencies(text, len(idf))
+        if not len(indices):
+            return np.zeros(components.shape[0], dtype=np.float32)
+        weights = tf * idf[indices]
+        vector = components[:, indices] @ (weights / np.linalg.norm(weights))
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm > 0 else vector).astype(np.float32)
+
+    def build(self, db=None, batch_size=2000):
+        """從資料庫重新建立索引，回傳索引的文章數"""
+        db = db or DatabaseManager()
+        if not db.conn:
+            db.connect()
+        n_features = SIMILARITY_N_FEATURES
+        rng = np.random.default_rng(42)
+
+        # 第一輪：計算文件頻率，並以 reservoir sampling 抽樣擬合 SVD 用的文章
+        document_frequency = np.zeros(n_features, dtype=np.int64)
+        sample = []
+        total = 0
+        for rows in db.iter_posts(batch_size=batch_size):
+            for _, title, content in rows:
+                indices, tf = term_frequencies(_post_text(title, content), n_features)
+                document_frequency[indices] += 1
+                total += 1
+                if len(sample) < SIMILARITY_FIT_SAMPLE:
+                    sample.append((indices, tf))
+                else:
+                    slot = rng.integers(total)
+                    if slot < SIMILARITY_FIT_SAMPLE:
+                        sample[slot] = (indices, tf)
+        if total == 0:
+            logger.warning("資料庫中沒有文章，無法建立相似文章索引")
+            return 0
+
+        idf = (np.log((1 + total) / (1 + document_frequency)) + 1).astype(np.float32)
+        weighted = []
+        for indices, tf in sample:
+            weights = tf * idf[indices]
+            weighted.append((indices, weights / max(np.linalg.norm(weights), 1e-12)))
+        components = randomized_svd(weighted, n_features, min(SIMILARITY_DIM, len(weighted)))
+        dim = components.shape[0]
+        logger.info(f"已擬合 SVD 投影: {total} 篇文章、抽樣 {len(sample)} 篇、維度 {dim}")
+
+        # 第二輪：串流計算所有文章的向量並寫入暫存目錄
+        build_dir = self.index_dir + ".building"
+        shutil.rmtree(build_dir, ignore_errors=True)
+        ensure_directory(build_dir)
+        np.savez(self._path("model.npz", build_dir), idf=idf, components=components)
+        with open(self._path("vectors.f32", build_dir), 'wb') as vector_file, \
+                open(self._path("ids.i64", build_dir), 'wb') as id_file:
+            for rows in db.iter_posts(batch_size=batch_size):
+                vectors = np.stack([self.embed(_post_text(title, content), idf, components) for _, title, content in rows])
+                vector_file.write(vectors.astype(np.float32).tobytes())
+                id_file.write(np.array([row[0] for row in rows], dtype=np.int64).tobytes())
+
+        meta = {
+            "count": total,
+            "dim": dim,
+            "n_features": n_features,
+            "ivf_indexed": 0,
+            "superseded": 0,
+            "built_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        if total >= SIMILARITY_IVF_MIN_POSTS:
+            meta["ivf_indexed"] = self._build_ivf(build_dir, total, dim)
+        self._save_meta(meta, build_dir)
+
+        # 以新索引取代舊索引
+        with self._lock():
+            shutil.rmtree(self.index_dir, ignore_errors=True)
+            os.replace(build_dir, self.index_dir)
+            self.load()
+        logger.info(f"已建立相似文章索引，共 {total} 篇文章")
+        return total
+
+    def _build_ivf(self, build_dir, count, dim):
+        """建立 IVF 分群：將向量依所屬群重新排序並記錄每群的起訖位置，回傳納入分群的筆數"""
+        vectors = np.fromfile(self._path("vectors.f32", build_dir), dtype=np.float32).reshape(count, dim)
+        ids = np.fromfile(self._path("ids.i64", build_dir), dtype=np.int64)
+        n_clusters = int(np.sqrt(count))
+        centroids, assignments = spherical_kmeans(vectors, n_clusters)
+        order = np.argsort(assignments, kind='stable')
+        vectors[order].tofile(self._path("vectors.f32", build_dir))
+        ids[order].tofile(self._path("ids.i64", build_dir))
+        list_offsets = np.searchsorted(assignments[order], np.arange(n_clusters + 1))
+        np.savez(self._path("ivf.npz", build_dir), centroids=centroids, list_offsets=list_offsets)
+        logger.info(f"已建立 IVF 分群索引: {n_clusters} 群")
+        return count
+
+    def _append(self, post_id, vector):
+        """在目前筆數的位置寫入一筆向量與 ID（須持有寫入鎖），並截掉先前中斷的寫入留下的多餘位元組"""
+        count = self.meta["count"]
+        for name, data in (("vectors.f32", vector.astype(np.float32)), ("ids.i64", np.array([post_id], dtype=np.int64))):
+            with open(self._path(name), 'r+b') as f:
+                f.seek(count * data.nbytes)
+                f.write(data.tobytes())
+                f.truncate()
+        self.meta["count"] = count + 1
+
+    def _overwrite(self, row, post_id, vector):
+        """覆寫指定位置的向量與 ID（須持有寫入鎖）"""
+        for name, data in (("vectors.f32", vector.astype(np.float32)), ("ids.i64", np.array([post_id], dtype=np.int64))):
+            with open(self._path(name), 'r+b') as f:
+                f.seek(row * data.nbytes)
+                f.write(data.tobytes())
+
+    def add_post(self, post_id, title, content):
+        """將新文章加入索引（附加在檔案尾端，搜尋時以暴力方式比對）"""
+        with self._lock():
+            if not self._reload_meta():
+                return False
+            self._append(post_id, self.embed(_post_text(title, content)))
+            self._save_meta(self.meta)
+        logger.info(f"已將文章ID {post_id} 加入相似文章索引")
+        return True
+
+    def update_post(self, post_id, title, content):
+        """文章內容更新後重新計算向量
+
+        尾端（未納入 IVF 分群）的向量直接覆寫；已納入分群的舊向量標記為已取代（ID 設為 -1、向量歸零），
+        新向量附加在尾端，待下次 build 時再整理。回傳向量是否有變動
+        """
+        with self._lock():
+            if not self._reload_meta():
+                return False
+            vector = self.embed(_post_text(title, content))
+            vectors, ids = self._mapped()
+            rows = np.flatnonzero(np.asarray(ids) == post_id)
+            if len(rows) == 1 and np.allclose(vectors[rows[0]], vector, atol=1e-6):
+                return False
+
+            tail_rows = rows[rows >= self.meta.get("ivf_indexed", 0)]
+            target = tail_rows[0] if len(tail_rows) else None
+            for row in rows:
+                if row != target:
+                    self._overwrite(row, -1, np.zeros_like(vector))
+                    self.meta["superseded"] = self.meta.get("superseded", 0) + 1
+            if target is not None:
+                self._overwrite(target, post_id, vector)
+            else:
+                self._append(post_id, vector)
+            self._save_meta(self.meta)
+        logger.info(f"已更新文章ID {post_id} 在相似文章索引中的向量")
+        return True
+
+    def sync(self, db=None):
+        """重新計算索引建立（或上次同步）後被重新抓取過的文章向量，回傳有變動的文章數"""
+        db = db or DatabaseManager()
+        with self._lock():
+            if not self._reload_meta():
+                return 0
+            since = self.meta.get("synced_at") or self.meta["built_at"]
+        synced_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        updated = 0
+        for post_id in db.get_post_ids_refreshed_since(since):
+            post = db.get_post_text(post_id)
+            if post and self.update_post(post_id, *post):
+                updated += 1
+
+        with self._lock():
+            if self._reload_meta():
+                self.meta["synced_at"] = synced_at
+                self._save_meta(self.meta)
+        logger.info(f"已同步相似文章索引，{updated} 篇文章的向量有變動")
+        return updated
+
+    def search(self, vector, top_k=10, exclude_ids=None):
+        """搜尋與向量最相似的文章，回傳 [(文章ID, 相似度)]"""
+        vectors, ids = self._mapped()
+        if not len(ids):
+            return []
+
+        ivf_indexed = self.meta.get("ivf_indexed", 0) if self.centroids is not None else 0
+        if ivf_indexed:
+            # 只比對最接近的 nprobe 個群，以及建立索引後新增的尾端向量
+            nprobe = min(SIMILARITY_IVF_NPROBE, len(self.centroids))
+            probes = np.argpartition(-(self.centroids @ vector), nprobe - 1)[:nprobe]
+            candidates = np.concatenate(
+                [np.arange(self.list_offsets[c], self.list_offsets[c + 1]) for c in probes]
+                + [np.arange(ivf_indexed, len(ids))]
+            )
+            scores = vectors[candidates] @ vector
+            candidate_ids = ids[candidates]
+        else:
+            scores = vectors @ vector
+            candidate_ids = np.asarray(ids)
+
+        # 已被取代的舊向量 ID 為 -1，不列入結果
+        excluded = candidate_ids < 0
+        if exclude_ids:
+            excluded |= np.isin(candidate_ids, list(exclude_ids))
+        scores = np.where(excluded, -np.inf, scores)
+        top_k = min(top_k, len(scores))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(candidate_ids[i]), float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+    def query(self, text, top_k=10, exclude_ids=None):
+        """以文字搜尋相似文章"""
+        return self.search(self.embed(text), top_k, exclude_ids)
+
+    def query_post(self, post_id, top_k=10, db=None):
+        """搜尋與指定文章相似的其他文章"""
+        db = db or DatabaseManager()
+        post = db.get_post_text(post_id)
+        if not post:
+            logger.warning(f"找不到文章ID {post_id}")
+            return []
+        return self.query(_post_text(*post), top_k, exclude_ids={post_id})
+
+
+def main():
+    """主函數"""
+    setup_logging('analysis')
+    parser = argparse.ArgumentParser(description='相似文章索引')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('build', help='從資料庫重新建立索引')
+    subparsers.add_parser('sync', help='重新計算建立索引後被重新抓取過的文章向量')
+    query_parser = subparsers.add_parser('query', help='搜尋相似文章')
+    query_parser.add_argument('text', nargs='?', help='查詢文字')
+    query_parser.add_argument('--post-id', type=int, help='以資料庫中的文章作為查詢')
+    query_parser.add_argument('--top', type=int, default=10, help='回傳的文章數')
+    args = parser.parse_args()
+
+    db = DatabaseManager()
+    db.connect()
+    index = SimilarityIndex()
+
+    if args.command == 'build':
+        count = index.build(db)
+        print(f"已建立索引，共 {count} 篇文章")
+        db.close()
+        return count > 0
+
+    if not index.exists():
+        print("尚未建立索引，請先執行: python analysis/similarity.py build")
+        db.close()
+        return False
+
+    if args.command == 'sync':
+        updated = index.sync(db)
+        print(f"已同步索引，{updated} 篇文章的向量有變動")
+        db.close()
+        return True
+
+    if args.post_id:
+        results = index.query_post(args.post_id, args.top, db)
+    elif args.text:
+        results = index.query(args.text, args.top)
+    else:
+        query_parser.error("請提供查詢文字或 --post-id")
+
+    for post_id, score in results:
+        post = db.get_post_text(post_id)
+        print(f"{score:.3f}  [{post_id}] {post[0] if post else ''}")
+    db.close()
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,376 @@
+"""
+房貸趨勢分析模組
+- 以一次 SQL 查詢將已分析文章的結構化欄位載入為 pandas 欄位（json_extract 於 SQLite 內完成）
+- 以向量化運算計算每週利率中位數、貸款成數分布與銀行提及次數
+- 結果寫入每週彙總表 trend_weekly；以文章的 change_seq 水位找出上次彙總後有變動的文章
+  （新分析、重新分析或被重新排入分析），只重新計算這些文章所屬的週別
+- 每週另存利率的分布（四捨五入至小數點後三位的利率與篇數），報表中的滾動利率中位數
+  直接由彙總表中連續週別的利率分布合併計算，取視窗內所有文章的利率求中位數
+用法: python analysis/trends.py [--full] [--weeks 12]
+"""
+import os
+import sys
+import logging
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# 將專案根目錄加入系統路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import TABLE_NAME, TREND_ROLLING_WEEKS, LTV_BINS
+from database.db_manager import DatabaseManager
+from utils.logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_TABLE_NAME = "trend_weekly"
+STATE_TABLE_NAME = "trend_state"
+# 舊版記錄每週指紋的資料表，已改用 change_seq 水位
+LEGACY_WEEK_STATE_TABLE_NAME = "trend_week_state"
+# 相關度分數達此門檻的文章視為房貸相關文章
+MORTGAGE_RELEVANCE_THRESHOLD = 50
+
+# 中文數字轉阿拉伯數字（用於「八成」等寫法）
+_CHINESE_DIGITS = {"一": "1", "二": "2", "兩": "2", "三": "3", "四": "4", "五": "5", "六": "6", "七": "7", "八": "8", "九": "9"}
+
+
+def parse_rate(series):
+    """將「1.31%」、「2.1」等利率字串轉為百分比數值，無法解析或不合理者為 NaN"""
+    rate = series.str.extract(r'(\d+(?:\.\d+)?)', expand=False).astype(float)
+    return rate.where((rate > 0) & (rate < 20))
+
+
+def parse_loan_amount(series):
+    """將「500萬」、「1.2億」、「5,000,000」等金額字串轉為以「萬」為單位的數值"""
+    extracted = series.str.replace(',', '', regex=False).str.extract(r'(\d+(?:\.\d+)?)\s*(億|萬)?')
+    value = extracted[0].astype(float)
+    multiplier = extracted[1].map({"億": 10000.0, "萬": 1.0}).fillna(1 / 10000)
+    amount = value * multiplier
+    return amount.where(amount > 0)
+
+
+def parse_loan_to_value(series):
+    """將「8成」、「八成」、「80%」等貸款成數字串轉為 0-1 的比例"""
+    normalized = series.replace(_CHINESE_DIGITS, regex=True)
+    tenths = normalized.str.extract(r'(\d+(?:\.\d+)?)\s*成', expand=False).astype(float) / 10
+    percent = normalized.str.extract(r'(\d+(?:\.\d+)?)\s*%', expand=False).astype(float) / 100
+    ratio = tenths.fillna(percent)
+    return ratio.where((ratio > 0) & (ratio <= 1))
+
+
+def to_week(post_dates):
+    """將文章日期轉為所屬週的週一日期字串 (YYYY-MM-DD)"""
+    dates = pd.to_datetime(post_dates, format='%Y-%m-%d %H:%M:%S', errors='coerce')
+    return (dates - pd.to_timedelta(dates.dt.weekday, unit='D')).dt.strftime('%Y-%m-%d')
+
+
+def week_range(start, end):
+    """start 到 end（皆為週一日期字串）之間連續的週一日期字串列表"""
+    return [week.strftime('%Y-%m-%d') for week in pd.date_range(start, end, freq='W-MON')]
+
+
+def shift_weeks(week, count):
+    """將週一日期字串往後（count 為負時往前）移動 count 週"""
+    return (pd.Timestamp(week) + pd.Timedelta(weeks=count)).strftime('%Y-%m-%d')
+
+
+class TrendAnalyzer:
+    """計算並維護房貸趨勢的每週彙總"""
+
+    def __init__(self, db=None):
+        """初始化趨勢分析器"""
+        self.db = db or DatabaseManager()
+        if not self.db.conn:
+            self.db.connect()
+        self.db.initialize_db()
+        self.initialize_tables()
+
+    def initialize_tables(self):
+        """建立彙總表"""
+        with self.db.conn:
+            self.db.conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE_NAME} (
+                week TEXT,
+                metric TEXT,
+                key TEXT,
+                value REAL,
+                PRIMARY KEY (week, metric, key)
+            )
+            ''')
+            self.db.conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {STATE_TABLE_NAME} (
+                name TEXT PRIMARY KEY,
+                value TEXT
+            )
+            ''')
+            self.db.conn.execute(f"DROP TABLE IF EXISTS {LEGACY_WEEK_STATE_TABLE_NAME}")
+
+    def load_frame(self, weeks=None):
+        """一次載入已分析文章的欄位為 DataFrame，weeks 可限定只載入特定週別"""
+        query = f"""
+            SELECT id, post_date, relevance_score,
+                   json_extract(structured_data, '$."房貸利率"') AS rate_text,
+                   json_extract(structured_data, '$."房貸金額"') AS amount_text,
+                   json_extract(structured_data, '$."貸款成數"') AS ltv_text
+            FROM {TABLE_NAME}
+            WHERE analyzed_at IS NOT NULL
+            AND json_valid(structured_data)
+            AND post_date IS NOT NULL AND post_date != ''
+        """
+        params = []
+        if weeks:
+            # 以週一日期範圍篩選，避免在 SQL 中計算週別
+            start = min(weeks)
+            end = (pd.Timestamp(max(weeks)) + pd.Timedelta(days=7)).strftime('%Y-%m-%d')
+            query += " AND post_date >= ? AND post_date < ?"
+            params.extend([start, end])
+
+        frame = pd.read_sql_query(query, self.db.conn, params=params)
+        frame["week"] = to_week(frame["post_date"])
+        frame["rate"] = parse_rate(frame["rate_text"].astype("string"))
+        frame["loan_amount"] = parse_loan_amount(frame["amount_text"].astype("string"))
+        frame["ltv"] = parse_loan_to_value(frame["ltv_text"].astype("string"))
+        frame = frame.dropna(subset=["week"])
+        if weeks:
+            frame = frame[frame["week"].isin(weeks)]
+        return frame
+
+    def load_bank_mentions(self, weeks=None):
+        """載入 (文章ID, 文章日期, 銀行) 的展開資料"""
+        query = f"""
+            SELECT p.id, p.post_date, TRIM(b.value) AS bank
+            FROM {TABLE_NAME} p, json_each(p.structured_data, '$."提到的銀行"') b
+            WHERE p.analyzed_at IS NOT NULL
+            AND json_valid(p.structured_data)
+            AND p.post_date IS NOT NULL AND p.post_date != ''
+        """
+        params = []
+        if weeks:
+            start = min(weeks)
+            end = (pd.Timestamp(max(weeks)) + pd.Timedelta(days=7)).strftime('%Y-%m-%d')
+            query += " AND p.post_date >= ? AND p.post_date < ?"
+            params.extend([start, end])
+
+        mentions = pd.read_sql_query(query, self.db.conn, params=params)
+        mentions["week"] = to_week(mentions["post_date"])
+        mentions = mentions.dropna(subset=["week"])
+        mentions = mentions[mentions["bank"] != ""]
+        if weeks:
+            mentions = mentions[mentions["week"].isin(weeks)]
+        return mentions
+
+    def compute_rollup(self, frame, mentions):
+        """以向量化運算計算每週彙總，回傳 (week, metric, key, value) 的 DataFrame"""
+        frame = frame.assign(is_mortgage=(frame["relevance_score"] >= MORTGAGE_RELEVANCE_THRESHOLD).astype(np.int64))
+        by_week = frame.groupby("week")
+        stats = pd.DataFrame({
+            "post_count": by_week.size(),
+            "mortgage_post_count": by_week["is_mortgage"].sum(),
+            "rate_median": by_week["rate"].median(),
+            "rate_count": by_week["rate"].count(),
+            "loan_amount_median": by_week["loan_amount"].median(),
+            "ltv_median": by_week["ltv"].median(),
+        })
+        parts = [
+            stats.reset_index().melt(id_vars="week", var_name="metric", value_name="value").assign(key="")
+        ]
+
+        rates = frame.dropna(subset=["rate"])
+        if not rates.empty:
+            histogram = rates.groupby(["week", rates["rate"].round(3).map('{:.3f}'.format)]).size().reset_index(name="value")
+            histogram.columns = ["week", "key", "value"]
+            parts.append(histogram.assign(metric="rate_hist"))
+
+        ltv = frame.dropna(subset=["ltv"])
+        if not ltv.empty:
+            bins = pd.cut(ltv["ltv"], bins=LTV_BINS, include_lowest=True)
+            distribution = ltv.groupby(["week", bins.astype(str)]).size().reset_index(name="value")
+            distribution.columns = ["week", "key", "value"]
+            parts.append(distribution.assign(metric="ltv_bin"))
+
+        if not mentions.empty:
+            # 同一篇文章重複提到同一家銀行只計一次
+            banks = mentions.drop_duplicates(["id", "bank"]).groupby(["week", "bank"]).size().reset_index(name="value")
+            banks.columns = ["week", "key", "value"]
+            parts.append(banks.assign(metric="bank_mentions"))
+
+        rollup = pd.concat(parts, ignore_index=True)[["week", "metric", "key", "value"]]
+        return rollup.dropna(subset=["value"])
+
+    def get_state(self, name):
+        """讀取彙總狀態"""
+        row = self.db.conn.execute(f"SELECT value FROM {STATE_TABLE_NAME} WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, name, value):
+        """寫入彙總狀態（須在交易中呼叫）"""
+        self.db.conn.execute(
+            f"INSERT OR REPLACE INTO {STATE_TABLE_NAME} (name, value) VALUES (?, ?)", (name, str(value))
+        )
+
+    def get_dirty_weeks(self, since, until):
+        """change_seq 介於 (since, until] 的文章所屬的週別（以 change_seq 索引查詢，不掃描全表）"""
+        rows = self.db.conn.execute(f"""
+            SELECT DISTINCT date(post_date, '-6 days', 'weekday 1')
+            FROM {TABLE_NAME}
+            WHERE change_seq > ? AND change_seq <= ?
+            AND post_date IS NOT NULL AND post_date != ''
+        """, (since, until)).fetchall()
+        return sorted(row[0] for row in rows if row[0])
+
+    def refresh(self, full=False):
+        """更新每週彙總表，只重新計算上次彙總後有文章變動的週別，回傳更新的週數
+
+        change_seq 依提交順序遞增，重新分析與被重新排入分析（analyzed_at 清為 NULL）都會推進序號，
+        因此只需查詢水位之後的文章即可找出需要重算的週別
+        """
+        watermark = None if full else self.get_state("change_seq")
+        # 先取得目前的最大序號，計算期間才提交的變動留待下次更新
+        latest = self.db.conn.execute(f"SELECT IFNULL(MAX(change_seq), 0) FROM {TABLE_NAME}").fetchone()[0]
+        if watermark is None:
+            full = True
+            weeks = None
+        else:
+            weeks = self.get_dirty_weeks(int(watermark), latest)
+            if not weeks:
+                logger.info("趨勢彙總已是最新狀態")
+                return 0
+
+        frame = self.load_frame(weeks=weeks)
+        mentions = self.load_bank_mentions(weeks=weeks)
+        rollup = self.compute_rollup(frame, mentions) if not frame.empty else None
+
+        with self.db.conn:
+            if full:
+                self.db.conn.execute(f"DELETE FROM {ROLLUP_TABLE_NAME}")
+            else:
+                # 所有文章都被重新排入分析的週別沒有新的彙總，刪除後即移除
+                self.db.conn.executemany(f"DELETE FROM {ROLLUP_TABLE_NAME} WHERE week = ?", [(week,) for week in weeks])
+            if rollup is not None:
+                self.db.conn.executemany(
+                    f"INSERT INTO {ROLLUP_TABLE_NAME} (week, metric, key, value) VALUES (?, ?, ?, ?)",
+                    rollup.itertuples(index=False, name=None)
+                )
+            self.set_state("change_seq", latest)
+        updated = frame["week"].nunique() if full else len(weeks)
+        logger.info(f"已更新 {updated} 週的趨勢彙總")
+        return updated
+
+    def load_rollup(self, metric, weeks=None):
+        """從彙總表讀取指定指標，回傳以週為索引、key 為欄位的 DataFrame"""
+        query = f"SELECT week, key, value FROM {ROLLUP_TABLE_NAME} WHERE metric = ?"
+        params = [metric]
+        start_week = self.get_start_week(weeks)
+        if start_week:
+            query += " AND week >= ?"
+            params.append(start_week)
+        rows = pd.read_sql_query(query, self.db.conn, params=params)
+        if rows.empty:
+            return pd.DataFrame()
+        return rows.pivot(index="week", columns="key", values="value").fillna(0).sort_index()
+
+    def get_start_week(self, weeks):
+        """取得最近 N 個有資料週別中最早的一週"""
+        if not weeks:
+            return None
+        rows = self.db.conn.execute(
+            f"SELECT DISTINCT week FROM {ROLLUP_TABLE_NAME} ORDER BY week DESC LIMIT ?",
+            (weeks,)
+        ).fetchall()
+        return rows[-1][0] if rows else None
+
+    def weekly_report(self, weeks=12):
+        """產生每週趨勢報表（利率中位數與其滾動中位數、貸款金額、成數與文章數）
+
+        沒有文章的週別也會列出（文章數為 0），滾動中位數為最近 TREND_ROLLING_WEEKS 個日曆週內
+        所有文章利率的中位數，而非每週中位數的中位數
+        """
+        metrics = ["post_count", "mortgage_post_count", "rate_median", "rate_count", "loan_amount_median", "ltv_median"]
+        rows = pd.read_sql_query(
+            f"SELECT week, metric, value FROM {ROLLUP_TABLE_NAME} WHERE key = '' AND metric IN ({', '.join('?' for _ in metrics)})",
+            self.db.conn,
+            params=metrics
+        )
+        if rows.empty:
+            return pd.DataFrame()
+        report = rows.pivot(index="week", columns="metric", values="value").reindex(columns=metrics)
+        report = report.reindex(week_range(report.index.min(), report.index.max())).tail(weeks)
+        counts = ["post_count", "mortgage_post_count", "rate_count"]
+        report[counts] = report[counts].fillna(0)
+        report["rate_rolling_median"] = self.rolling_rate_median(list(report.index))
+        return report
+
+    def rolling_rate_median(self, weeks):
+        """由彙總表的每週利率分布計算各週（含）往前 TREND_ROLLING_WEEKS 個日曆週內所有文章利率的中位數，
+        回傳以週為索引的 Series
+        """
+        histogram = pd.read_sql_query(
+            f"SELECT week, key, value FROM {ROLLUP_TABLE_NAME} WHERE metric = 'rate_hist' AND week >= ? AND week <= ?",
+            self.db.conn,
+            params=[shift_weeks(weeks[0], -(TREND_ROLLING_WEEKS - 1)), weeks[-1]]
+        )
+        if histogram.empty:
+            return pd.Series(np.nan, index=weeks)
+        # 每個利率分布展開到它所屬的各個視窗（本週與之後 N-1 週），再依視窗週別合併
+        week_dates = pd.to_datetime(histogram["week"])
+        expanded = pd.concat(
+            [
+                pd.DataFrame({
+                    "week": (week_dates + pd.Timedelta(weeks=offset)).dt.strftime('%Y-%m-%d'),
+                    "rate": histogram["key"].astype(float).to_numpy(),
+                    "count": histogram["value"].to_numpy(),
+                })
+                for offset in range(TREND_ROLLING_WEEKS)
+            ],
+            ignore_index=True
+        )
+        expanded = expanded.groupby(["week", "rate"], as_index=False)["count"].sum().sort_values(["week", "rate"])
+        # 加權中位數：累計篇數第一次到達中間位置的利率，篇數為偶數時取中間兩個位置的平均
+        cumulative = expanded.groupby("week")["count"].cumsum()
+        total = expanded.groupby("week")["count"].transform("sum")
+        lower = expanded[cumulative >= (total + 1) // 2].groupby("week")["rate"].first()
+        upper = expanded[cumulative >= total // 2 + 1].groupby("week")["rate"].first()
+        return ((lower + upper) / 2).reindex(weeks)
+
+    def bank_report(self, weeks=12, top=10):
+        """近 N 週提及次數最多的銀行，每週一列"""
+        mentions = self.load_rollup("bank_mentions", weeks)
+        if mentions.empty:
+            return mentions
+        top_banks = mentions.sum().sort_values(ascending=False).head(top).index
+        return mentions[top_banks].astype(np.int64)
+
+    def ltv_report(self, weeks=12):
+        """近 N 週的貸款成數分布（各區間文章數）"""
+        distribution = self.load_rollup("ltv_bin", weeks)
+        if distribution.empty:
+            return distribution
+        return distribution.astype(np.int64)
+
+
+def main():
+    """主函數"""
+    setup_logging('analysis')
+    parser = argparse.ArgumentParser(description='房貸趨勢報表')
+    parser.add_argument('--full', action='store_true', help='重新計算所有週別的彙總')
+    parser.add_argument('--weeks', type=int, default=12, help='報表顯示的週數')
+    args = parser.parse_args()
+
+    analyzer = TrendAnalyzer()
+    analyzer.refresh(full=args.full)
+
+    pd.set_option('display.width', 200)
+    print("==== 每週利率與貸款概況 ====")
+    print(analyzer.weekly_report(args.weeks))
+    print("\n==== 銀行提及次數 ====")
+    print(analyzer.bank_report(args.weeks))
+    print("\n==== 貸款成數分布 ====")
+    print(analyzer.ltv_report(args.weeks))
+    analyzer.db.close()
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
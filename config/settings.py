@@ -20,11 +20,118 @@ TABLE_NAME = "house_posts"
 # 爬蟲設定
 POSTS_LIMIT = 100  # 每次請求的文章數量
 TOTAL_POSTS = 1000  # 總共要爬取的文章數量，可以調整
+MAX_LIST_PAGES = 30  # 每次爬蟲最多翻閱的文章列表頁數，避免大部分文章已存在時一路翻到很久以前的文章
 DELAY_BETWEEN_REQUESTS = 3  # 每次請求之間的延遲（秒）
+REQUEST_TIMEOUT = 30  # 單一 HTTP 請求的逾時（秒）
+# 所有請求（文章列表、文章內容、留言）共用的速率額度，預設與 DELAY_BETWEEN_REQUESTS 相同
+REQUESTS_PER_SECOND = 1 / DELAY_BETWEEN_REQUESTS
+REQUEST_BURST = 1  # 速率額度可累積的最大請求數
+CRAWLER_SESSION_TTL = 6 * 60 * 60  # Cloudflare cookies 的重用時間（秒），逾時或收到 403 時重新取得
+
+# 留言爬取設定
+COMMENTS_LIMIT = 50  # 每頁留言數
+COMMENT_WORKERS = 4  # 同時抓取留言頁面的執行緒數（仍受共用速率額度限制）
+COMMENTS_FOR_ANALYSIS = 100  # 每篇文章送入 GPT 分析的留言數上限（依樓層順序）
+
+# 文章抓取優先順序設定（crawler/priority.py）
+# 抓取文章內容前先以文章列表上的欄位評分，分數高的先抓取
+PRIORITY_KEYWORDS = {
+    "房貸": 30, "貸款": 25, "利率": 20, "寬限期": 20, "轉貸": 20, "青安": 20,
+    "成數": 15, "月付": 15, "增貸": 15, "還款": 10, "銀行": 10, "鑑價": 10, "對保": 10,
+}
+PRIORITY_FIELD_WEIGHTS = {"title": 2.0, "topics": 1.5, "excerpt": 1.0}  # 關鍵字出現在各欄位時的權重倍數
+PRIORITY_ENGAGEMENT_WEIGHT = 3  # 互動分數權重，互動分數 = log(1 + 留言數) + 0.5 * log(1 + 按讚數)
+PRIORITY_MIN_SCORE = 25  # 低於此分數的文章不在一般爬蟲中抓取，改放入延後佇列
+CRAWL_REQUEST_BUDGET = None  # 每次爬蟲最多發送的請求數（None 表示不限制），用完時其餘文章放入延後佇列
+
+# 延後佇列（main.py --drain-deferred）設定
+DEFERRED_DRAIN_LIMIT = 200  # 每次排空延後佇列最多抓取的文章數
+DEFERRED_MAX_ATTEMPTS = 3  # 抓取失敗達此次數的文章不再重試
+DEFERRED_MAX_AGE_DAYS = 30  # 延後超過此天數的文章直接捨棄
+OFF_PEAK_HOURS = (2, 7)  # 離峰時段 [開始, 結束) 小時，常駐模式在此時段的爬蟲週期會接著排空延後佇列
+
+# 更新模式（main.py --refresh）設定
+REFRESH_REANALYZE_ON_COMMENTS = True  # 文章有新留言時是否也重新分析
 
 # 代理伺服器設定
 USE_PROXY = True  # 是否使用代理
 PROXY_LIST = [
     "http://auohqwsg.corpnet.auo.com:8080"
 ]
-ROTATE_PROXY = True  # 是否輪換使用不同代理
\ No newline at end of file
+ROTATE_PROXY = True  # 是否輪換使用不同代理
+
+# GPT 批次分析設定 (OpenAI / Azure OpenAI Batch API)
+BATCH_DIR = "batches"  # 批次輸入/輸出 JSONL 檔案存放目錄（相對於專案根目錄）
+BATCH_MAX_REQUESTS = 50000  # 單一批次最多請求數（Batch API 上限）
+BATCH_COMPLETION_WINDOW = "24h"  # 批次完成時限
+BATCH_POLL_INTERVAL = 60  # 輪詢批次狀態的間隔（秒）
+
+# GPT 模型價格（美元 / 每百萬 tokens），用於成本報表
+# input: 一般輸入, cached_input: 命中 prompt cache 的輸入, output: 輸出
+MODEL_PRICING = {
+    "gpt-3.5-turbo": {"input": 0.50, "cached_input": 0.50, "output": 1.50},
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "gpt-4.1-mini": {"input": 0.40, "cached_input": 0.10, "output": 1.60},
+}
+BATCH_PRICE_DISCOUNT = 0.5  # Batch API 價格折扣（相對於同步呼叫）
+PROMPT_CACHE_MIN_TOKENS = 1024  # OpenAI prompt caching 生效所需的最短相同前綴 token 數
+
+# GPT 回應格式與重試設定
+JSON_SCHEMA_MODEL_PREFIXES = ("gpt-4o", "gpt-4.1", "o1", "o3", "o4")  # 支援 Structured Outputs (JSON Schema) 的模型前綴
+MAX_ANALYSIS_ATTEMPTS = 3  # 每篇文章最多嘗試分析次數，超過後不再自動重試
+
+# 長文切段設定
+MAX_INPUT_TOKENS = 3000  # 單一請求的文章內容 token 上限，超過時依段落切段分別分析後合併
+CHUNK_WORKERS = 4  # 同一篇文章各段落同時分析的最大請求數
+
+# Parquet 匯出設定
+EXPORT_DIR = "exports"  # 匯出目錄（相對於專案根目錄），依 post_date 月份分區
+EXPORT_BATCH_SIZE = 5000  # 每個 Arrow record batch 的筆數，決定匯出時的記憶體上限
+
+# 趨勢分析設定
+TREND_ROLLING_WEEKS = 4  # 利率滾動中位數的週數
+LTV_BINS = [0, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]  # 貸款成數分布的區間邊界
+
+# 相似文章索引設定
+SIMILARITY_INDEX_DIR = "index/similarity"  # 索引檔案目錄（相對於專案根目錄）
+SIMILARITY_AUTO_UPDATE = True  # 索引存在時，爬蟲新增或更新文章後自動寫入索引
+SIMILARITY_N_FEATURES = 2 ** 16  # 字元 n-gram 雜湊後的特徵維度
+SIMILARITY_NGRAMS = (2, 3)  # 使用的字元 n-gram 長度
+SIMILARITY_MAX_CHARS = 3000  # 每篇文章最多取用的字元數
+SIMILARITY_DIM = 128  # SVD 降維後的向量維度
+SIMILARITY_FIT_SAMPLE = 10000  # 擬合 SVD 時抽樣的文章數
+SIMILARITY_IVF_MIN_POSTS = 50000  # 文章數達此數量時建立 IVF 分群索引，否則使用暴力搜尋
+SIMILARITY_IVF_NPROBE = 8  # IVF 搜尋時檢查的分群數
+
+# 多程序分析的工作租約設定
+ANALYSIS_CLAIM_SIZE = 20  # 每次認領的文章數
+ANALYSIS_LEASE_SECONDS = 300  # 租約有效時間（秒），程序異常結束時租約到期後文章會回到待分析佇列
+
+# 主程式環境驗證快取有效時間（秒），套件版本改變時會立即重新驗證
+ENV_CHECK_TTL = 24 * 60 * 60
+
+# 常駐模式（main.py --daemon）設定
+DAEMON_CRAWL_INTERVAL = 30 * 60  # 爬蟲週期間隔（秒）
+DAEMON_ANALYZE_INTERVAL = 10 * 60  # 分析週期間隔（秒）
+DAEMON_JITTER = 0.1  # 週期間隔的隨機抖動比例（±10%），避免固定時間點發出請求
+
+# 文章內容壓縮設定（需安裝 zstandard，並先以 utils/content_compression.py train 訓練字典）
+CONTENT_COMPRESSION = False  # 新增的文章是否以最新版本的字典壓縮儲存
+ZSTD_LEVEL = 9  # zstd 壓縮等級
+ZSTD_DICT_SIZE = 112640  # 字典大小（bytes）
+ZSTD_DICT_SAMPLES = 20000  # 訓練字典時抽樣的文章數
+
+# 資料庫備份設定（utils/backup.py、main.py --backup）
+BACKUP_DIR = "backups"  # 備份目錄（相對於專案根目錄）
+BACKUP_PAGES_PER_STEP = 1024  # 線上備份每一步複製的頁數，步與步之間釋放鎖讓其他程序寫入
+BACKUP_STEP_SLEEP = 0.05  # 每一步之間的等待時間（秒）
+BACKUP_COMPRESSION = "gzip"  # 備份壓縮格式: "gzip"、"zstd"（需安裝 zstandard）或 "none"
+BACKUP_KEEP_LAST = 5  # 保留最近的備份數
+BACKUP_KEEP_DAILY = 7  # 另外保留最近幾天每天最新的一份
+BACKUP_KEEP_WEEKLY = 4  # 另外保留最近幾週每週最新的一份
+
+# 日誌設定（utils/logging_config.py）
+LOG_JSON = False  # 日誌檔是否輸出為每行一筆的 JSON
+LOG_RATE_LIMIT = 5  # 同一行程式碼每秒最多記錄的 INFO/DEBUG 訊息數（0 表示不限制），WARNING 以上一律記錄
+LOG_RATE_BURST = 20  # 同一行程式碼可瞬間記錄的訊息數
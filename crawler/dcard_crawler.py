@@ -8,7 +8,10 @@ import json
 import logging
 import requests
 import random
+import threading
+from collections import Counter
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
@@ -21,32 +24,68 @@ from selenium.common.exceptions import TimeoutException, WebDriverException
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config.settings import (
-    BASE_URL, FORUM_NAME, HEADERS, POSTS_LIMIT, TOTAL_POSTS, 
-    DELAY_BETWEEN_REQUESTS, USE_PROXY, PROXY_LIST, ROTATE_PROXY
+    BASE_URL, FORUM_NAME, HEADERS, POSTS_LIMIT, TOTAL_POSTS, MAX_LIST_PAGES, SELENIUM_TIMEOUT, SELENIUM_IMPLICIT_WAIT,
+    DELAY_BETWEEN_REQUESTS, USE_PROXY, PROXY_LIST, ROTATE_PROXY, SIMILARITY_AUTO_UPDATE,
+    REQUEST_TIMEOUT, REQUESTS_PER_SECOND, REQUEST_BURST, COMMENTS_LIMIT, COMMENT_WORKERS, CRAWLER_SESSION_TTL,
+    REFRESH_REANALYZE_ON_COMMENTS, PRIORITY_MIN_SCORE, CRAWL_REQUEST_BUDGET, DEFERRED_DRAIN_LIMIT,
+    DEFERRED_MAX_AGE_DAYS
 )
 from database.db_manager import DatabaseManager
+from crawler.rate_limiter import RateLimiter
+from crawler.priority import rank_posts
+from utils.helpers import format_timestamp
 
-# 設定日誌
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    filename=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logs', 'crawler.log'),
-    encoding='utf-8'
-)
 logger = logging.getLogger(__name__)
 
 class DcardCrawler:
     """Dcard爬蟲類別，使用Selenium繞過Cloudflare保護"""
     
-    def __init__(self):
-        """初始化爬蟲"""
+    def __init__(self, db=None):
+        """初始化爬蟲
+
+        db: 可選，共用的 DatabaseManager（常駐模式下與分析器共用同一個連線）
+        """
         self.base_url = BASE_URL
         self.forum_url = f"{BASE_URL}/forums/{FORUM_NAME}/posts"
         self.headers = HEADERS
-        self.db = DatabaseManager()
-        self.db.connect()
+        self.db = db or DatabaseManager()
+        if not self.db.conn:
+            self.db.connect()
         self.db.initialize_db()
         self.driver = None
+        # 通過 Cloudflare 檢查後取得的 cookies；requests.Session 不保證執行緒安全，
+        # 每個執行緒以這組 cookies 建立自己的 session，所有請求共用同一個速率額度
+        self.session_cookies = None
+        self.session_generation = 0
+        self.session_created_at = 0
+        self.session_expired = False
+        self.thread_local = threading.local()
+        self.sessions = []
+        self.sessions_lock = threading.Lock()
+        # 抓取留言的執行緒池在爬蟲存續期間重複使用，各執行緒的 session 與連線也得以沿用
+        self.comment_executor = None
+        self.rate_limiter = RateLimiter(REQUESTS_PER_SECOND, REQUEST_BURST)
+        # 已發送的請求數（留言以多執行緒抓取，需加鎖計數）
+        self.request_count = 0
+        self.request_count_lock = threading.Lock()
+        if SIMILARITY_AUTO_UPDATE:
+            self.attach_similarity_index()
+        
+    def attach_similarity_index(self):
+        """若相似文章索引已建立，新增或更新文章時同步寫入索引"""
+        try:
+            from analysis.similarity import SimilarityIndex
+        except ImportError as e:
+            logger.warning(f"無法載入相似文章索引模組: {e}")
+            return False
+        
+        index = SimilarityIndex()
+        if not index.exists():
+            return False
+        self.db.add_insert_listener(index.add_post)
+        self.db.add_update_listener(index.update_post)
+        logger.info("新增或更新的文章將同步寫入相似文章索引")
+        return True
         
     def setup_selenium(self):
         """設置Selenium"""
@@ -85,12 +124,61 @@ class DcardCrawler:
             cookies = self.driver.get_cookies()
             self.session_cookies = {cookie['name']: cookie['value'] for cookie in cookies}
             
+            # 更新 cookies 版本，各執行緒下次發送請求時以新的 cookies 重建 session
+            self.session_generation += 1
+            self.session_created_at = time.monotonic()
+            self.session_expired = False
+            
             logger.info("成功繞過Cloudflare保護")
             return True
         except Exception as e:
             logger.error(f"繞過Cloudflare失敗: {e}")
             return False
             
+    def ensure_session(self):
+        """確保已有通過 Cloudflare 檢查的 session；cookies 未過期時直接沿用（常駐模式跨週期重複使用）"""
+        if (
+            self.session_cookies is not None
+            and not self.session_expired
+            and time.monotonic() - self.session_created_at < CRAWLER_SESSION_TTL
+        ):
+            return True
+        if self.session_cookies is not None:
+            logger.info("Cloudflare cookies 已過期，重新取得")
+        if not self.driver and not self.setup_selenium():
+            return False
+        return self.bypass_cloudflare()
+            
+    def get_session(self):
+        """取得目前執行緒的 session，cookies 更新後重新建立"""
+        local = self.thread_local
+        if getattr(local, 'generation', None) != self.session_generation:
+            session = requests.Session()
+            for name, value in self.session_cookies.items():
+                session.cookies.set(name, value)
+            with self.sessions_lock:
+                old_session = getattr(local, 'session', None)
+                if old_session is not None:
+                    old_session.close()
+                    if old_session in self.sessions:
+                        self.sessions.remove(old_session)
+                self.sessions.append(session)
+            local.session = session
+            local.generation = self.session_generation
+        return local.session
+            
+    def request(self, url, params=None, headers=None):
+        """在共用速率額度內發送 GET 請求，headers 會附加在預設標頭之後"""
+        self.rate_limiter.acquire()
+        with self.request_count_lock:
+            self.request_count += 1
+        request_headers = {**self.headers, **headers} if headers else self.headers
+        response = self.get_session().get(url, params=params, headers=request_headers, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 403:
+            # cookies 可能已失效，下次 ensure_session 時重新繞過 Cloudflare
+            self.session_expired = True
+        return response
+            
     def fetch_posts(self, before=None, limit=POSTS_LIMIT):
         """獲取文章列表"""
         try:
@@ -100,13 +188,8 @@ class DcardCrawler:
             if before:
                 params['before'] = before
                 
-            # 建立一個session並加入cookies
-            session = requests.Session()
-            for name, value in self.session_cookies.items():
-                session.cookies.set(name, value)
-                
             # 發送請求
-            response = session.get(url, params=params, headers=self.headers)
+            response = self.request(url, params=params)
             
             if response.status_code == 200:
                 posts_data = response.json()
@@ -119,35 +202,163 @@ class DcardCrawler:
             logger.error(f"獲取文章列表失敗: {e}")
             return []
             
-    def fetch_post_content(self, post_id):
-        """獲取單篇文章內容"""
+    def fetch_post(self, post_id, etag=None, last_modified=None):
+        """獲取單篇文章內容，回傳 (狀態, 文章資料, HTTP 驗證標頭)
+
+        提供 etag / last_modified 時發送條件式請求（If-None-Match / If-Modified-Since）。
+        狀態為 'ok'、'not_modified'（304，內容未變更）或 'error'；
+        驗證標頭為 {'http_etag': ..., 'http_last_modified': ...}，供下次條件式請求使用
+        """
         try:
-            url = f"{self.base_url}/{post_id}"
+            url = f"{self.base_url}/posts/{post_id}"
+            headers = {}
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
             
-            # 建立一個session並加入cookies
-            session = requests.Session()
-            for name, value in self.session_cookies.items():
-                session.cookies.set(name, value)
-                
             # 發送請求
-            response = session.get(url, headers=self.headers)
+            response = self.request(url, headers=headers)
+            validators = {
+                'http_etag': response.headers.get('ETag') or etag,
+                'http_last_modified': response.headers.get('Last-Modified') or last_modified,
+            }
             
+            if response.status_code == 304:
+                return 'not_modified', None, validators
             if response.status_code == 200:
                 post_data = response.json()
                 logger.info(f"成功獲取文章內容: {post_data.get('title')}")
-                return post_data
+                return 'ok', post_data, validators
+            logger.error(f"獲取文章內容失敗: {response.status_code}")
+            return 'error', None, {}
+        except Exception as e:
+            logger.error(f"獲取文章內容失敗: {e}")
+            return 'error', None, {}
+            
+    def fetch_post_content(self, post_id):
+        """獲取單篇文章內容"""
+        _, post_data, _ = self.fetch_post(post_id)
+        return post_data
+            
+    def fetch_comment_page(self, dcard_id, after):
+        """獲取單頁留言（樓層大於 after 的前 COMMENTS_LIMIT 則），失敗時回傳 None"""
+        try:
+            url = f"{self.base_url}/posts/{dcard_id}/comments"
+            params = {'limit': COMMENTS_LIMIT}
+            if after:
+                params['after'] = after
+                
+            response = self.request(url, params=params)
+            
+            if response.status_code == 200:
+                return response.json()
             else:
-                logger.error(f"獲取文章內容失敗: {response.status_code}")
+                logger.error(f"獲取留言失敗 (文章 {dcard_id}, B{after} 之後): {response.status_code}")
                 return None
         except Exception as e:
-            logger.error(f"獲取文章內容失敗: {e}")
+            logger.error(f"獲取留言失敗 (文章 {dcard_id}, B{after} 之後): {e}")
             return None
             
+    def fetch_new_comments(self, dcard_id, pages):
+        """依序合併同一篇文章已抓取的各頁留言，回傳 (留言列表, 新的留言游標)
+
+        pages: [(after, 該頁留言或 None), ...]，依 after 排序。
+        遇到失敗的頁面即停止，游標只推進到連續成功的部分，下次執行會從該處重抓；
+        最後一頁為滿頁時表示還有更多留言（列表上的留言數可能已過時），繼續往後抓取
+        """
+        comments = []
+        cursor = pages[0][0]
+        page = []
+        for after, page in pages:
+            if page is None:
+                return comments, cursor
+            comments.extend(page)
+            cursor = max([cursor] + [comment.get('floor', 0) for comment in page])
+            
+        while len(page) >= COMMENTS_LIMIT:
+            page = self.fetch_comment_page(dcard_id, cursor)
+            if not page:
+                break
+            comments.extend(page)
+            cursor = max([cursor] + [comment.get('floor', 0) for comment in page])
+        return comments, cursor
+            
+    def crawl_comments(self, posts):
+        """增量抓取一頁文章列表中各篇文章的新留言
+
+        依每篇文章的留言游標與列表上的 commentCount 推算需要的留言頁面，
+        所有頁面在共用速率額度下並行抓取；資料庫寫入只在主執行緒進行。
+        回傳有新留言的本地文章 ID 列表
+        """
+        cursors = self.db.get_comment_cursors([post.get('id') for post in posts])
+        
+        # 每個工作項目為 (本地文章ID, Dcard文章ID, after)
+        tasks = []
+        for post in posts:
+            dcard_id = post.get('id')
+            if dcard_id not in cursors:
+                continue
+            post_id, cursor = cursors[dcard_id]
+            comment_count = post.get('commentCount')
+            if comment_count is None:
+                page_count = 1
+            elif comment_count <= cursor:
+                continue
+            else:
+                page_count = -(-(comment_count - cursor) // COMMENTS_LIMIT)
+            tasks.extend((post_id, dcard_id, cursor + index * COMMENTS_LIMIT) for index in range(page_count))
+            
+        if not tasks:
+            return []
+            
+        if self.comment_executor is None:
+            self.comment_executor = ThreadPoolExecutor(max_workers=COMMENT_WORKERS, thread_name_prefix='comments')
+        results = list(self.comment_executor.map(lambda task: self.fetch_comment_page(task[1], task[2]), tasks))
+            
+        pages_by_post = {}
+        for (post_id, dcard_id, after), page in zip(tasks, results):
+            pages_by_post.setdefault((post_id, dcard_id), []).append((after, page))
+            
+        saved_count = 0
+        updated_post_ids = []
+        for (post_id, dcard_id), pages in pages_by_post.items():
+            comments, new_cursor = self.fetch_new_comments(dcard_id, sorted(pages, key=lambda item: item[0]))
+            if new_cursor <= pages[0][0] and not comments:
+                continue
+            rows = [
+                (
+                    comment.get('id'),
+                    comment.get('floor'),
+                    comment.get('content', ''),
+                    comment.get('likeCount', 0),
+                    format_timestamp(comment.get('createdAt', '')) if comment.get('createdAt') else '',
+                )
+                for comment in comments
+                if comment.get('id') and not comment.get('hidden') and not comment.get('deleted')
+            ]
+            if self.db.save_comments(post_id, rows, new_cursor):
+                saved_count += len(rows)
+                if rows:
+                    updated_post_ids.append(post_id)
+                
+        logger.info(f"本頁文章共抓取 {len(tasks)} 個留言頁面，取得 {saved_count} 則留言")
+        return updated_post_ids
+            
+    @staticmethod
+    def list_metadata(post):
+        """文章列表上用於偵測變更的中繼資料"""
+        return {
+            'dcard_updated_at': post.get('updatedAt'),
+            'dcard_comment_count': post.get('commentCount'),
+            'dcard_like_count': post.get('likeCount'),
+        }
+            
     def process_post(self, post):
         """處理單篇文章數據"""
         try:
             post_id = post.get('id')
-            post_content = self.fetch_post_content(post_id)
+            status, post_content, validators = self.fetch_post(post_id)
             
             if post_content:
                 title = post_content.get('title', '')
@@ -163,10 +374,10 @@ class DcardCrawler:
                         logger.warning(f"日期格式化失敗: {created_at}")
                 
                 # 存入資料庫
-                self.db.insert_post(title, content, created_at)
-                
-                # 延遲避免請求過快
-                time.sleep(DELAY_BETWEEN_REQUESTS)
+                self.db.insert_post(
+                    title, content, created_at, dcard_id=post_id,
+                    metadata={**self.list_metadata(post), **validators}
+                )
                 
                 return True
             return False
@@ -174,53 +385,282 @@ class DcardCrawler:
             logger.error(f"處理文章失敗: {e}")
             return False
             
-    def crawl(self):
-        """爬取文章主函數"""
+    def crawl(self, close=True, stop_event=None, incremental=False, request_budget=CRAWL_REQUEST_BUDGET):
+        """爬取文章主函數
+
+        先翻閱文章列表收集最多 TOTAL_POSTS 篇尚未儲存的文章，以列表上的欄位評分後
+        由高分到低分抓取內容（延後佇列中分數達門檻的文章一起排序）；
+        低於 PRIORITY_MIN_SCORE 的文章與請求額度用完時尚未抓取的文章放入延後佇列，於離峰時段排空。
+        close: 結束時是否關閉瀏覽器與資料庫（常駐模式下保留給下個週期使用）
+        stop_event: 可選，threading.Event，設定後在處理完目前文章後停止
+        incremental: 整頁都是已知文章時停止翻頁
+        request_budget: 本次最多發送的請求數（含文章列表與留言），None 表示不限制
+        """
+        stats = Counter()
         try:
             # 設置Selenium並繞過Cloudflare
-            if not self.setup_selenium() or not self.bypass_cloudflare():
+            if not self.ensure_session():
                 logger.error("無法設置爬蟲環境")
                 return False
                 
-            posts_count = 0
-            last_id = None
+            start_count = self.request_count
+            request_limit = None if request_budget is None else start_count + request_budget
+            candidates = self.collect_new_posts(stats, stop_event, incremental, request_limit)
             
-            while posts_count < TOTAL_POSTS:
-                # 獲取文章列表
-                posts = self.fetch_posts(before=last_id)
+            # 延後佇列中分數達門檻的文章與本次新文章一起排序，列表上的資料以本次取得的為準
+            for dcard_id, _, post in self.db.get_deferred_posts(TOTAL_POSTS, min_score=PRIORITY_MIN_SCORE):
+                candidates.setdefault(dcard_id, post)
+            ranked, low = rank_posts(candidates.values())
+            stats['low_score'] = len(low)
+            self.db.defer_posts([(post.get('id'), score, post) for score, post in low], 'low_score')
+            
+            self.fetch_ranked(ranked, stats, stop_event, request_limit)
+            
+            logger.info(
+                f"爬蟲完成: 掃描 {stats['list_pages']} 頁列表，新文章 {len(candidates)} 篇，"
+                f"依分數抓取 {stats['fetched']} 篇（失敗 {stats['failed']} 篇），"
+                f"低分延後 {stats['low_score']} 篇，額度用完延後 {stats['deferred']} 篇，"
+                f"共 {self.request_count - start_count} 個請求"
+            )
+            return True
+        except Exception as e:
+            logger.error(f"爬取過程中發生錯誤: {e}")
+            return False
+        finally:
+            if close:
+                self.close()
                 
-                if not posts:
-                    logger.warning("沒有更多文章或請求失敗")
-                    break
-                    
-                # 處理每篇文章
-                for post in posts:
-                    if self.process_post(post):
-                        posts_count += 1
-                        
-                    if posts_count >= TOTAL_POSTS:
-                        break
-                        
-                # 記錄最後一篇文章的ID用於分頁
-                if posts:
-                    last_id = posts[-1].get('id')
+    def budget_exhausted(self, request_limit):
+        """本次的請求額度是否已用完"""
+        return request_limit is not None and self.request_count >= request_limit
+                
+    def collect_new_posts(self, stats, stop_event=None, incremental=False, request_limit=None):
+        """翻閱文章列表收集尚未儲存的文章，回傳 {dcard_id: 列表上的文章資料}
+
+        已儲存文章的新留言在翻頁時一併增量抓取；最多翻閱 MAX_LIST_PAGES 頁
+        """
+        candidates = {}
+        last_id = None
+        while len(candidates) < TOTAL_POSTS:
+            if MAX_LIST_PAGES is not None and stats['list_pages'] >= MAX_LIST_PAGES:
+                logger.info(f"已翻閱 {MAX_LIST_PAGES} 頁文章列表，停止翻頁")
+                break
+            if stop_event is not None and stop_event.is_set():
+                logger.info("收到停止訊號，停止翻頁")
+                break
+            if self.budget_exhausted(request_limit):
+                logger.info("請求額度已用完，停止翻頁")
+                break
+                
+            # 獲取文章列表
+            posts = self.fetch_posts(before=last_id)
+            
+            if not posts:
+                logger.warning("沒有更多文章或請求失敗")
+                break
+            stats['list_pages'] += 1
+                
+            known_ids = set(self.db.get_comment_cursors([post.get('id') for post in posts]))
+            for post in posts:
+                dcard_id = post.get('id')
+                if dcard_id is not None and dcard_id not in known_ids and len(candidates) < TOTAL_POSTS:
+                    candidates.setdefault(dcard_id, post)
                     
-                logger.info(f"已處理 {posts_count}/{TOTAL_POSTS} 篇文章")
+            # 抓取本頁已儲存文章的新留言
+            self.crawl_comments(posts)
+            
+            # 記錄最後一篇文章的ID用於分頁
+            last_id = posts[-1].get('id')
+            logger.info(f"已掃描 {stats['list_pages']} 頁文章列表，待評分 {len(candidates)}/{TOTAL_POSTS} 篇新文章")
+            
+            if incremental and len(known_ids) == len(posts):
+                logger.info("本頁文章皆已存在，停止翻頁")
+                break
+        return candidates
+                
+    def fetch_ranked(self, ranked, stats, stop_event=None, request_limit=None, limit=None):
+        """依分數由高到低抓取文章內容並存入資料庫，接著抓取新文章的留言
+
+        ranked: rank_posts 回傳的 (分數, 文章) 列表。
+        收到停止訊號、請求額度用完或已抓取 limit 篇時停止，其餘文章放入延後佇列；
+        抓取失敗的文章也放入延後佇列並累加失敗次數
+        """
+        stored, failed = [], []
+        remaining = []
+        for index, (score, post) in enumerate(ranked):
+            if (
+                (stop_event is not None and stop_event.is_set())
+                or self.budget_exhausted(request_limit)
+                or (limit is not None and len(stored) >= limit)
+            ):
+                remaining = ranked[index:]
+                break
+            if self.process_post(post):
+                stored.append(post)
+            else:
+                failed.append((post.get('id'), score, post))
+                
+        self.db.remove_deferred_posts([post.get('id') for post in stored])
+        self.db.defer_posts(failed, 'failed', failed=True)
+        self.db.defer_posts([(post.get('id'), score, post) for score, post in remaining], 'budget')
+        
+        # 新文章的留言在內容抓取後才能寫入；額度已用完時留待下次以留言游標補抓
+        if stored and not self.budget_exhausted(request_limit):
+            self.crawl_comments(stored)
+            
+        stats['fetched'] += len(stored)
+        stats['failed'] += len(failed)
+        stats['deferred'] += len(remaining)
+        return stored
+                
+    def drain_deferred(self, close=True, stop_event=None, limit=DEFERRED_DRAIN_LIMIT, request_budget=None):
+        """排空延後佇列：依分數由高到低抓取先前延後的文章（建議在離峰時段執行）
+
+        延後超過 DEFERRED_MAX_AGE_DAYS 天或失敗達 DEFERRED_MAX_ATTEMPTS 次的文章直接捨棄
+        """
+        stats = Counter()
+        try:
+            purged = self.db.purge_deferred_posts(DEFERRED_MAX_AGE_DAYS)
+            entries = self.db.get_deferred_posts(limit)
+            if not entries:
+                logger.info(f"延後佇列沒有待抓取的文章（已捨棄 {purged} 篇過期或失敗過多的文章）")
+                return True
+            if not self.ensure_session():
+                logger.error("無法設置爬蟲環境")
+                return False
+                
+            start_count = self.request_count
+            request_limit = None if request_budget is None else start_count + request_budget
+            ranked, _ = rank_posts([post for _, _, post in entries], min_score=float('-inf'))
+            self.fetch_ranked(ranked, stats, stop_event, request_limit)
+            logger.info(
+                f"延後佇列排空: 抓取 {stats['fetched']} 篇（失敗 {stats['failed']} 篇），"
+                f"未完成 {stats['deferred']} 篇，捨棄 {purged} 篇，共 {self.request_count - start_count} 個請求"
+            )
+            return True
+        except Exception as e:
+            logger.error(f"排空延後佇列時發生錯誤: {e}")
+            return False
+        finally:
+            if close:
+                self.close()
                 
-                # 延遲避免請求過快
-                time.sleep(DELAY_BETWEEN_REQUESTS)
+    def refresh(self, close=True, stop_event=None):
+        """更新模式：比對文章列表的中繼資料，只重新抓取有變更的已儲存文章
+
+        從最新的文章列表往前翻頁，直到越過資料庫中最舊的文章。
+        updatedAt 與儲存值不同的文章以條件式請求重新抓取，內容有變化時更新並重新排入分析；
+        留言數與按讚數只更新數值，新留言以留言游標增量抓取。
+        新文章不在此模式處理，請使用一般爬蟲模式
+        """
+        stats = Counter()
+        try:
+            if not self.ensure_session():
+                logger.error("無法設置爬蟲環境")
+                return False
+                
+            oldest_id = self.db.get_oldest_dcard_id()
+            if oldest_id is None:
+                logger.info("資料庫中沒有記錄 Dcard 文章 ID 的文章，無須更新")
+                return True
                 
+            start_count = self.request_count
+            last_id = None
+            while stop_event is None or not stop_event.is_set():
+                posts = self.fetch_posts(before=last_id)
+                if not posts:
+                    break
+                self.refresh_page(posts, stats)
+                last_id = posts[-1].get('id')
+                if last_id is None or last_id <= oldest_id:
+                    break
+                    
+            used = self.request_count - start_count
+            # 完整重新爬取的成本：列表頁 + 每篇文章內容 + 留言頁
+            full_cost = stats['list_pages'] + stats['checked'] + stats['comment_pages_full']
+            logger.info(
+                f"更新完成: 比對 {stats['checked']} 篇，重新抓取 {stats['refetched']} 篇"
+                f"（304 未變更 {stats['not_modified']} 篇），內容有變更 {stats['changed']} 篇，"
+                f"有新留言 {stats['commented']} 篇，失敗 {stats['failed']} 篇，重新排入分析 {stats['requeued']} 篇"
+            )
+            logger.info(f"本次更新共 {used} 個請求，完整重新爬取約需 {full_cost} 個請求")
             return True
         except Exception as e:
-            logger.error(f"爬取過程中發生錯誤: {e}")
+            logger.error(f"更新過程中發生錯誤: {e}")
             return False
         finally:
-            # 關閉資源
-            if self.driver:
-                self.driver.quit()
-            self.db.close()
+            if close:
+                self.close()
+                
+    def refresh_page(self, posts, stats):
+        """比對一頁文章列表並更新有變更的文章"""
+        stats['list_pages'] += 1
+        stored = self.db.get_post_metadata([post.get('id') for post in posts])
+        metadata_rows = []
+        requeue_ids = []
+        for post in posts:
+            dcard_id = post.get('id')
+            if dcard_id not in stored:
+                continue
+            previous = stored[dcard_id]
+            current = self.list_metadata(post)
+            stats['checked'] += 1
+            stats['comment_pages_full'] += -(-(current['dcard_comment_count'] or 0) // COMMENTS_LIMIT)
+            
+            if current['dcard_updated_at'] and current['dcard_updated_at'] != previous['dcard_updated_at']:
+                stats['refetched'] += 1
+                status, post_data, validators = self.fetch_post(
+                    dcard_id, previous['http_etag'], previous['http_last_modified']
+                )
+                if status == 'error':
+                    # 不更新 updatedAt，下次更新時重試
+                    stats['failed'] += 1
+                    continue
+                if status == 'not_modified':
+                    stats['not_modified'] += 1
+                    post_data = None
+                if post_data is not None and self.db.update_post_content(
+                    previous['post_id'], post_data.get('title', ''), post_data.get('content', ''),
+                    metadata={**current, **validators}
+                ):
+                    stats['changed'] += 1
+                    stats['requeued'] += 1
+                    continue
+                    
+            metadata_rows.append((
+                dcard_id, current['dcard_updated_at'] or previous['dcard_updated_at'],
+                current['dcard_comment_count'], current['dcard_like_count']
+            ))
+            
+        self.db.update_list_metadata(metadata_rows)
+        
+        # 留言以游標增量抓取；有新留言的文章依設定重新排入分析
+        commented_ids = self.crawl_comments(posts)
+        stats['commented'] += len(commented_ids)
+        if REFRESH_REANALYZE_ON_COMMENTS:
+            requeue_ids.extend(commented_ids)
+        stats['requeued'] += self.db.requeue_posts_for_analysis(requeue_ids)
+            
+    def close(self):
+        """關閉瀏覽器、HTTP session 與資料庫連接"""
+        if self.driver:
+            self.driver.quit()
+            self.driver = None
+        if self.comment_executor is not None:
+            self.comment_executor.shutdown(wait=True)
+            self.comment_executor = None
+        with self.sessions_lock:
+            for session in self.sessions:
+                session.close()
+            self.sessions = []
+        self.session_cookies = None
+        # 已關閉的 session 不再使用，各執行緒下次請求時重新建立
+        self.session_generation += 1
+        self.db.close()
 
 # 測試執行
 if __name__ == "__main__":
+    from utils.logging_config import setup_logging
+    setup_logging('crawler')
     crawler = DcardCrawler()
     crawler.crawl()
\ No newline at end of file
@@ -0,0 +1,45 @@
+"""
+文章抓取優先順序
+在抓取文章內容之前，只用文章列表上已有的欄位（標題、摘要、話題、留言數、按讚數）評分，
+讓有限的請求額度先用在最可能與房貸相關的文章上
+"""
+import math
+
+from config.settings import (
+    PRIORITY_KEYWORDS, PRIORITY_FIELD_WEIGHTS, PRIORITY_ENGAGEMENT_WEIGHT, PRIORITY_MIN_SCORE
+)
+
+
+def keyword_score(post):
+    """關鍵字分數：每個關鍵字依出現的欄位（標題、話題、摘要）加權計分"""
+    fields = {
+        'title': post.get('title') or '',
+        'topics': ' '.join(post.get('topics') or []),
+        'excerpt': post.get('excerpt') or '',
+    }
+    score = 0.0
+    for keyword, weight in PRIORITY_KEYWORDS.items():
+        for field, text in fields.items():
+            if keyword in text:
+                score += weight * PRIORITY_FIELD_WEIGHTS.get(field, 1.0)
+    return score
+
+
+def engagement_score(post):
+    """互動分數：留言數與按讚數取對數，避免熱門但無關的文章蓋過關鍵字"""
+    comments = post.get('commentCount') or 0
+    likes = post.get('likeCount') or 0
+    return PRIORITY_ENGAGEMENT_WEIGHT * (math.log1p(comments) + 0.5 * math.log1p(likes))
+
+
+def score_post(post):
+    """依文章列表上的欄位計算抓取優先分數"""
+    return round(keyword_score(post) + engagement_score(post), 2)
+
+
+def rank_posts(posts, min_score=PRIORITY_MIN_SCORE):
+    """依分數由高到低排序，回傳 (優先抓取列表, 低分列表)，列表元素為 (分數, 文章)"""
+    scored = sorted(((score_post(post), post) for post in posts), key=lambda item: item[0], reverse=True)
+    ranked = [item for item in scored if item[0] >= min_score]
+    low = [item for item in scored if item[0] < min_score]
+    return ranked, low
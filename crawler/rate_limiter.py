@@ -0,0 +1,32 @@
+"""
+共用的請求速率限制器
+爬蟲的所有請求（文章列表、文章內容、留言頁面）都從同一個額度取用，
+多執行緒同時抓取時總請求速率仍不會超過設定值
+"""
+import time
+import threading
+
+
+class RateLimiter:
+    """執行緒安全的 token bucket 速率限制器"""
+
+    def __init__(self, rate, burst=1):
+        """rate: 每秒可發出的請求數, burst: 額度可累積的最大請求數"""
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """取得一個請求額度，額度不足時等待"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
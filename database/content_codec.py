@@ -0,0 +1,158 @@
+"""
+文章內容的 zstd 字典壓縮
+- 字典以語料訓練並依版本保存在資料庫中，每篇壓縮過的文章記錄所使用的字典版本
+- 未壓縮的文章仍以 TEXT 儲存，新舊資料可並存
+- 安裝 zstandard 時才能壓縮或讀取壓縮內容，否則維持原本的 TEXT 儲存
+"""
+import threading
+
+try:
+    import zstandard
+except ImportError:  # zstandard 為可選套件
+    zstandard = None
+
+from config.settings import ZSTD_LEVEL, ZSTD_DICT_SIZE
+
+
+class ContentCodec:
+    """依字典版本壓縮/解壓文章內容"""
+
+    def __init__(self, level=ZSTD_LEVEL):
+        self.level = level
+        self.active_version = None
+        self.compressors = {}
+        self.decompressors = {}
+        # 遇到尚未載入的字典版本時呼叫 dictionary_loader(version) 補載入，回傳是否找到
+        self.dictionary_loader = None
+        # zstandard 的壓縮/解壓物件不是執行緒安全的
+        self.lock = threading.Lock()
+
+    @property
+    def available(self):
+        """是否已安裝 zstandard"""
+        return zstandard is not None
+
+    @property
+    def can_compress(self):
+        """是否可以壓縮新內容（已安裝 zstandard 且有可用的字典）"""
+        return self.available and self.active_version is not None
+
+    def add_dictionary(self, version, dict_data):
+        """載入一個版本的字典，版本號最大者為壓縮新內容時使用的字典"""
+        if not self.available:
+            return
+        dictionary = zstandard.ZstdCompressionDict(dict_data)
+        with self.lock:
+            self.compressors[version] = zstandard.ZstdCompressor(level=self.level, dict_data=dictionary)
+            self.decompressors[version] = zstandard.ZstdDecompressor(dict_data=dictionary)
+            if self.active_version is None or version > self.active_version:
+                self.active_version = version
+
+    def compress(self, text):
+        """以目前版本的字典壓縮文字，回傳 (壓縮資料, 字典版本)
+
+        壓縮後沒有變小的內容（例如很短的文章）回傳 (原文字, None)，維持 TEXT 儲存
+        """
+        if not text or not self.can_compress:
+            return text, None
+        raw = text.encode('utf-8')
+        with self.lock:
+            data = self.compressors[self.active_version].compress(raw)
+        if len(data) >= len(raw):
+            return text, None
+        return data, self.active_version
+
+    def decompress(self, data, version):
+        """還原內容；未壓縮（version 為 None）的內容原樣回傳"""
+        if version is None or not isinstance(data, bytes):
+            return data
+        if not self.available:
+            raise RuntimeError("內容以 zstd 壓縮儲存，需要安裝 zstandard 才能讀取")
+        decompressor = self.decompressors.get(version)
+        if decompressor is None and self.dictionary_loader is not None and self.dictionary_loader(version):
+            decompressor = self.decompressors.get(version)
+        if decompressor is None:
+            raise RuntimeError(f"找不到版本 {version} 的壓縮字典")
+        with self.lock:
+            return decompressor.decompress(data).decode('utf-8')
+
+    def lazy(self, data, version):
+        """回傳延遲解壓的內容；未壓縮的內容原樣回傳"""
+        if version is None or not isinstance(data, bytes):
+            return data
+        return LazyContent(self, data, version)
+
+
+def train_dictionary(samples, dict_size=ZSTD_DICT_SIZE):
+    """以文章內容樣本訓練 zstd 字典，回傳字典的 bytes"""
+    if zstandard is None:
+        raise RuntimeError("訓練壓縮字典需要安裝 zstandard")
+    return zstandard.train_dictionary(dict_size, [sample.encode('utf-8') for sample in samples]).as_bytes()
+
+
+class LazyContent:
+    """壓縮內容的延遲解壓代理
+
+    讀取文章時先保留壓縮資料，直到內容第一次被當作字串使用（str()、格式化、
+    長度、字串方法等）才解壓並快取結果；只讀取標題或 ID 的程式不會付出解壓成本
+    """
+
+    __slots__ = ('_codec', '_data', '_version', '_text')
+
+    def __init__(self, codec, data, version):
+        self._codec = codec
+        self._data = data
+        self._version = version
+        self._text = None
+
+    @property
+    def text(self):
+        """解壓後的文字"""
+        if self._text is None:
+            self._text = self._codec.decompress(self._data, self._version)
+            self._data = None
+        return self._text
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        state = 'decompressed' if self._text is not None else f'{len(self._data)} bytes'
+        return f"<LazyContent v{self._version} {state}>"
+
+    def __format__(self, format_spec):
+        return format(self.text, format_spec)
+
+    def __bool__(self):
+        # 空字串不會被壓縮，壓縮資料必定對應非空內容
+        return True
+
+    def __len__(self):
+        return len(self.text)
+
+    def __eq__(self, other):
+        if isinstance(other, LazyContent):
+            other = other.text
+        return self.text == other
+
+    def __hash__(self):
+        return hash(self.text)
+
+    def __contains__(self, item):
+        return item in self.text
+
+    def __iter__(self):
+        return iter(self.text)
+
+    def __getitem__(self, key):
+        return self.text[key]
+
+    def __add__(self, other):
+        return self.text + str(other)
+
+    def __radd__(self, other):
+        return str(other) + self.text
+
+    def __getattr__(self, name):
+        # 其餘字串方法（split、strip、replace 等）委派給解壓後的文字
+        return getattr(self.text, name)
@@ -4,36 +4,97 @@
 import sqlite3
 import os
 import sys
-from datetime import datetime
+import time
+import json
+from datetime import datetime, timedelta
 import logging
 
 # 將專案根目錄加入系統路徑
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from config.settings import DB_NAME, TABLE_NAME
+from config.settings import (
+    DB_NAME, TABLE_NAME, MAX_ANALYSIS_ATTEMPTS, CONTENT_COMPRESSION, ZSTD_DICT_SAMPLES, DEFERRED_MAX_ATTEMPTS
+)
+from database.content_codec import ContentCodec, train_dictionary
+from analysis.prompts import STRUCTURED_TEXT_FIELDS, STRUCTURED_LIST_FIELD
+
+BATCH_TABLE_NAME = "analysis_batches"
+BATCH_ITEMS_TABLE_NAME = "analysis_batch_items"
+LEASE_TABLE_NAME = "analysis_leases"
+COMMENT_TABLE_NAME = "post_comments"
+DICTIONARY_TABLE_NAME = "content_dictionaries"
+DEFERRED_TABLE_NAME = "deferred_posts"
+# 在 SQL 中取得（必要時解壓後的）文章內容，只有實際回傳的列才會解壓
+CONTENT_SQL = "content_text(content, content_dict_version)"
+# 已結束（不會再變動）的批次狀態
+BATCH_TERMINAL_STATUSES = ("applied", "failed", "expired", "cancelled")
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    filename=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logs', 'database.log'),
-    encoding='utf-8'
+# 在初始資料表之後新增的欄位，舊資料庫會在 initialize_db 時自動補上
+POST_EXTRA_COLUMNS = {
+    "prompt_version": "TEXT DEFAULT NULL",
+    "analysis_model": "TEXT DEFAULT NULL",
+    "analysis_mode": "TEXT DEFAULT NULL",
+    "prompt_tokens": "INTEGER DEFAULT NULL",
+    "completion_tokens": "INTEGER DEFAULT NULL",
+    "cached_tokens": "INTEGER DEFAULT NULL",
+    "analysis_attempts": "INTEGER DEFAULT 0",
+    "analysis_error": "TEXT DEFAULT NULL",
+    # Dcard 文章 ID 與已抓取留言的最大樓層（下次從此樓層之後抓取）
+    "dcard_id": "INTEGER DEFAULT NULL",
+    "comment_cursor": "INTEGER DEFAULT 0",
+    # 內容壓縮所使用的字典版本，NULL 表示 content 為未壓縮的 TEXT
+    "content_dict_version": "INTEGER DEFAULT NULL",
+    # 文章列表上的中繼資料與文章內容回應的 HTTP 驗證標頭，用於偵測文章是否被編輯
+    "dcard_updated_at": "TEXT DEFAULT NULL",
+    "dcard_comment_count": "INTEGER DEFAULT NULL",
+    "dcard_like_count": "INTEGER DEFAULT NULL",
+    "http_etag": "TEXT DEFAULT NULL",
+    "http_last_modified": "TEXT DEFAULT NULL",
+    "refreshed_at": "TEXT DEFAULT NULL",
+    # 分析結果（analyzed_at、structured_data、relevance_score）每次變動時由觸發器遞增的序號，
+    # 依提交順序單調遞增，供增量匯出與趨勢彙總判斷哪些文章有變動
+    "change_seq": "INTEGER DEFAULT NULL",
+}
+# insert_post / update_post_content 可寫入的中繼資料欄位
+POST_METADATA_COLUMNS = (
+    "dcard_updated_at", "dcard_comment_count", "dcard_like_count", "http_etag", "http_last_modified"
 )
+
 logger = logging.getLogger(__name__)
 
 class DatabaseManager:
     """管理 SQLite 資料庫的類別"""
     
-    def __init__(self, db_name=DB_NAME):
-        """初始化資料庫連接"""
-        self.db_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database', db_name)
+    def __init__(self, db_name=DB_NAME, db_path=None):
+        """初始化資料庫連接
+
+        db_path: 可選，直接指定資料庫檔案路徑（例如效能測試使用的暫存複本）
+        """
+        self.db_path = db_path or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database', db_name)
         self.conn = None
         self.cursor = None
+        self.codec = ContentCodec()
+        self.codec.dictionary_loader = self.load_content_dictionary
+        # 新增文章後要通知的回呼函式，簽名為 callback(post_id, title, content)
+        self.insert_listeners = []
+        self.update_listeners = []
+        
+    def add_insert_listener(self, callback):
+        """註冊新增文章後的回呼函式（例如更新相似文章索引）"""
+        self.insert_listeners.append(callback)
+        
+    def add_update_listener(self, callback):
+        """註冊文章內容更新後的回呼函式（例如重新計算相似文章索引中的向量）"""
+        self.update_listeners.append(callback)
         
     def connect(self):
         """連接到資料庫"""
         try:
             self.conn = sqlite3.connect(self.db_path)
+            self.conn.create_function("content_text", 2, self.codec.decompress, deterministic=True)
             self.cursor = self.conn.cursor()
+            # 只呼叫 connect() 的程式也會讀到壓縮內容，連線時就載入字典
+            self.load_content_dictionaries()
             logger.info(f"成功連接到資料庫: {self.db_path}")
             return True
         except sqlite3.Error as e:
@@ -58,29 +119,138 @@ class DatabaseManager:
                 analyzed_at TEXT DEFAULT NULL
             )
             ''')
+            self._ensure_columns(TABLE_NAME, POST_EXTRA_COLUMNS)
+            self.cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABLE_NAME}_analyzed_at ON {TABLE_NAME} (analyzed_at)")
+            self.cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABLE_NAME}_post_date ON {TABLE_NAME} (post_date)")
+            self.cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{TABLE_NAME}_dcard_id ON {TABLE_NAME} (dcard_id)")
+            self.cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABLE_NAME}_change_seq ON {TABLE_NAME} (change_seq)")
+            # 寫入交易彼此序列化，觸發器在交易內取目前最大值加一，因此序號順序與提交順序一致
+            self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{TABLE_NAME}_change_seq
+            AFTER UPDATE OF analyzed_at, structured_data, relevance_score ON {TABLE_NAME}
+            BEGIN
+                UPDATE {TABLE_NAME} 
+                SET change_seq = (SELECT IFNULL(MAX(change_seq), 0) + 1 FROM {TABLE_NAME}) 
+                WHERE id = NEW.id;
+            END
+            ''')
+            self.cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {COMMENT_TABLE_NAME} (
+                comment_id TEXT PRIMARY KEY,
+                post_id INTEGER NOT NULL,
+                floor INTEGER,
+                content TEXT,
+                like_count INTEGER DEFAULT 0,
+                created_at TEXT
+            )
+            ''')
+            self.cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{COMMENT_TABLE_NAME}_post_floor ON {COMMENT_TABLE_NAME} (post_id, floor)"
+            )
+            self.cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {BATCH_TABLE_NAME} (
+                batch_id TEXT PRIMARY KEY,
+                input_file TEXT,
+                output_file_id TEXT,
+                status TEXT,
+                request_count INTEGER,
+                created_at TEXT,
+                completed_at TEXT DEFAULT NULL
+            )
+            ''')
+            self.cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {BATCH_ITEMS_TABLE_NAME} (
+                batch_id TEXT,
+                post_id INTEGER,
+                PRIMARY KEY (batch_id, post_id)
+            )
+            ''')
+            self.cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_batch_items_post_id ON {BATCH_ITEMS_TABLE_NAME} (post_id)"
+            )
+            self.cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {LEASE_TABLE_NAME} (
+                post_id INTEGER PRIMARY KEY,
+                worker_id TEXT,
+                expires_at REAL
+            )
+            ''')
+            self.cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {DICTIONARY_TABLE_NAME} (
+                version INTEGER PRIMARY KEY AUTOINCREMENT,
+                dict_data BLOB NOT NULL,
+                sample_count INTEGER,
+                created_at TEXT
+            )
+            ''')
+            self.cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {DEFERRED_TABLE_NAME} (
+                dcard_id INTEGER PRIMARY KEY,
+                score REAL,
+                list_data TEXT,
+                reason TEXT,
+                attempts INTEGER DEFAULT 0,
+                deferred_at TEXT
+            )
+            ''')
+            self.cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{DEFERRED_TABLE_NAME}_score ON {DEFERRED_TABLE_NAME} (score)"
+            )
             self.conn.commit()
+            self.load_content_dictionaries()
             logger.info(f"成功初始化資料表: {TABLE_NAME}")
             return True
         except sqlite3.Error as e:
             logger.error(f"初始化資料表失敗: {e}")
             return False
     
-    def insert_post(self, title, content, post_date):
-        """插入一篇文章到資料庫"""
+    def _ensure_columns(self, table_name, columns):
+        """為既有資料表補上缺少的欄位"""
+        self.cursor.execute(f"PRAGMA table_info({table_name})")
+        existing = {row[1] for row in self.cursor.fetchall()}
+        for column, definition in columns.items():
+            if column not in existing:
+                self.cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column} {definition}")
+                logger.info(f"已為資料表 {table_name} 新增欄位: {column}")
+    
+    def insert_post(self, title, content, post_date, dcard_id=None, metadata=None):
+        """插入一篇文章到資料庫
+
+        dcard_id: 可選，Dcard 文章 ID，用於之後增量抓取留言
+        metadata: 可選，{POST_METADATA_COLUMNS 中的欄位: 值}，用於之後偵測文章是否被編輯
+        """
         if not self.conn:
             self.connect()
             
         try:
             current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            stored_content, dict_version = content, None
+            if CONTENT_COMPRESSION:
+                stored_content, dict_version = self.codec.compress(content)
+            metadata = {column: value for column, value in (metadata or {}).items() if column in POST_METADATA_COLUMNS}
+            columns = ["title", "content", "post_date", "created_at", "dcard_id", "content_dict_version", *metadata]
             self.cursor.execute(
-                f"INSERT INTO {TABLE_NAME} (title, content, post_date, created_at) VALUES (?, ?, ?, ?)",
-                (title, content, post_date, current_time)
+                f"INSERT INTO {TABLE_NAME} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                (title, stored_content, post_date, current_time, dcard_id, dict_version, *metadata.values())
             )
             self.conn.commit()
             logger.info(f"已添加文章: {title}")
+            post_id = self.cursor.lastrowid
+            for callback in self.insert_listeners:
+                try:
+                    callback(post_id, title, content)
+                except Exception as e:
+                    logger.error(f"新增文章回呼失敗: {e}")
             return True
         except sqlite3.IntegrityError:
             logger.warning(f"文章已存在: {title}")
+            if dcard_id is not None:
+                # 舊資料沒有記錄 Dcard 文章 ID，補上後才能抓取留言
+                self.cursor.execute(
+                    f"UPDATE {TABLE_NAME} SET dcard_id = ? WHERE title = ? AND dcard_id IS NULL",
+                    (dcard_id, title)
+                )
+                self.conn.commit()
             return False
         except sqlite3.Error as e:
             logger.error(f"添加文章失敗: {e}")
@@ -93,58 +263,904 @@ class DatabaseManager:
             
         try:
             self.cursor.execute(f"SELECT * FROM {TABLE_NAME}")
-            return self.cursor.fetchall()
+            columns = [column[0] for column in self.cursor.description]
+            content_index, version_index = columns.index("content"), columns.index("content_dict_version")
+            rows = []
+            for row in self.cursor.fetchall():
+                row = list(row)
+                row[content_index] = self.codec.lazy(row[content_index], row[version_index])
+                rows.append(tuple(row))
+            return rows
         except sqlite3.Error as e:
             logger.error(f"獲取文章失敗: {e}")
             return []
     
-    def get_posts_for_analysis(self):
-        """獲取尚未分析的文章"""
+    def claim_posts_for_analysis(self, worker_id, limit, lease_seconds):
+        """以租約方式認領待分析文章，回傳 (id, title, content) 列表
+
+        在 BEGIN IMMEDIATE 交易內完成選取與寫入租約，多個程序同時認領時不會拿到相同文章；
+        已過期的租約（例如程序異常結束）視為未被認領，並為仍未分析的文章累加一次嘗試次數，
+        避免讓工作程序反覆當掉的文章被無限次重新認領
+        """
         if not self.conn:
             self.connect()
             
+        now = time.time()
         try:
+            self.conn.commit()
+            self.cursor.execute("BEGIN IMMEDIATE")
+            placeholders = ", ".join("?" for _ in BATCH_TERMINAL_STATUSES)
+            self.cursor.execute(f"""
+                UPDATE {TABLE_NAME} 
+                SET analysis_attempts = COALESCE(analysis_attempts, 0) + 1, analysis_error = '分析租約過期' 
+                WHERE analyzed_at IS NULL
+                AND id IN (SELECT post_id FROM {LEASE_TABLE_NAME} WHERE expires_at <= ?)
+            """, (now,))
+            self.cursor.execute(f"DELETE FROM {LEASE_TABLE_NAME} WHERE expires_at <= ?", (now,))
             self.cursor.execute(f"""
-                SELECT id, title, content 
+                SELECT id, title, {CONTENT_SQL} 
+                FROM {TABLE_NAME} 
+                WHERE analyzed_at IS NULL
+                AND content IS NOT NULL AND content != ''
+                AND COALESCE(analysis_attempts, 0) < ?
+                AND id NOT IN (SELECT post_id FROM {LEASE_TABLE_NAME})
+                AND id NOT IN (
+                    SELECT i.post_id 
+                    FROM {BATCH_ITEMS_TABLE_NAME} i
+                    JOIN {BATCH_TABLE_NAME} b ON b.batch_id = i.batch_id
+                    WHERE b.status NOT IN ({placeholders})
+                )
+                ORDER BY COALESCE(analysis_attempts, 0), id
+                LIMIT ?
+            """, (MAX_ANALYSIS_ATTEMPTS, *BATCH_TERMINAL_STATUSES, limit))
+            posts = self.cursor.fetchall()
+            self.cursor.executemany(
+                f"INSERT INTO {LEASE_TABLE_NAME} (post_id, worker_id, expires_at) VALUES (?, ?, ?)",
+                [(post[0], worker_id, now + lease_seconds) for post in posts]
+            )
+            self.conn.commit()
+            if posts:
+                logger.info(f"工作程序 {worker_id} 認領了 {len(posts)} 篇文章")
+            return posts
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"認領待分析文章失敗: {e}")
+            return []
+    
+    def renew_leases(self, worker_id, post_ids, lease_seconds):
+        """延長工作程序持有的租約，回傳成功延長的數量（租約已過期並被他人認領者不會延長）"""
+        if not self.conn:
+            self.connect()
+            
+        try:
+            expires_at = time.time() + lease_seconds
+            with self.conn:
+                cursor = self.conn.executemany(
+                    f"UPDATE {LEASE_TABLE_NAME} SET expires_at = ? WHERE post_id = ? AND worker_id = ?",
+                    [(expires_at, post_id, worker_id) for post_id in post_ids]
+                )
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error(f"延長租約失敗: {e}")
+            return 0
+    
+    def release_leases(self, worker_id, post_ids=None):
+        """釋放工作程序持有的租約，post_ids 為 None 時釋放全部"""
+        if not self.conn:
+            self.connect()
+            
+        try:
+            with self.conn:
+                if post_ids is None:
+                    self.conn.execute(f"DELETE FROM {LEASE_TABLE_NAME} WHERE worker_id = ?", (worker_id,))
+                else:
+                    self.conn.executemany(
+                        f"DELETE FROM {LEASE_TABLE_NAME} WHERE post_id = ? AND worker_id = ?",
+                        [(post_id, worker_id) for post_id in post_ids]
+                    )
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"釋放租約失敗: {e}")
+            return False
+    
+    def update_post_analysis(self, post_id, relevance_score, structured_data, usage=None):
+        """更新文章的分析結果
+
+        usage: 可選，記錄此次分析的 prompt 版本、模型、模式與 token 用量，
+               鍵為 prompt_version / analysis_model / analysis_mode /
+               prompt_tokens / completion_tokens / cached_tokens
+        """
+        return self.bulk_update_post_analysis([(post_id, relevance_score, structured_data, usage)], log_each=True)
+    
+    def bulk_update_post_analysis(self, results, log_each=False):
+        """以單一交易批次更新多篇文章的分析結果
+
+        results 為 (post_id, relevance_score, structured_data, usage) 的序列，usage 可為 None
+        """
+        if not self.conn:
+            self.connect()
+            
+        try:
+            current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            rows = []
+            for post_id, relevance_score, structured_data, usage in results:
+                usage = usage or {}
+                rows.append((
+                    relevance_score, structured_data, current_time,
+                    usage.get("prompt_version"), usage.get("analysis_model"), usage.get("analysis_mode"),
+                    usage.get("prompt_tokens"), usage.get("completion_tokens"), usage.get("cached_tokens"),
+                    post_id
+                ))
+            with self.conn:
+                self.conn.executemany(
+                    f"""
+                    UPDATE {TABLE_NAME} 
+                    SET relevance_score = ?, structured_data = ?, analyzed_at = ?, 
+                        prompt_version = ?, analysis_model = ?, analysis_mode = ?, 
+                        prompt_tokens = ?, completion_tokens = ?, cached_tokens = ?, 
+                        analysis_error = NULL 
+                    WHERE id = ?
+                    """,
+                    rows
+                )
+            if log_each:
+                for row in rows:
+                    logger.info(f"已更新文章ID {row[-1]} 的分析結果")
+            else:
+                logger.info(f"已批次更新 {len(rows)} 篇文章的分析結果")
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"更新文章分析結果失敗: {e}")
+            return False
+    
+    def record_analysis_failures(self, failures):
+        """記錄分析失敗的文章，累加嘗試次數並保留錯誤訊息，文章仍留在待分析佇列
+
+        failures 為 (post_id, error_message) 的序列
+        """
+        if not self.conn:
+            self.connect()
+            
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    f"""
+                    UPDATE {TABLE_NAME} 
+                    SET analysis_attempts = COALESCE(analysis_attempts, 0) + 1, analysis_error = ? 
+                    WHERE id = ?
+                    """,
+                    [(str(error)[:500], post_id) for post_id, error in failures]
+                )
+            logger.warning(f"已記錄 {len(failures)} 篇文章分析失敗")
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"記錄分析失敗結果失敗: {e}")
+            return False
+    
+    def reset_invalid_analyses(self):
+        """將分析結果不合法的文章重新放回待分析佇列，回傳重置的文章數
+
+        包含：relevance_score 或 structured_data 缺漏、structured_data 不是合法 JSON 物件、
+        欄位型別不符合回應格式（文字欄位須為字串、數字或 null，銀行須為陣列），
+        以及重試次數已用完仍未分析成功的文章；模型合法回傳的空物件 '{}' 不會被重置
+        """
+        if not self.conn:
+            self.connect()
+            
+        field_checks = " OR ".join(
+            f"json_type(structured_data, '$.\"{field}\"') NOT IN ('text', 'integer', 'real', 'null')"
+            for field in STRUCTURED_TEXT_FIELDS
+        )
+        try:
+            with self.conn:
+                cursor = self.conn.execute(f"""
+                    UPDATE {TABLE_NAME} 
+                    SET analyzed_at = NULL, relevance_score = NULL, structured_data = NULL, 
+                        analysis_attempts = 0, analysis_error = NULL 
+                    WHERE content IS NOT NULL 
+                    AND (
+                        (analyzed_at IS NOT NULL AND (
+                            relevance_score IS NULL 
+                            OR structured_data IS NULL 
+                            -- CASE 保證不合法的 JSON 不會傳入 json_type（否則會拋出錯誤）
+                            OR CASE WHEN json_valid(structured_data) THEN (
+                                json_type(structured_data) != 'object' 
+                                OR {field_checks} 
+                                OR json_type(structured_data, '$."{STRUCTURED_LIST_FIELD}"') NOT IN ('array', 'null')
+                            ) ELSE 1 END
+                        ))
+                        OR (analyzed_at IS NULL AND COALESCE(analysis_attempts, 0) >= ?)
+                    )
+                """, (MAX_ANALYSIS_ATTEMPTS,))
+            logger.info(f"已將 {cursor.rowcount} 篇分析結果無效的文章重新排入分析")
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error(f"重置無效分析結果失敗: {e}")
+            return 0
+    
+    def get_token_usage_summary(self, since=None):
+        """依模型、prompt 版本與分析模式彙總 token 用量
+
+        回傳 (analysis_model, prompt_version, analysis_mode, 文章數,
+              prompt_tokens, cached_tokens, completion_tokens, 命中快取的文章數) 的列表
+        """
+        if not self.conn:
+            self.connect()
+            
+        try:
+            query = f"""
+                SELECT analysis_model, prompt_version, analysis_mode, COUNT(*), 
+                       COALESCE(SUM(prompt_tokens), 0), 
+                       COALESCE(SUM(cached_tokens), 0), 
+                       COALESCE(SUM(completion_tokens), 0), 
+                       COALESCE(SUM(cached_tokens > 0), 0) 
+                FROM {TABLE_NAME} 
+                WHERE prompt_tokens IS NOT NULL
+            """
+            params = []
+            if since:
+                query += " AND analyzed_at >= ?"
+                params.append(since)
+            query += " GROUP BY analysis_model, prompt_version, analysis_mode ORDER BY analysis_model, prompt_version"
+            self.cursor.execute(query, params)
+            return self.cursor.fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"彙總 token 用量失敗: {e}")
+            return []
+    
+    def get_posts_for_batch(self):
+        """獲取尚未分析、且不在進行中批次內的文章"""
+        if not self.conn:
+            self.connect()
+            
+        try:
+            placeholders = ", ".join("?" for _ in BATCH_TERMINAL_STATUSES)
+            self.cursor.execute(f"""
+                SELECT id, title, {CONTENT_SQL} 
                 FROM {TABLE_NAME} 
                 WHERE analyzed_at IS NULL
                 AND content IS NOT NULL
-            """)
+                AND COALESCE(analysis_attempts, 0) < ?
+                AND id NOT IN (
+                    SELECT i.post_id 
+                    FROM {BATCH_ITEMS_TABLE_NAME} i
+                    JOIN {BATCH_TABLE_NAME} b ON b.batch_id = i.batch_id
+                    WHERE b.status NOT IN ({placeholders})
+                )
+                AND id NOT IN (SELECT post_id FROM {LEASE_TABLE_NAME} WHERE expires_at > ?)
+            """, (MAX_ANALYSIS_ATTEMPTS, *BATCH_TERMINAL_STATUSES, time.time()))
             return self.cursor.fetchall()
         except sqlite3.Error as e:
-            logger.error(f"獲取待分析文章失敗: {e}")
+            logger.error(f"獲取待批次分析文章失敗: {e}")
             return []
     
-    def update_post_analysis(self, post_id, relevance_score, structured_data):
-        """更新文章的分析結果"""
+    def record_batch(self, batch_id, input_file, status, post_ids):
+        """記錄已提交的批次及其包含的文章"""
         if not self.conn:
             self.connect()
             
         try:
             current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            with self.conn:
+                self.conn.execute(
+                    f"""
+                    INSERT INTO {BATCH_TABLE_NAME} (batch_id, input_file, status, request_count, created_at) 
+                    VALUES (?, ?, ?, ?, ?)
+                    """,
+                    (batch_id, input_file, status, len(post_ids), current_time)
+                )
+                self.conn.executemany(
+                    f"INSERT OR IGNORE INTO {BATCH_ITEMS_TABLE_NAME} (batch_id, post_id) VALUES (?, ?)",
+                    [(batch_id, post_id) for post_id in post_ids]
+                )
+            logger.info(f"已記錄批次 {batch_id}，共 {len(post_ids)} 篇文章")
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"記錄批次失敗: {e}")
+            return False
+    
+    def get_batch_post_ids(self, batch_id):
+        """獲取批次中包含的文章 ID"""
+        if not self.conn:
+            self.connect()
+            
+        try:
+            self.cursor.execute(
+                f"SELECT post_id FROM {BATCH_ITEMS_TABLE_NAME} WHERE batch_id = ?",
+                (batch_id,)
+            )
+            return [row[0] for row in self.cursor.fetchall()]
+        except sqlite3.Error as e:
+            logger.error(f"獲取批次文章失敗: {e}")
+            return []
+    
+    def get_open_batches(self):
+        """獲取尚未結束的批次 (batch_id, status, output_file_id)"""
+        if not self.conn:
+            self.connect()
+            
+        try:
+            placeholders = ", ".join("?" for _ in BATCH_TERMINAL_STATUSES)
+            self.cursor.execute(f"""
+                SELECT batch_id, status, output_file_id 
+                FROM {BATCH_TABLE_NAME} 
+                WHERE status NOT IN ({placeholders})
+                ORDER BY created_at
+            """, BATCH_TERMINAL_STATUSES)
+            return self.cursor.fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"獲取進行中批次失敗: {e}")
+            return []
+    
+    def update_batch_status(self, batch_id, status, output_file_id=None):
+        """更新批次狀態"""
+        if not self.conn:
+            self.connect()
+            
+        try:
+            completed_at = None
+            if status in BATCH_TERMINAL_STATUSES:
+                completed_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             self.cursor.execute(
                 f"""
-                UPDATE {TABLE_NAME} 
-                SET relevance_score = ?, structured_data = ?, analyzed_at = ? 
-                WHERE id = ?
+                UPDATE {BATCH_TABLE_NAME} 
+                SET status = ?, 
+                    output_file_id = COALESCE(?, output_file_id), 
+                    completed_at = COALESCE(?, completed_at) 
+                WHERE batch_id = ?
                 """,
-                (relevance_score, structured_data, current_time, post_id)
+                (status, output_file_id, completed_at, batch_id)
             )
             self.conn.commit()
-            logger.info(f"已更新文章ID {post_id} 的分析結果")
+            logger.info(f"批次 {batch_id} 狀態更新為: {status}")
             return True
         except sqlite3.Error as e:
-            logger.error(f"更新文章分析結果失敗: {e}")
+            logger.error(f"更新批次狀態失敗: {e}")
             return False
     
+    def get_post_metadata(self, dcard_ids):
+        """依 Dcard 文章 ID 查詢已儲存的中繼資料，回傳 {dcard_id: {post_id, 及 POST_METADATA_COLUMNS 各欄位}}"""
+        if not self.conn:
+            self.connect()
+            
+        dcard_ids = [dcard_id for dcard_id in dcard_ids if dcard_id is not None]
+        if not dcard_ids:
+            return {}
+        try:
+            placeholders = ", ".join("?" for _ in dcard_ids)
+            self.cursor.execute(f"""
+                SELECT dcard_id, id, {', '.join(POST_METADATA_COLUMNS)} 
+                FROM {TABLE_NAME} 
+                WHERE dcard_id IN ({placeholders})
+            """, dcard_ids)
+            return {
+                row[0]: dict(zip(("post_id", *POST_METADATA_COLUMNS), row[1:]))
+                for row in self.cursor.fetchall()
+            }
+        except sqlite3.Error as e:
+            logger.error(f"獲取文章中繼資料失敗: {e}")
+            return {}
+    
+    def get_oldest_dcard_id(self):
+        """回傳資料庫中最舊（最小）的 Dcard 文章 ID，沒有時回傳 None"""
+        if not self.conn:
+            self.connect()
+            
+        try:
+            self.cursor.execute(f"SELECT MIN(dcard_id) FROM {TABLE_NAME}")
+            return self.cursor.fetchone()[0]
+        except sqlite3.Error as e:
+            logger.error(f"獲取最舊文章 ID 失敗: {e}")
+            return None
+    
+    def update_list_metadata(self, rows):
+        """批次更新文章列表上的中繼資料
+
+        rows: (dcard_id, dcard_updated_at, dcard_comment_count, dcard_like_count) 列表
+        """
+        if not self.conn:
+            self.connect()
+            
+        if not rows:
+            return True
+        try:
+            current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            with self.conn:
+                self.conn.executemany(
+                    f"""UPDATE {TABLE_NAME} 
+                        SET dcard_updated_at = ?, dcard_comment_count = ?, dcard_like_count = ?, refreshed_at = ? 
+                        WHERE dcard_id = ?""",
+                    [(updated_at, comment_count, like_count, current_time, dcard_id)
+                     for dcard_id, updated_at, comment_count, like_count in rows]
+                )
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"更新文章中繼資料失敗: {e}")
+            return False
+    
+    def update_post_content(self, post_id, title, content, metadata=None):
+        """以重新抓取的內容更新文章
+
+        標題與內容都沒有變化時只更新中繼資料並回傳 False；
+        有變化時更新內容、清除分析結果讓文章重新排入分析，並回傳 True
+        """
+        if not self.conn:
+            self.connect()
+            
+        metadata = {column: value for column, value in (metadata or {}).items() if column in POST_METADATA_COLUMNS}
+        metadata["refreshed_at"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        assignments = ", ".join(f"{column} = ?" for column in metadata)
+        try:
+            self.cursor.execute(f"SELECT title, {CONTENT_SQL} FROM {TABLE_NAME} WHERE id = ?", (post_id,))
+            row = self.cursor.fetchone()
+            if row is None:
+                return False
+            if row[0] == title and row[1] == content:
+                with self.conn:
+                    self.conn.execute(f"UPDATE {TABLE_NAME} SET {assignments} WHERE id = ?", (*metadata.values(), post_id))
+                return False
+                
+            stored_content, dict_version = content, None
+            if CONTENT_COMPRESSION:
+                stored_content, dict_version = self.codec.compress(content)
+            if row[0] != title:
+                self.cursor.execute(f"SELECT 1 FROM {TABLE_NAME} WHERE title = ? AND id != ?", (title, post_id))
+                if self.cursor.fetchone():
+                    logger.warning(f"編輯後的標題與其他文章重複，保留原標題: {title}")
+                    title = row[0]
+            with self.conn:
+                self.conn.execute(
+                    f"""UPDATE {TABLE_NAME} 
+                        SET title = ?, content = ?, content_dict_version = ?, {assignments} 
+                        WHERE id = ?""",
+                    (title, stored_content, dict_version, *metadata.values(), post_id)
+                )
+            self.requeue_posts_for_analysis([post_id])
+            logger.info(f"文章已更新: {title}")
+            for callback in self.update_listeners:
+                try:
+                    callback(post_id, title, content)
+                except Exception as e:
+                    logger.error(f"更新文章回呼失敗: {e}")
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"更新文章內容失敗: {e}")
+            return False
+    
+    def requeue_posts_for_analysis(self, post_ids):
+        """清除指定文章的分析結果與嘗試次數，讓文章重新排入分析，回傳重新排入的文章數"""
+        if not self.conn:
+            self.connect()
+            
+        if not post_ids:
+            return 0
+        try:
+            with self.conn:
+                cursor = self.conn.executemany(
+                    f"""UPDATE {TABLE_NAME} 
+                        SET analyzed_at = NULL, relevance_score = NULL, structured_data = NULL, 
+                            analysis_attempts = 0, analysis_error = NULL 
+                        WHERE id = ?""",
+                    [(post_id,) for post_id in post_ids]
+                )
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error(f"重新排入分析失敗: {e}")
+            return 0
+    
+    def defer_posts(self, entries, reason, failed=False):
+        """將尚未抓取內容的文章放入延後佇列，已在佇列中的文章更新分數與列表資料
+
+        entries: (dcard_id, 分數, 文章列表上的資料 dict) 列表
+        reason: 延後原因（'low_score'、'budget'、'failed'）
+        failed: 為 True 時累加抓取失敗次數
+        """
+        if not self.conn:
+            self.connect()
+            
+        entries = [entry for entry in entries if entry[0] is not None]
+        if not entries:
+            return 0
+        try:
+            current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            attempts = 1 if failed else 0
+            with self.conn:
+                cursor = self.conn.executemany(
+                    f"""INSERT INTO {DEFERRED_TABLE_NAME} 
+                        (dcard_id, score, list_data, reason, attempts, deferred_at) 
+                        VALUES (?, ?, ?, ?, ?, ?) 
+                        ON CONFLICT(dcard_id) DO UPDATE SET 
+                            score = excluded.score, list_data = excluded.list_data, reason = excluded.reason, 
+                            attempts = attempts + excluded.attempts""",
+                    [(dcard_id, score, json.dumps(post, ensure_ascii=False), reason, attempts, current_time)
+                     for dcard_id, score, post in entries]
+                )
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error(f"放入延後佇列失敗: {e}")
+            return 0
+    
+    def get_deferred_posts(self, limit, min_score=None, max_attempts=DEFERRED_MAX_ATTEMPTS):
+        """依分數由高到低讀取延後佇列中尚未儲存的文章，回傳 [(dcard_id, 分數, 文章列表上的資料 dict), ...]"""
+        if not self.conn:
+            self.connect()
+            
+        try:
+            conditions = ["attempts < ?"]
+            params = [max_attempts]
+            if min_score is not None:
+                conditions.append("score >= ?")
+                params.append(min_score)
+            self.cursor.execute(f"""
+                SELECT d.dcard_id, d.score, d.list_data 
+                FROM {DEFERRED_TABLE_NAME} d 
+                WHERE {' AND '.join(conditions)} 
+                  AND NOT EXISTS (SELECT 1 FROM {TABLE_NAME} p WHERE p.dcard_id = d.dcard_id) 
+                ORDER BY d.score DESC 
+                LIMIT ?
+            """, (*params, limit))
+            return [(dcard_id, score, json.loads(list_data)) for dcard_id, score, list_data in self.cursor.fetchall()]
+        except (sqlite3.Error, ValueError) as e:
+            logger.error(f"讀取延後佇列失敗: {e}")
+            return []
+    
+    def remove_deferred_posts(self, dcard_ids):
+        """從延後佇列移除已抓取的文章"""
+        if not self.conn:
+            self.connect()
+            
+        dcard_ids = [dcard_id for dcard_id in dcard_ids if dcard_id is not None]
+        if not dcard_ids:
+            return 0
+        try:
+            with self.conn:
+                cursor = self.conn.executemany(
+                    f"DELETE FROM {DEFERRED_TABLE_NAME} WHERE dcard_id = ?", [(dcard_id,) for dcard_id in dcard_ids]
+                )
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error(f"移除延後佇列文章失敗: {e}")
+            return 0
+    
+    def purge_deferred_posts(self, max_age_days, max_attempts=DEFERRED_MAX_ATTEMPTS):
+        """移除延後過久、失敗次數過多或已儲存的文章，回傳移除的文章數"""
+        if not self.conn:
+            self.connect()
+            
+        try:
+            cutoff = (datetime.now() - timedelta(days=max_age_days)).strftime('%Y-%m-%d %H:%M:%S')
+            with self.conn:
+                cursor = self.conn.execute(f"""
+                    DELETE FROM {DEFERRED_TABLE_NAME} 
+                    WHERE deferred_at < ? OR attempts >= ? 
+                       OR dcard_id IN (SELECT dcard_id FROM {TABLE_NAME} WHERE dcard_id IS NOT NULL)
+                """, (cutoff, max_attempts))
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error(f"清理延後佇列失敗: {e}")
+            return 0
+    
+    def get_deferred_summary(self):
+        """依延後原因統計佇列中的文章數與最高分數，回傳 [(原因, 文章數, 最高分數), ...]"""
+        if not self.conn:
+            self.connect()
+            
+        try:
+            self.cursor.execute(f"""
+                SELECT reason, COUNT(*), MAX(score) 
+                FROM {DEFERRED_TABLE_NAME} 
+                GROUP BY reason 
+                ORDER BY reason
+            """)
+            return self.cursor.fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"統計延後佇列失敗: {e}")
+            return []
+    
+    def get_comment_cursors(self, dcard_ids):
+        """依 Dcard 文章 ID 查詢本地文章 ID 與留言游標，回傳 {dcard_id: (post_id, comment_cursor)}"""
+        if not self.conn:
+            self.connect()
+            
+        dcard_ids = [dcard_id for dcard_id in dcard_ids if dcard_id is not None]
+        if not dcard_ids:
+            return {}
+        try:
+            placeholders = ", ".join("?" for _ in dcard_ids)
+            self.cursor.execute(f"""
+                SELECT dcard_id, id, COALESCE(comment_cursor, 0) 
+                FROM {TABLE_NAME} 
+                WHERE dcard_id IN ({placeholders})
+            """, dcard_ids)
+            return {dcard_id: (post_id, cursor) for dcard_id, post_id, cursor in self.cursor.fetchall()}
+        except sqlite3.Error as e:
+            logger.error(f"獲取留言游標失敗: {e}")
+            return {}
+    
+    def save_comments(self, post_id, comments, comment_cursor):
+        """在同一個交易中寫入留言並更新留言游標
+
+        comments: (comment_id, floor, content, like_count, created_at) 列表，已存在的留言會略過
+        """
+        if not self.conn:
+            self.connect()
+            
+        try:
+            with self.conn:
+                cursor = self.conn.executemany(
+                    f"""INSERT OR IGNORE INTO {COMMENT_TABLE_NAME} 
+                        (comment_id, post_id, floor, content, like_count, created_at) 
+                        VALUES (?, ?, ?, ?, ?, ?)""",
+                    [(comment_id, post_id, floor, content, like_count, created_at)
+                     for comment_id, floor, content, like_count, created_at in comments]
+                )
+                self.conn.execute(
+                    f"UPDATE {TABLE_NAME} SET comment_cursor = MAX(COALESCE(comment_cursor, 0), ?) WHERE id = ?",
+                    (comment_cursor, post_id)
+                )
+            logger.info(f"文章 {post_id} 新增 {cursor.rowcount} 則留言，游標更新至 B{comment_cursor}")
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"儲存留言失敗: {e}")
+            return False
+    
+    def get_post_comments(self, post_ids, limit_per_post):
+        """依樓層順序讀取多篇文章的前 limit_per_post 則留言，回傳 {post_id: [(floor, content), ...]}"""
+        if not self.conn:
+            self.connect()
+            
+        if not post_ids:
+            return {}
+        try:
+            placeholders = ", ".join("?" for _ in post_ids)
+            self.cursor.execute(f"""
+                SELECT post_id, floor, content 
+                FROM (
+                    SELECT post_id, floor, content, 
+                           ROW_NUMBER() OVER (PARTITION BY post_id ORDER BY floor) AS position 
+                    FROM {COMMENT_TABLE_NAME} 
+                    WHERE post_id IN ({placeholders}) 
+                    AND content IS NOT NULL AND content != ''
+                ) 
+                WHERE position <= ? 
+                ORDER BY post_id, floor
+            """, (*post_ids, limit_per_post))
+            comments = {}
+            for post_id, floor, content in self.cursor.fetchall():
+                comments.setdefault(post_id, []).append((floor, content))
+            return comments
+        except sqlite3.Error as e:
+            logger.error(f"獲取留言失敗: {e}")
+            return {}
+    
+    def iter_posts(self, batch_size=5000):
+        """依 id 順序分批讀取所有文章的 (id, title, content)，壓縮的內容在實際使用時才解壓"""
+        if not self.conn:
+            self.connect()
+            
+        # 使用獨立的 cursor，避免與其他查詢互相干擾
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f"SELECT id, title, content, content_dict_version FROM {TABLE_NAME} ORDER BY id")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [(post_id, title, self.codec.lazy(content, version)) for post_id, title, content, version in rows]
+        except sqlite3.Error as e:
+            logger.error(f"讀取文章失敗: {e}")
+            raise
+        finally:
+            cursor.close()
+    
+    def get_post_ids_refreshed_since(self, since):
+        """獲取在指定時間（含）之後重新抓取過的文章ID"""
+        if not self.conn:
+            self.connect()
+            
+        try:
+            self.cursor.execute(f"SELECT id FROM {TABLE_NAME} WHERE refreshed_at >= ? ORDER BY id", (since,))
+            return [row[0] for row in self.cursor.fetchall()]
+        except sqlite3.Error as e:
+            logger.error(f"獲取重新抓取的文章失敗: {e}")
+            return []
+    
+    def get_post_text(self, post_id):
+        """獲取單篇文章的 (title, content)，不存在時回傳 None"""
+        if not self.conn:
+            self.connect()
+            
+        try:
+            self.cursor.execute(f"SELECT title, content, content_dict_version FROM {TABLE_NAME} WHERE id = ?", (post_id,))
+            row = self.cursor.fetchone()
+            if row is None:
+                return None
+            return row[0], self.codec.lazy(row[1], row[2])
+        except sqlite3.Error as e:
+            logger.error(f"獲取文章失敗: {e}")
+            return None
+    
+    def iter_analyzed_posts(self, since=None, batch_size=5000):
+        """依 change_seq 順序分批讀取已分析文章，結構化欄位在 SQL 中直接攤平
+
+        since: 可選，change_seq 水位，只回傳分析結果在此水位之後變動過的文章
+        （完整讀取時 change_seq 為 NULL 的舊資料排在最前面）
+        每批回傳 tuple 列表，欄位依序為 id, title, content, post_date, post_month,
+        created_at, analyzed_at, relevance_score, prompt_version, analysis_model,
+        房貸金額, 房貸利率, 貸款年限, 貸款成數, 月付金額, 提到的銀行（以 \x1f 分隔）, change_seq
+        """
+        if not self.conn:
+            self.connect()
+            
+        query = f"""
+            SELECT id, title, {CONTENT_SQL}, post_date, SUBSTR(NULLIF(post_date, ''), 1, 7), 
+                   created_at, analyzed_at, relevance_score, prompt_version, analysis_model, 
+                   json_extract(structured_data, '$."房貸金額"'), 
+                   json_extract(structured_data, '$."房貸利率"'), 
+                   json_extract(structured_data, '$."貸款年限"'), 
+                   json_extract(structured_data, '$."貸款成數"'), 
+                   json_extract(structured_data, '$."月付金額"'), 
+                   (SELECT GROUP_CONCAT(value, CHAR(31)) 
+                    FROM json_each(structured_data, '$."提到的銀行"')), 
+                   change_seq 
+            FROM {TABLE_NAME} 
+            WHERE analyzed_at IS NOT NULL 
+            AND json_valid(structured_data)
+        """
+        params = []
+        if since is not None:
+            query += " AND change_seq > ?"
+            params.append(since)
+        query += " ORDER BY change_seq, id"
+        
+        # 使用獨立的 cursor，避免與其他查詢互相干擾
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        except sqlite3.Error as e:
+            logger.error(f"讀取已分析文章失敗: {e}")
+            raise
+        finally:
+            cursor.close()
+    
+    def load_content_dictionaries(self):
+        """載入所有版本的壓縮字典（字典資料表尚未建立時略過）"""
+        if not self.codec.available:
+            return
+        self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (DICTIONARY_TABLE_NAME,))
+        if not self.cursor.fetchone():
+            return
+        self.cursor.execute(f"SELECT version, dict_data FROM {DICTIONARY_TABLE_NAME} ORDER BY version")
+        for version, dict_data in self.cursor.fetchall():
+            self.codec.add_dictionary(version, dict_data)
+    
+    def load_content_dictionary(self, version):
+        """載入單一版本的壓縮字典（例如其他程序在連線之後才訓練的字典），回傳是否找到"""
+        if not self.conn or not self.codec.available:
+            return False
+        try:
+            row = self.conn.execute(
+                f"SELECT dict_data FROM {DICTIONARY_TABLE_NAME} WHERE version = ?", (version,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"載入壓縮字典失敗: {e}")
+            return False
+        if row is None:
+            return False
+        self.codec.add_dictionary(version, row[0])
+        return True
+    
+    def train_content_dictionary(self, sample_size=ZSTD_DICT_SAMPLES):
+        """隨機抽樣文章內容訓練新版本的壓縮字典，回傳新的字典版本（失敗時回傳 None）"""
+        if not self.conn:
+            self.connect()
+            
+        try:
+            self.cursor.execute(f"""
+                SELECT {CONTENT_SQL} FROM {TABLE_NAME} 
+                WHERE content IS NOT NULL AND content != '' 
+                ORDER BY RANDOM() LIMIT ?
+            """, (sample_size,))
+            samples = [row[0] for row in self.cursor.fetchall()]
+            if len(samples) < 10:
+                logger.error(f"文章數量不足，無法訓練壓縮字典（僅 {len(samples)} 篇）")
+                return None
+            dict_data = train_dictionary(samples)
+            with self.conn:
+                cursor = self.conn.execute(
+                    f"INSERT INTO {DICTIONARY_TABLE_NAME} (dict_data, sample_count, created_at) VALUES (?, ?, ?)",
+                    (dict_data, len(samples), datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+                )
+            version = cursor.lastrowid
+            self.codec.add_dictionary(version, dict_data)
+            logger.info(f"已以 {len(samples)} 篇文章訓練壓縮字典版本 {version}（{len(dict_data)} bytes）")
+            return version
+        except (sqlite3.Error, RuntimeError) as e:
+            logger.error(f"訓練壓縮字典失敗: {e}")
+            return None
+    
+    def compress_contents(self, batch_size=1000):
+        """以最新版本的字典壓縮（或重新壓縮）尚未使用該版本的文章內容，回傳處理的文章數"""
+        if not self.conn:
+            self.connect()
+            
+        if not self.codec.can_compress:
+            logger.error("沒有可用的壓縮字典（需安裝 zstandard 並先訓練字典）")
+            return 0
+        return self._rewrite_contents(
+            "content_dict_version IS NOT ? AND content IS NOT NULL AND content != ''",
+            (self.codec.active_version,), self.codec.compress, batch_size
+        )
+    
+    def decompress_contents(self, batch_size=1000):
+        """將所有壓縮的文章內容還原為 TEXT，回傳處理的文章數"""
+        if not self.conn:
+            self.connect()
+            
+        return self._rewrite_contents("content_dict_version IS NOT NULL", (), lambda text: (text, None), batch_size)
+    
+    def _rewrite_contents(self, condition, params, encode, batch_size):
+        """依 id 順序分批改寫符合條件的文章內容，每批在一個交易中完成"""
+        total = 0
+        last_id = 0
+        try:
+            while True:
+                self.cursor.execute(f"""
+                    SELECT id, {CONTENT_SQL} FROM {TABLE_NAME} 
+                    WHERE id > ? AND {condition} 
+                    ORDER BY id LIMIT ?
+                """, (last_id, *params, batch_size))
+                rows = self.cursor.fetchall()
+                if not rows:
+                    break
+                with self.conn:
+                    self.conn.executemany(
+                        f"UPDATE {TABLE_NAME} SET content = ?, content_dict_version = ? WHERE id = ?",
+                        [(*encode(text), post_id) for post_id, text in rows]
+                    )
+                total += len(rows)
+                last_id = rows[-1][0]
+                logger.info(f"已改寫 {total} 篇文章內容")
+            return total
+        except sqlite3.Error as e:
+            logger.error(f"改寫文章內容失敗: {e}")
+            return total
+    
+    def get_content_storage_stats(self):
+        """依字典版本統計文章數、內容儲存大小與原始大小（bytes），回傳 [(版本, 文章數, 儲存大小, 原始大小)]"""
+        if not self.conn:
+            self.connect()
+            
+        try:
+            self.cursor.execute(f"""
+                SELECT content_dict_version, COUNT(*), 
+                       SUM(LENGTH(CAST(content AS BLOB))), 
+                       SUM(LENGTH(CAST({CONTENT_SQL} AS BLOB))) 
+                FROM {TABLE_NAME} 
+                GROUP BY content_dict_version 
+                ORDER BY content_dict_version
+            """)
+            return self.cursor.fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"統計內容儲存大小失敗: {e}")
+            return []
+    
     def close(self):
         """關閉資料庫連接"""
         if self.conn:
             self.conn.close()
+            self.conn = None
             logger.info("資料庫連接已關閉")
 
 # 測試程式碼
 if __name__ == "__main__":
+    from utils.logging_config import setup_logging
+    setup_logging('database')
     db = DatabaseManager()
     db.connect()
     db.initialize_db()
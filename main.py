@@ -1,9 +1,17 @@
 #!/usr/bin/env python
 """
 Dcard爬蟲主程式入口
+- 只在執行需要的模式時才載入對應的子系統（selenium、requests、openai 等）
+- 環境驗證結果會快取，套件版本未變且未過期時不再重複測試資料庫連接
+- 每次執行的啟動時間記錄於 logs/startup_times.jsonl，可用 --startup-stats 查看
 """
+import time
+
+_START_TIME = time.perf_counter()
+
 import os
 import sys
+import json
 import logging
 import argparse
 from datetime import datetime
@@ -11,74 +19,253 @@ from datetime import datetime
 # 將專案根目錄加入系統路徑
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from crawler.dcard_crawler import DcardCrawler
-from database.db_manager import DatabaseManager
-from analysis.gpt_analyzer import GPTAnalyzer
-from utils.helpers import ensure_directory, create_backup
-
-# 設定日誌目錄
-log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
-ensure_directory(log_dir)
-
-# 設定日誌
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(log_dir, f'main_{datetime.now().strftime("%Y%m%d")}.log')),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+from config.settings import ENV_CHECK_TTL
+from utils.helpers import ensure_directory
+from utils.logging_config import setup_logging, LOG_DIR
+
 logger = logging.getLogger(__name__)
 
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+ENV_CHECK_CACHE_PATH = os.path.join(LOG_DIR, '.env_check.json')
+STARTUP_LOG_PATH = os.path.join(LOG_DIR, 'startup_times.jsonl')
+
+# 子系統準備完成（開始實際工作）的時間點，用於計算啟動時間
+_ready_time = None
+
 def parse_arguments():
     """解析命令列參數"""
     parser = argparse.ArgumentParser(description='Dcard房屋版爬蟲')
     parser.add_argument('--backup', action='store_true', help='在執行前備份資料庫')
-    parser.add_argument('--only-verify', action='store_true', help='只驗證環境不執行爬蟲')
+    parser.add_argument('--only-verify', action='store_true', help='只驗證環境不執行爬蟲（不使用快取的驗證結果）')
     parser.add_argument('--forum', type=str, default='house_purchase', help='指定要爬取的Dcard版面')
     parser.add_argument('--limit', type=int, default=100, help='爬取的文章數量限制')
     parser.add_argument('--analyze', action='store_true', help='執行 GPT 分析')
     parser.add_argument('--only-analyze', action='store_true', help='只執行 GPT 分析，不爬取新文章')
     parser.add_argument('--api-key', type=str, help='OpenAI API 金鑰')
     parser.add_argument('--gpt-model', type=str, default='gpt-3.5-turbo', help='使用的 GPT 模型')
+    parser.add_argument('--batch', action='store_true', help='使用 Batch API 離線分析（適合大量待分析文章）')
+    parser.add_argument('--batch-no-wait', action='store_true', help='批次模式下只提交/查詢一次批次，不等待完成')
+    parser.add_argument('--batch-stub', action='store_true', help='批次模式使用本地模擬客戶端（測試用，不呼叫 API）')
+    parser.add_argument('--reanalyze', action='store_true', help='將分析結果為空或不合法的文章重新排入佇列並重新分析（不爬取新文章）')
+    parser.add_argument('--startup-stats', action='store_true', help='顯示各模式的啟動時間統計後結束')
+    parser.add_argument('--refresh', action='store_true', help='更新模式：只重新抓取已儲存且被編輯過的文章（加上 --analyze 時接著分析）')
+    parser.add_argument('--drain-deferred', action='store_true', help='排空延後佇列：依分數抓取先前延後的低優先文章（建議離峰時段執行，加上 --analyze 時接著分析）')
+    parser.add_argument('--daemon', action='store_true', help='常駐模式：依間隔週期執行爬蟲（加上 --analyze 時同時執行分析），收到 SIGTERM 後停止')
+    parser.add_argument('--crawl-interval', type=int, help='常駐模式的爬蟲週期間隔（秒），預設為 DAEMON_CRAWL_INTERVAL')
+    parser.add_argument('--analyze-interval', type=int, help='常駐模式的分析週期間隔（秒），預設為 DAEMON_ANALYZE_INTERVAL')
     return parser.parse_args()
 
-def verify_environment():
-    """驗證運行環境"""
+def get_mode(args):
+    """依命令列參數決定執行模式"""
+    if args.startup_stats:
+        return 'startup-stats'
+    if args.only_verify:
+        return 'verify'
+    if args.daemon:
+        return 'daemon'
+    if args.reanalyze:
+        return 'reanalyze'
+    if args.only_analyze:
+        return 'analyze'
+    if args.refresh:
+        return 'refresh+analyze' if args.analyze else 'refresh'
+    if args.drain_deferred:
+        return 'drain+analyze' if args.analyze else 'drain'
+    if args.analyze:
+        return 'crawl+analyze'
+    return 'crawl'
+
+def required_packages(mode, args):
+    """各模式需要的套件（以發行名稱表示）"""
+    needs_openai = not (args.batch and args.batch_stub)
+    packages = []
+    if mode == 'daemon':
+        # 常駐模式：--only-analyze 時不爬蟲，--analyze / --only-analyze 時執行分析
+        if not args.only_analyze:
+            packages += ['requests', 'selenium']
+        if (args.analyze or args.only_analyze) and needs_openai:
+            packages.append('openai')
+        return packages
+    if mode in ('verify', 'crawl', 'crawl+analyze', 'refresh', 'refresh+analyze', 'drain', 'drain+analyze'):
+        packages += ['requests', 'selenium']
+    if mode == 'verify' or (
+        mode in ('analyze', 'reanalyze', 'crawl+analyze', 'refresh+analyze', 'drain+analyze') and needs_openai
+    ):
+        packages.append('openai')
+    return packages
+
+def verify_environment(packages, use_cache=True):
+    """驗證運行環境
+
+    以套件中繼資料取得版本（不需匯入套件本身）；若快取中的 Python 與套件版本相同、
+    資料庫檔案存在且未超過 ENV_CHECK_TTL，則沿用上次的驗證結果
+    """
+    from importlib import metadata
+
+    try:
+        versions = {package: metadata.version(package) for package in packages}
+    except metadata.PackageNotFoundError as e:
+        logger.error(f"缺少必要的套件: {e}")
+        return False
+
+    for package, version in versions.items():
+        logger.info(f"{package}版本: {version}")
+
+    db_path = os.path.join(PROJECT_ROOT, 'database', 'dcard_posts.sqlite')
+    if use_cache and os.path.exists(ENV_CHECK_CACHE_PATH) and os.path.exists(db_path):
+        try:
+            with open(ENV_CHECK_CACHE_PATH, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+            cached_versions = cache.get('packages', {})
+            if (
+                cache.get('python') == sys.version
+                and all(cached_versions.get(package) == version for package, version in versions.items())
+                and time.time() - cache.get('checked_at', 0) < ENV_CHECK_TTL
+            ):
+                logger.info("沿用快取的環境驗證結果")
+                return True
+        except (OSError, ValueError) as e:
+            logger.warning(f"讀取環境驗證快取失敗: {e}")
+
     try:
-        import requests
-        import openai
-        
-        logger.info(f"Requests版本: {requests.__version__}")
-        logger.info(f"OpenAI版本: {openai.__version__}")
-        
+        from database.db_manager import DatabaseManager
+
         # 檢查資料庫目錄
-        db_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database')
+        db_dir = os.path.join(PROJECT_ROOT, 'database')
         ensure_directory(db_dir)
-        
+
         # 嘗試初始化資料庫連接
         db = DatabaseManager()
-        if db.connect():
-            logger.info("資料庫連接測試成功")
-            db.close()
-            return True
-        else:
+        if not db.connect():
             logger.error("資料庫連接測試失敗")
             return False
-    except ImportError as e:
-        logger.error(f"缺少必要的套件: {e}")
-        return False
+        logger.info("資料庫連接測試成功")
+        db.close()
     except Exception as e:
         logger.error(f"環境驗證失敗: {e}")
         return False
 
-def run_analysis(api_key=None, model='gpt-3.5-turbo'):
+    # 合併先前驗證過的套件版本後寫入快取
+    cached_versions = {}
+    if os.path.exists(ENV_CHECK_CACHE_PATH):
+        try:
+            with open(ENV_CHECK_CACHE_PATH, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached.get('python') == sys.version:
+                cached_versions = cached.get('packages', {})
+        except (OSError, ValueError):
+            pass
+    cached_versions.update(versions)
+    try:
+        with open(ENV_CHECK_CACHE_PATH, 'w', encoding='utf-8') as f:
+            json.dump({'python': sys.version, 'packages': cached_versions, 'checked_at': time.time()}, f)
+    except OSError as e:
+        logger.warning(f"寫入環境驗證快取失敗: {e}")
+    return True
+
+def mark_ready():
+    """標記子系統已載入完成、開始實際工作"""
+    global _ready_time
+    if _ready_time is None:
+        _ready_time = time.perf_counter()
+
+def record_startup_time(mode, success):
+    """記錄本次執行的啟動時間與總執行時間"""
+    end_time = time.perf_counter()
+    ready_time = _ready_time or end_time
+    record = {
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'mode': mode,
+        'startup_ms': round((ready_time - _START_TIME) * 1000, 1),
+        'total_ms': round((end_time - _START_TIME) * 1000, 1),
+        'success': bool(success),
+    }
+    logger.info(f"啟動時間 ({mode}): {record['startup_ms']} ms，總執行時間: {record['total_ms']} ms")
+    try:
+        with open(STARTUP_LOG_PATH, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+    except OSError as e:
+        logger.warning(f"寫入啟動時間記錄失敗: {e}")
+
+def show_startup_stats():
+    """顯示各模式啟動時間的中位數與 P90"""
+    if not os.path.exists(STARTUP_LOG_PATH):
+        print("尚無啟動時間記錄")
+        return True
+
+    samples = {}
+    with open(STARTUP_LOG_PATH, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                samples.setdefault(record['mode'], []).append(record['startup_ms'])
+
+    print(f"{'模式':<16}{'次數':>6}{'中位數(ms)':>12}{'P90(ms)':>10}{'最近(ms)':>10}")
+    for mode, values in sorted(samples.items()):
+        ordered = sorted(values)
+        median = ordered[len(ordered) // 2]
+        p90 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))]
+        print(f"{mode:<16}{len(values):>6}{median:>12.1f}{p90:>10.1f}{values[-1]:>10.1f}")
+    return True
+
+def run_backup():
+    """以線上備份 API 建立壓縮備份並輪替舊備份"""
+    from utils.backup import BackupManager
+
+    db_path = os.path.join(PROJECT_ROOT, 'database', 'dcard_posts.sqlite')
+    if os.path.exists(db_path):
+        backup_path = BackupManager(db_path=db_path).create_backup()
+        if backup_path:
+            logger.info(f"資料庫備份成功: {backup_path}")
+        else:
+            logger.warning("資料庫備份失敗")
+
+def run_crawl(task='crawl'):
+    """執行爬蟲
+
+    task: 'crawl' 依優先分數抓取新文章、'refresh' 只更新已儲存且被編輯過的文章、
+    'drain' 排空延後佇列
+    """
+    try:
+        from crawler.dcard_crawler import DcardCrawler
+
+        logger.info({'refresh': "開始更新任務", 'drain': "開始排空延後佇列"}.get(task, "開始爬蟲任務"))
+        crawler = DcardCrawler()
+        mark_ready()
+        if task == 'refresh':
+            crawl_success = crawler.refresh()
+        elif task == 'drain':
+            crawl_success = crawler.drain_deferred()
+        else:
+            crawl_success = crawler.crawl()
+
+        if crawl_success:
+            logger.info("爬蟲任務完成")
+        else:
+            logger.error("爬蟲任務失敗")
+        return crawl_success
+    except Exception as e:
+        logger.error(f"爬蟲過程中發生錯誤: {e}")
+        return False
+
+def run_analysis(api_key=None, model='gpt-3.5-turbo', batch=False, batch_wait=True, batch_stub=False):
     """執行 GPT 分析"""
     logger.info("開始執行 GPT 分析")
     try:
-        analyzer = GPTAnalyzer(api_key=api_key, model=model)
-        result = analyzer.analyze_posts()
+        from analysis.gpt_analyzer import GPTAnalyzer
+
+        if batch:
+            client = None
+            if batch_stub:
+                from analysis.batch_stub import LocalBatchClient
+                client = LocalBatchClient()
+            analyzer = GPTAnalyzer(api_key=api_key, model=model, client=client)
+            mark_ready()
+            result = analyzer.analyze_posts_batch(wait=batch_wait)
+        else:
+            analyzer = GPTAnalyzer(api_key=api_key, model=model)
+            mark_ready()
+            result = analyzer.analyze_posts()
         if result:
             logger.info("GPT 分析任務完成")
             return True
@@ -89,60 +276,111 @@ def run_analysis(api_key=None, model='gpt-3.5-turbo'):
         logger.error(f"GPT 分析過程中發生錯誤: {e}")
         return False
 
+def run_reanalysis(args):
+    """將分析結果無效的文章重新排入佇列並重新分析"""
+    from database.db_manager import DatabaseManager
+
+    db = DatabaseManager()
+    db.connect()
+    db.initialize_db()
+    reset_count = db.reset_invalid_analyses()
+    db.close()
+    logger.info(f"共 {reset_count} 篇文章需要重新分析")
+    if reset_count == 0:
+        mark_ready()
+        return True
+    return run_analysis(api_key=args.api_key, model=args.gpt_model, batch=args.batch,
+                        batch_wait=not args.batch_no_wait, batch_stub=args.batch_stub)
+
+def run_daemon(args):
+    """常駐模式：建立一次爬蟲、分析器與資料庫連線，之後依間隔週期執行"""
+    from config.settings import DAEMON_CRAWL_INTERVAL, DAEMON_ANALYZE_INTERVAL
+    from database.db_manager import DatabaseManager
+    from utils.daemon import CrawlerDaemon
+
+    db = DatabaseManager()
+    if not db.connect():
+        return False
+    db.initialize_db()
+
+    crawler = None
+    if not args.only_analyze:
+        from crawler.dcard_crawler import DcardCrawler
+        crawler = DcardCrawler(db=db)
+
+    analyzer = None
+    if args.analyze or args.only_analyze:
+        from analysis.gpt_analyzer import GPTAnalyzer
+        client = None
+        if args.batch and args.batch_stub:
+            from analysis.batch_stub import LocalBatchClient
+            client = LocalBatchClient()
+        analyzer = GPTAnalyzer(api_key=args.api_key, model=args.gpt_model, client=client, db=db)
+
+    daemon = CrawlerDaemon(
+        db, crawler=crawler, analyzer=analyzer, batch=args.batch,
+        crawl_interval=args.crawl_interval or DAEMON_CRAWL_INTERVAL,
+        analyze_interval=args.analyze_interval or DAEMON_ANALYZE_INTERVAL,
+    )
+    mark_ready()
+    return daemon.run()
+
+def run_mode(mode, args):
+    """執行指定模式"""
+    analysis_options = dict(api_key=args.api_key, model=args.gpt_model, batch=args.batch,
+                            batch_wait=not args.batch_no_wait, batch_stub=args.batch_stub)
+
+    if mode == 'verify':
+        mark_ready()
+        logger.info("僅執行環境驗證，程式結束")
+        return True
+
+    # 如果需要備份，創建備份
+    if args.backup:
+        run_backup()
+
+    if mode == 'reanalyze':
+        return run_reanalysis(args)
+
+    if mode == 'daemon':
+        return run_daemon(args)
+
+    # 如果只執行分析，則跳過爬蟲
+    if mode == 'analyze':
+        return run_analysis(**analysis_options)
+
+    crawl_success = run_crawl(task=mode.split('+')[0])
+
+    # 爬蟲成功且需要分析時，執行 GPT 分析
+    if mode.endswith('+analyze') and crawl_success:
+        return run_analysis(**analysis_options)
+    return crawl_success
+
 def main():
     """主程式入口"""
-    logger.info("==== Dcard房屋版爬蟲程式啟動 ====")
-    
     # 解析命令列參數
     args = parse_arguments()
-    
-    # 驗證環境
-    if not verify_environment():
+    mode = get_mode(args)
+
+    if mode == 'startup-stats':
+        return show_startup_stats()
+
+    # 設定日誌
+    ensure_directory(LOG_DIR)
+    setup_logging(f'main_{datetime.now().strftime("%Y%m%d")}', console=True)
+    logger.info("==== Dcard房屋版爬蟲程式啟動 ====")
+
+    # 驗證環境（--only-verify 時一律重新驗證）
+    if not verify_environment(required_packages(mode, args), use_cache=(mode != 'verify')):
         logger.error("環境驗證失敗，程式中止")
+        record_startup_time(mode, False)
         return False
     logger.info("環境驗證通過")
-    
-    # 如果只是驗證環境，則到此結束
-    if args.only_verify:
-        logger.info("僅執行環境驗證，程式結束")
-        return True
-    
-    # 如果需要備份，創建備份
-    if args.backup:
-        db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database', 'dcard_posts.sqlite')
-        if os.path.exists(db_path):
-            backup_path = create_backup(db_path)
-            if backup_path:
-                logger.info(f"資料庫備份成功: {backup_path}")
-            else:
-                logger.warning("資料庫備份失敗")
-    
-    # 如果只執行分析，則跳過爬蟲
-    if args.only_analyze:
-        return run_analysis(api_key=args.api_key, model=args.gpt_model)
-    
-    # 開始爬蟲
-    crawl_success = False
-    try:
-        logger.info("開始爬蟲任務")
-        crawler = DcardCrawler()
-        crawl_success = crawler.crawl()
-        
-        if crawl_success:
-            logger.info("爬蟲任務完成")
-        else:
-            logger.error("爬蟲任務失敗")
-    except Exception as e:
-        logger.error(f"爬蟲過程中發生錯誤: {e}")
-    
-    # 如果需要分析或爬蟲成功，執行 GPT 分析
-    if args.analyze and (crawl_success or args.only_analyze):
-        analysis_success = run_analysis(api_key=args.api_key, model=args.gpt_model)
-        logger.info("==== Dcard房屋版爬蟲程式結束 ====")
-        return analysis_success
-    else:
-        logger.info("==== Dcard房屋版爬蟲程式結束 ====")
-        return crawl_success
+
+    success = run_mode(mode, args)
+    logger.info("==== Dcard房屋版爬蟲程式結束 ====")
+    record_startup_time(mode, success)
+    return success
 
 if __name__ == "__main__":
-    sys.exit(0 if main() else 1)
\ No newline at end of file
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,22 @@
+"""
+測試共用設定
+"""
+import os
+import sys
+
+import pytest
+
+# 將專案根目錄加入系統路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.db_manager import DatabaseManager
+
+
+@pytest.fixture
+def db(tmp_path):
+    """暫存目錄中的空資料庫"""
+    manager = DatabaseManager(db_path=str(tmp_path / "test.sqlite"))
+    manager.connect()
+    manager.initialize_db()
+    yield manager
+    manager.close()
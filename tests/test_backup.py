@@ -0,0 +1,90 @@
+"""
+utils/backup.py 的測試
+"""
+import os
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from utils import backup
+from utils.backup import BackupManager
+
+
+class FrozenDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2025, 3, 1, 10, 0, 0, 123456)
+
+
+def make_manager(db, tmp_path, compression="gzip"):
+    return BackupManager(db_path=db.db_path, backup_dir=str(tmp_path / "backups"), compression=compression)
+
+
+def post_titles(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return [row[0] for row in conn.execute("SELECT title FROM house_posts ORDER BY id")]
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("compression", ["gzip", "none"])
+def test_backup_verify_and_restore_round_trip(db, tmp_path, compression):
+    for number in range(3):
+        db.insert_post(f"文章{number}", "內容", "2025-03-01 10:00:00")
+    manager = make_manager(db, tmp_path, compression)
+
+    backup_path = manager.create_backup()
+    assert backup_path and os.path.exists(backup_path)
+    entry = manager.load_manifest()[-1]
+    assert manager.verify(entry)
+    # 備份後寫入的文章不會出現在還原的資料庫中
+    db.insert_post("文章3", "內容", "2025-03-02 10:00:00")
+
+    target = str(tmp_path / "restored.sqlite")
+    assert manager.restore(os.path.basename(backup_path), target)
+    assert post_titles(target) == ["文章0", "文章1", "文章2"]
+    assert backup.check_integrity(target)[0]
+    assert not manager.restore(os.path.basename(backup_path), target)
+    assert not [name for name in os.listdir(manager.backup_dir) if name.startswith('.') or name.endswith('.partial')]
+
+
+def test_corrupted_backup_fails_verification(db, tmp_path):
+    db.insert_post("文章", "內容", "2025-03-01 10:00:00")
+    manager = make_manager(db, tmp_path, compression="none")
+    backup_path = manager.create_backup()
+    with open(backup_path, 'r+b') as f:
+        f.seek(200)
+        f.write(b"\xff" * 16)
+
+    assert not manager.verify(manager.load_manifest()[-1])
+    assert not manager.restore(os.path.basename(backup_path), str(tmp_path / "restored.sqlite"))
+    assert not os.path.exists(tmp_path / "restored.sqlite")
+
+
+def test_backups_in_same_second_do_not_collide(db, tmp_path, monkeypatch):
+    db.insert_post("文章", "內容", "2025-03-01 10:00:00")
+    manager = make_manager(db, tmp_path)
+    monkeypatch.setattr(backup, "datetime", FrozenDatetime)
+
+    first = manager.create_backup()
+    db.insert_post("文章2", "內容", "2025-03-01 10:00:00")
+    second = manager.create_backup()
+
+    assert first != second
+    assert os.path.exists(first) and os.path.exists(second)
+    entries = manager.load_manifest()
+    assert [entry['file'] for entry in entries] == [os.path.basename(first), os.path.basename(second)]
+    assert all(manager.verify(entry) for entry in entries)
+
+
+def test_select_retained_accepts_legacy_timestamps(tmp_path):
+    manager = BackupManager(db_path=str(tmp_path / "db.sqlite"), backup_dir=str(tmp_path))
+    entries = [
+        {'file': 'old.sqlite.gz', 'created_at': '2025-02-01 10:00:00'},
+        {'file': 'a.sqlite.gz', 'created_at': '2025-03-01 10:00:00.100000'},
+        {'file': 'b.sqlite.gz', 'created_at': '2025-03-01 10:00:00.200000'},
+    ]
+    retained = manager.select_retained(entries, keep_last=1, keep_daily=1, keep_weekly=2)
+    assert retained == {'b.sqlite.gz', 'old.sqlite.gz'}
@@ -0,0 +1,88 @@
+"""
+以本地模擬客戶端測試 Batch API 分析流程：提交 → 輪詢 → 寫回
+"""
+import json
+
+import pytest
+
+import analysis.gpt_analyzer as gpt_analyzer
+from analysis.batch_stub import LocalBatchClient
+from analysis.gpt_analyzer import GPTAnalyzer
+
+
+@pytest.fixture
+def analyzer_factory(db, tmp_path, monkeypatch):
+    """建立使用模擬客戶端的分析器，批次檔與模擬狀態都寫在暫存目錄"""
+    monkeypatch.setattr(gpt_analyzer, "BATCH_DIR", str(tmp_path / "batches"))
+    store_dir = str(tmp_path / "stub")
+
+    def build(polls_to_complete=1):
+        client = LocalBatchClient(polls_to_complete=polls_to_complete, store_dir=store_dir)
+        return GPTAnalyzer(client=client, db=db)
+    return build
+
+
+def add_posts(db, count):
+    for index in range(count):
+        db.insert_post(f"文章{index}", f"房貸利率與銀行寬限期 {index}", "2025-01-01 00:00:00", dcard_id=index + 1)
+
+
+def analyzed_rows(db):
+    return db.conn.execute(
+        "SELECT relevance_score, analysis_mode FROM house_posts WHERE analyzed_at IS NOT NULL"
+    ).fetchall()
+
+
+def test_batch_round_trip(db, analyzer_factory):
+    add_posts(db, 3)
+    analyzer = analyzer_factory()
+    assert analyzer.analyze_posts_batch(wait=True, poll_interval=0)
+    rows = analyzed_rows(db)
+    assert len(rows) == 3
+    assert all(score > 0 and mode == "batch" for score, mode in rows)
+    assert db.get_open_batches() == []
+
+
+def test_batch_resumes_in_new_process(db, analyzer_factory):
+    add_posts(db, 2)
+    analyzer_factory(polls_to_complete=2).analyze_posts_batch(wait=False)
+    assert len(db.get_open_batches()) == 1
+
+    # 新的客戶端（模擬另一個 --batch-stub 程序）從保存的狀態續接
+    assert analyzer_factory(polls_to_complete=2).analyze_posts_batch(wait=True, poll_interval=0)
+    assert len(analyzed_rows(db)) == 2
+
+
+def test_unknown_batch_is_marked_failed(db, analyzer_factory):
+    add_posts(db, 2)
+    db.record_batch("batch-stub-missing", "input.jsonl", "in_progress", [1, 2])
+    analyzer = analyzer_factory()
+    analyzer.poll_batches()
+    assert db.get_open_batches() == []
+    # 批次失敗後文章可再被提交
+    assert {post[0] for post in db.get_posts_for_batch()} == {1, 2}
+
+
+def test_malformed_output_lines_are_recorded_as_failures(db, analyzer_factory, monkeypatch):
+    add_posts(db, 2)
+    analyzer = analyzer_factory()
+    output = "\n".join([
+        "not json",
+        json.dumps({"custom_id": "post-x", "response": {}}),
+        json.dumps({"custom_id": "post-1", "response": {"status_code": 200, "body": {"choices": []}}}),
+        json.dumps({"custom_id": "post-2", "response": {"status_code": 200, "body": {"choices": [
+            {"message": {"content": json.dumps({"relevance_score": 70, "structured_data": {}})}}
+        ]}}}),
+    ])
+    monkeypatch.setattr(analyzer.client.files, "content", lambda file_id: type("F", (), {"text": output})())
+    db.record_batch("batch-bad", "input.jsonl", "in_progress", [1, 2])
+    monkeypatch.setattr(
+        analyzer.client.batches, "retrieve",
+        lambda batch_id: type("B", (), {"id": batch_id, "status": "completed", "output_file_id": "file-x"})()
+    )
+
+    assert analyzer.poll_batches() == 1
+    assert db.get_open_batches() == []
+    rows = db.conn.execute("SELECT id, analyzed_at IS NOT NULL, analysis_error FROM house_posts ORDER BY id").fetchall()
+    assert rows[0][1] == 0 and rows[0][2]
+    assert rows[1][1] == 1 and rows[1][2] is None
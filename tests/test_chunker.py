@@ -0,0 +1,43 @@
+"""
+analysis/chunker.py 的測試
+"""
+from analysis import chunker
+from analysis.chunker import count_tokens, split_into_chunks
+
+
+def test_short_text_is_single_chunk():
+    text = "房貸利率多少？\n\n想請問大家"
+    assert split_into_chunks(text, 1000) == [text]
+
+
+def test_long_text_splits_on_paragraphs_within_limit():
+    paragraphs = [f"第{i}段" + "房貸寬限期" * 40 for i in range(10)]
+    chunks = split_into_chunks("\n\n".join(paragraphs), 500)
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 500 for chunk in chunks)
+    # 段落不會被切開，且順序不變
+    assert "\n\n".join(chunks).split("\n\n") == paragraphs
+
+
+def test_oversized_paragraph_is_split_by_sentence_and_length():
+    text = "利率調升了。" * 200 + "寬" * 1500
+    chunks = split_into_chunks(text, 300)
+    assert all(count_tokens(chunk) <= 300 for chunk in chunks)
+    assert "".join(chunk.replace("\n\n", "") for chunk in chunks) == text
+
+
+def test_falls_back_to_estimate_when_encoding_cannot_load(monkeypatch, caplog):
+    class OfflineTiktoken:
+        @staticmethod
+        def encoding_for_model(model):
+            raise ConnectionError("cl100k_base.tiktoken")
+
+    monkeypatch.setattr(chunker, "tiktoken", OfflineTiktoken)
+    chunker._get_encoding.cache_clear()
+    try:
+        assert count_tokens("房貸利率", "test-model") == 4
+        assert count_tokens("寬限期 abcd", "test-model") == 5
+        warnings = [record for record in caplog.records if "tiktoken" in record.getMessage()]
+        assert len(warnings) == 1
+    finally:
+        chunker._get_encoding.cache_clear()
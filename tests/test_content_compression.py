@@ -0,0 +1,52 @@
+"""
+database/content_codec.py 與 DatabaseManager 壓縮內容讀取的測試
+"""
+import pytest
+
+from database.db_manager import DatabaseManager, CONTENT_SQL
+
+pytest.importorskip("zstandard")
+
+BANKS = ["土銀", "台銀", "合庫", "第一銀行", "華南", "彰銀", "兆豐", "國泰世華"]
+
+
+def post_content(number):
+    bank = BANKS[number % len(BANKS)]
+    return (
+        f"第{number}篇：想請問{bank}的房貸利率，新青安寬限期五年，貸款成數八成，"
+        f"總價{1000 + number * 37}萬，每月本息攤還大概要多少？" * 3
+    )
+
+
+def compressed_db(db, count=40):
+    for number in range(count):
+        db.insert_post(f"文章{number}", post_content(number), "2025-03-01 10:00:00")
+    assert db.train_content_dictionary() == 1
+    assert db.compress_contents() == count
+
+
+def test_connect_only_reads_compressed_content(db):
+    compressed_db(db)
+    reader = DatabaseManager(db_path=db.db_path)
+    reader.connect()
+    try:
+        title, content = reader.get_post_text(5)
+        assert title == "文章4"
+        assert f"{content}" == post_content(4)
+        reader.cursor.execute(f"SELECT {CONTENT_SQL} FROM house_posts WHERE id = 1")
+        assert reader.cursor.fetchone()[0] == post_content(0)
+    finally:
+        reader.close()
+
+
+def test_dictionary_trained_after_connect_is_loaded_on_first_use(db):
+    reader = DatabaseManager(db_path=db.db_path)
+    reader.connect()
+    try:
+        compressed_db(db)
+        # 在 SQL 函式 content_text 中補載入字典
+        reader.cursor.execute(f"SELECT {CONTENT_SQL} FROM house_posts WHERE id = 2")
+        assert reader.cursor.fetchone()[0] == post_content(1)
+        assert str(reader.get_post_text(3)[1]) == post_content(2)
+    finally:
+        reader.close()
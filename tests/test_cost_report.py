@@ -0,0 +1,21 @@
+"""
+utils/cost_report.py 的測試
+"""
+from utils.cost_report import build_report, estimate_cache_savings
+
+
+def test_report_shows_cache_hit_rate_and_savings():
+    rows = [("gpt-4o-mini", "v4", "sync", 4, 8000, 2048, 400, 1)]
+    report = build_report(rows)
+    line = report.splitlines()[2]
+    assert "25.6%" in line  # 快取 token 比例 2048/8000
+    assert "25.0%" in line  # 4 篇中 1 篇命中快取
+    assert estimate_cache_savings("gpt-4o-mini", "sync", 2048) > 0
+    assert "1024" not in report
+
+
+def test_report_warns_when_prompts_are_below_cache_threshold():
+    rows = [("gpt-3.5-turbo", "v4", "batch", 10, 3000, 0, 500, 0)]
+    report = build_report(rows)
+    assert estimate_cache_savings("gpt-3.5-turbo", "batch", 1000) == 0
+    assert "1024" in report
@@ -0,0 +1,261 @@
+"""
+crawler/dcard_crawler.py 的測試（以假的 HTTP 回應取代 Dcard API，不需要瀏覽器）
+"""
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+pytest.importorskip("selenium")
+
+from crawler import dcard_crawler
+from crawler.dcard_crawler import DcardCrawler
+
+
+@pytest.fixture
+def crawler(db, monkeypatch):
+    monkeypatch.setattr(dcard_crawler, "SIMILARITY_AUTO_UPDATE", False)
+    instance = DcardCrawler(db=db)
+    instance.session_cookies = {"cf_clearance": "token"}
+    instance.session_generation = 1
+    instance.session_created_at = time.monotonic()
+    yield instance
+    instance.close()
+
+
+def list_post(dcard_id, **fields):
+    return {"id": dcard_id, "title": f"文章{dcard_id}", "commentCount": 0, **fields}
+
+
+def store_post(db, dcard_id):
+    db.insert_post(f"文章{dcard_id}", "內容", "2025-03-01 10:00:00", dcard_id=dcard_id)
+
+
+def test_each_thread_gets_its_own_session(crawler):
+    sessions = {}
+
+    def record(name):
+        sessions[name] = (crawler.get_session(), crawler.get_session())
+
+    threads = [threading.Thread(target=record, args=(name,)) for name in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sessions["a"][0] is sessions["a"][1]
+    assert sessions["a"][0] is not sessions["b"][0]
+    assert sessions["a"][0].cookies.get("cf_clearance") == "token"
+
+    # cookies 更新後重新建立 session
+    main_session = crawler.get_session()
+    crawler.session_cookies = {"cf_clearance": "new"}
+    crawler.session_generation += 1
+    renewed = crawler.get_session()
+    assert renewed is not main_session
+    assert renewed.cookies.get("cf_clearance") == "new"
+    assert main_session not in crawler.sessions
+
+
+def test_collect_new_posts_stops_at_page_cap(crawler, db, monkeypatch):
+    monkeypatch.setattr(dcard_crawler, "MAX_LIST_PAGES", 3)
+    for dcard_id in range(1, 11):
+        store_post(db, dcard_id)
+    pages = []
+
+    def fetch_posts(before=None, limit=None):
+        pages.append(before)
+        start = 1000 - len(pages) * 10
+        return [list_post(start + offset) for offset in range(10, 0, -1)][:9] + [list_post(len(pages))]
+
+    monkeypatch.setattr(crawler, "fetch_posts", fetch_posts)
+    stats = Counter()
+    candidates = crawler.collect_new_posts(stats)
+    assert stats["list_pages"] == 3
+    assert len(pages) == 3
+    assert len(candidates) == 27
+
+
+def test_incremental_collect_stops_at_first_fully_seen_page(crawler, db, monkeypatch):
+    for dcard_id in range(1, 21):
+        store_post(db, dcard_id)
+    pages = [
+        [list_post(dcard_id) for dcard_id in (30, 29, 20, 19)],
+        [list_post(dcard_id) for dcard_id in (18, 17, 16, 15)],
+        [list_post(dcard_id) for dcard_id in (14, 13, 12, 11)],
+    ]
+    calls = []
+
+    def fetch_posts(before=None, limit=None):
+        calls.append(before)
+        return pages[len(calls) - 1]
+
+    monkeypatch.setattr(crawler, "fetch_posts", fetch_posts)
+    stats = Counter()
+    candidates = crawler.collect_new_posts(stats, incremental=True)
+    assert calls == [None, 19]
+    assert sorted(candidates) == [29, 30]
+
+
+class FakeResponse:
+    def __init__(self, data, status_code=200):
+        self.data = data
+        self.status_code = status_code
+        self.headers = {}
+
+    def json(self):
+        return self.data
+
+
+def test_comment_pages_use_per_thread_sessions_across_pages(crawler, db, monkeypatch):
+    monkeypatch.setattr(crawler.rate_limiter, "acquire", lambda: None)
+    for dcard_id in (1, 2):
+        store_post(db, dcard_id)
+    used = []
+    lock = threading.Lock()
+
+    def fake_get(session, url, params=None, headers=None, timeout=None):
+        with lock:
+            used.append((id(session), threading.get_ident()))
+        dcard_id = int(url.rstrip("/").split("/")[-2])
+        after = params.get("after", 0)
+        floors = range(after + 1, min(after + dcard_crawler.COMMENTS_LIMIT, 120) + 1)
+        return FakeResponse([{"id": f"{dcard_id}-{floor}", "floor": floor, "content": "留言"} for floor in floors])
+
+    monkeypatch.setattr(dcard_crawler.requests.Session, "get", fake_get)
+    posts = [list_post(1, commentCount=120), list_post(2, commentCount=120)]
+    assert sorted(crawler.crawl_comments(posts)) == [1, 2]
+    assert crawler.crawl_comments([list_post(1, commentCount=130)]) == []
+
+    # 每個 session 只在建立它的執行緒中使用，同一執行緒在多次呼叫之間重複使用同一個 session
+    threads_by_session, sessions_by_thread = {}, {}
+    for session_id, thread_id in used:
+        threads_by_session.setdefault(session_id, set()).add(thread_id)
+        sessions_by_thread.setdefault(thread_id, set()).add(session_id)
+    assert all(len(threads) == 1 for threads in threads_by_session.values())
+    assert all(len(sessions) == 1 for sessions in sessions_by_thread.values())
+    assert len(crawler.sessions) == len(sessions_by_thread)
+    counts = dict(db.conn.execute("SELECT post_id, COUNT(*) FROM post_comments GROUP BY post_id").fetchall())
+    assert counts == {1: 120, 2: 120}
+
+
+def stored_analyzed_post(db, dcard_id, updated_at, etag):
+    db.insert_post(
+        f"文章{dcard_id}", f"內容{dcard_id}", "2025-03-01 10:00:00", dcard_id=dcard_id,
+        metadata={"dcard_updated_at": updated_at, "http_etag": etag}
+    )
+    db.conn.execute(
+        "UPDATE house_posts SET relevance_score = 80, structured_data = '{}', analyzed_at = '2025-03-02 10:00:00' "
+        "WHERE dcard_id = ?", (dcard_id,)
+    )
+    db.conn.commit()
+
+
+def test_refresh_refetches_only_posts_with_changed_updated_at(crawler, db, monkeypatch):
+    monkeypatch.setattr(crawler.rate_limiter, "acquire", lambda: None)
+    for dcard_id in range(1, 5):
+        stored_analyzed_post(db, dcard_id, "2025-03-01T10:00:00Z", f'"e{dcard_id}"')
+    listing = [
+        list_post(4, updatedAt="2025-03-05T10:00:00Z"),
+        list_post(3, updatedAt="2025-03-05T10:00:00Z", likeCount=7),
+        list_post(2, updatedAt="2025-03-05T10:00:00Z"),
+        list_post(1, updatedAt="2025-03-01T10:00:00Z", likeCount=3),
+    ]
+    fetched = []
+
+    def fake_get(session, url, params=None, headers=None, timeout=None):
+        if url == crawler.forum_url:
+            return FakeResponse(listing)
+        if url.endswith("/comments"):
+            return FakeResponse([])
+        dcard_id = int(url.rstrip("/").split("/")[-1])
+        fetched.append((dcard_id, headers.get("If-None-Match")))
+        if dcard_id == 2:
+            return FakeResponse(None, status_code=304)
+        if dcard_id == 3:
+            response = FakeResponse({"title": "文章3", "content": "編輯後的內容"})
+            response.headers = {"ETag": '"e3-new"'}
+            return response
+        return FakeResponse(None, status_code=500)
+
+    monkeypatch.setattr(dcard_crawler.requests.Session, "get", fake_get)
+    assert crawler.refresh(close=False)
+
+    # updatedAt 未變更的文章不重新抓取，其餘以儲存的 ETag 發送條件式請求
+    assert sorted(fetched) == [(2, '"e2"'), (3, '"e3"'), (4, '"e4"')]
+    metadata = db.get_post_metadata([1, 2, 3, 4])
+    assert metadata[1]["dcard_like_count"] == 3
+    # 304：只更新 updatedAt，不重新排入分析
+    assert metadata[2]["dcard_updated_at"] == "2025-03-05T10:00:00Z"
+    # 內容變更：更新內容與 ETag 並重新排入分析
+    assert metadata[3]["http_etag"] == '"e3-new"'
+    assert db.get_post_text(metadata[3]["post_id"])[1] == "編輯後的內容"
+    # 失敗：保留舊的 updatedAt，下次更新時重試
+    assert metadata[4]["dcard_updated_at"] == "2025-03-01T10:00:00Z"
+    analyzed = dict(db.conn.execute("SELECT dcard_id, analyzed_at IS NOT NULL FROM house_posts").fetchall())
+    assert analyzed == {1: 1, 2: 1, 3: 0, 4: 1}
+
+    fetched.clear()
+    assert crawler.refresh(close=False)
+    assert fetched == [(4, '"e4"')]
+
+
+def fake_api(crawler, listing, failing=()):
+    fetched = []
+
+    def fake_get(session, url, params=None, headers=None, timeout=None):
+        if url == crawler.forum_url:
+            return FakeResponse([] if params.get("before") else listing)
+        if url.endswith("/comments"):
+            return FakeResponse([])
+        dcard_id = int(url.rstrip("/").split("/")[-1])
+        fetched.append(dcard_id)
+        if dcard_id in failing:
+            return FakeResponse(None, status_code=500)
+        return FakeResponse({"title": f"文章{dcard_id}", "content": "內容", "createdAt": "2025-03-01T10:00:00.000Z"})
+
+    return fake_get, fetched
+
+
+PRIORITY_LISTING = [
+    list_post(10, title="房貸利率怎麼談"),
+    list_post(11, title="轉貸要注意什麼"),
+    list_post(12, title="午餐吃什麼"),
+    list_post(13, title="貸款成數"),
+]
+
+
+def test_crawl_fetches_by_score_and_defers_the_rest(crawler, db, monkeypatch):
+    monkeypatch.setattr(crawler.rate_limiter, "acquire", lambda: None)
+    fake_get, fetched = fake_api(crawler, PRIORITY_LISTING)
+    monkeypatch.setattr(dcard_crawler.requests.Session, "get", fake_get)
+
+    # 兩個列表頁請求之後只剩一個請求額度，給分數最高的文章
+    assert crawler.crawl(close=False, request_budget=3)
+    assert fetched == [10]
+    summary = {reason: count for reason, count, _ in db.get_deferred_summary()}
+    assert summary == {'budget': 2, 'low_score': 1}
+
+    # 下次爬蟲時佇列中達門檻的文章與新文章一起依分數抓取，低分文章留在佇列
+    fetched.clear()
+    assert crawler.crawl(close=False)
+    assert fetched == [13, 11]
+    assert [dcard_id for dcard_id, _, _ in db.get_deferred_posts(10)] == [12]
+
+
+def test_drain_deferred_fetches_queue_and_counts_failures(crawler, db, monkeypatch):
+    monkeypatch.setattr(crawler.rate_limiter, "acquire", lambda: None)
+    fake_get, fetched = fake_api(crawler, PRIORITY_LISTING, failing={13})
+    monkeypatch.setattr(dcard_crawler.requests.Session, "get", fake_get)
+    assert crawler.crawl(close=False)
+    assert fetched == [10, 13, 11]
+    assert {reason for reason, _, _ in db.get_deferred_summary()} == {'failed', 'low_score'}
+
+    fetched.clear()
+    # 排空時不論分數都抓取，失敗的文章累加失敗次數，達上限後捨棄
+    assert crawler.drain_deferred(close=False)
+    assert fetched == [13, 12]
+    assert [dcard_id for dcard_id, _, _ in db.get_deferred_posts(10)] == [13]
+    assert db.get_deferred_posts(10, max_attempts=2) == []
+    assert db.get_comment_cursors([12])
@@ -0,0 +1,90 @@
+"""
+utils/daemon.py 的測試
+"""
+import os
+import signal
+import threading
+import time
+
+import pytest
+
+from utils import daemon
+from utils.daemon import CrawlerDaemon
+
+
+class FakeDb:
+    def __init__(self):
+        self.released = []
+        self.closed = False
+
+    def release_leases(self, worker_id):
+        self.released.append(worker_id)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeAnalyzer:
+    worker_id = "worker-1"
+
+    def __init__(self, on_cycle=None):
+        self.cycles = 0
+        self.on_cycle = on_cycle
+
+    def analyze_posts(self, stop_event=None):
+        self.cycles += 1
+        if self.on_cycle:
+            self.on_cycle()
+        return True
+
+
+@pytest.fixture(autouse=True)
+def cycle_log(tmp_path, monkeypatch):
+    monkeypatch.setattr(daemon, "CYCLE_LOG_PATH", str(tmp_path / "daemon_cycles.jsonl"))
+
+
+@pytest.fixture
+def restore_signals():
+    handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGTERM, signal.SIGINT)}
+    yield
+    for signum, handler in handlers.items():
+        signal.signal(signum, handler)
+
+
+def test_stop_event_wakes_daemon_between_cycles():
+    db = FakeDb()
+    analyzer = FakeAnalyzer()
+    scheduler = CrawlerDaemon(db, analyzer=analyzer, analyze_interval=3600)
+    thread = threading.Thread(target=scheduler.run)
+    thread.start()
+    # 第一個週期結束後進入長時間等待，設定停止事件後應立即結束
+    deadline = time.monotonic() + 5
+    while analyzer.cycles == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    scheduler.stop_event.set()
+    thread.join(timeout=5)
+
+    assert not thread.is_alive()
+    assert analyzer.cycles == 1
+    assert db.released == ["worker-1"] and db.closed
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGTERM") or os.name == "nt", reason="需要 POSIX 訊號")
+def test_sigterm_finishes_current_cycle_then_shuts_down(restore_signals):
+    db = FakeDb()
+    analyzer = FakeAnalyzer(on_cycle=lambda: os.kill(os.getpid(), signal.SIGTERM))
+    scheduler = CrawlerDaemon(db, analyzer=analyzer, analyze_interval=0)
+
+    assert scheduler.run()
+    # 週期中收到 SIGTERM 時完成該週期，不再開始下一個週期
+    assert analyzer.cycles == 1
+    assert scheduler.latencies["analyze"]
+    assert db.released == ["worker-1"] and db.closed
+
+
+def test_second_signal_interrupts_immediately():
+    scheduler = CrawlerDaemon(FakeDb(), analyzer=FakeAnalyzer())
+    scheduler.handle_signal(signal.SIGTERM, None)
+    assert scheduler.stop_event.is_set()
+    with pytest.raises(KeyboardInterrupt):
+        scheduler.handle_signal(signal.SIGTERM, None)
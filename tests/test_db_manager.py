@@ -0,0 +1,137 @@
+"""
+database/db_manager.py 的測試
+"""
+import threading
+import time
+
+from config.settings import MAX_ANALYSIS_ATTEMPTS
+from database import db_manager
+from database.db_manager import DatabaseManager
+
+
+def set_analysis(db, post_id, structured_data, relevance_score=80):
+    db.conn.execute(
+        "UPDATE house_posts SET relevance_score = ?, structured_data = ?, analyzed_at = '2025-04-01 10:00:00' WHERE id = ?",
+        (relevance_score, structured_data, post_id)
+    )
+    db.conn.commit()
+
+
+def test_reset_invalid_analyses_keeps_valid_empty_results(db):
+    results = [
+        '{}',
+        '{"房貸利率": "1.9%", "提到的銀行": ["土銀"]}',
+        '{"房貸利率": null, "提到的銀行": []}',
+        'not json',
+        '[]',
+        '{"房貸利率": {"值": 1.9}}',
+        '{"提到的銀行": "土銀"}',
+        None,
+    ]
+    for number, structured_data in enumerate(results, start=1):
+        db.insert_post(f"文章{number}", "內容", "2025-03-01 10:00:00")
+        set_analysis(db, number, structured_data)
+    db.insert_post("文章9", "內容", "2025-03-01 10:00:00")
+    set_analysis(db, 9, '{}', relevance_score=None)
+
+    assert db.reset_invalid_analyses() == 6
+    rows = db.conn.execute("SELECT id FROM house_posts WHERE analyzed_at IS NOT NULL ORDER BY id").fetchall()
+    assert [row[0] for row in rows] == [1, 2, 3]
+
+
+def add_posts(db, count):
+    for number in range(1, count + 1):
+        db.insert_post(f"文章{number}", f"內容{number}", "2025-03-01 10:00:00")
+
+
+def test_concurrent_claims_are_disjoint(db):
+    add_posts(db, 300)
+    workers = [DatabaseManager(db_path=db.db_path) for _ in range(2)]
+    claimed = {index: [] for index in range(len(workers))}
+    barrier = threading.Barrier(len(workers))
+
+    def claim_all(index):
+        manager = workers[index]
+        manager.connect()
+        barrier.wait()
+        while True:
+            posts = manager.claim_posts_for_analysis(f"worker-{index}", 7, lease_seconds=60)
+            if not posts:
+                break
+            claimed[index].extend(post[0] for post in posts)
+            # 模擬分析耗時，讓兩個工作程序交錯認領
+            time.sleep(0.002)
+        manager.close()
+
+    threads = [threading.Thread(target=claim_all, args=(index,)) for index in claimed]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert claimed[0] and claimed[1]
+    assert not set(claimed[0]) & set(claimed[1])
+    assert sorted(claimed[0] + claimed[1]) == list(range(1, 301))
+
+
+def test_expired_lease_is_reclaimed_and_counted_as_attempt(db, monkeypatch):
+    add_posts(db, 2)
+    other = DatabaseManager(db_path=db.db_path)
+    other.connect()
+    try:
+        assert [post[0] for post in db.claim_posts_for_analysis("worker-a", 10, lease_seconds=30)] == [1, 2]
+        assert other.claim_posts_for_analysis("worker-b", 10, lease_seconds=30) == []
+
+        # worker-a 分析成功一篇後當掉，另一篇的租約過期後由 worker-b 重新認領
+        assert db.update_post_analysis(1, 80, "{}")
+        now = time.time()
+        monkeypatch.setattr(db_manager.time, "time", lambda: now + 60)
+        assert [post[0] for post in other.claim_posts_for_analysis("worker-b", 10, lease_seconds=30)] == [2]
+    finally:
+        other.close()
+
+    attempts = dict(db.conn.execute("SELECT id, analysis_attempts FROM house_posts").fetchall())
+    # 成功的分析不計入嘗試次數，租約過期計入一次
+    assert attempts == {1: 0, 2: 1}
+
+
+def test_failures_count_toward_attempt_cap(db):
+    add_posts(db, 1)
+    for _ in range(MAX_ANALYSIS_ATTEMPTS):
+        assert db.claim_posts_for_analysis("worker-a", 10, lease_seconds=30)
+        db.record_analysis_failures([(1, "解析失敗")])
+        db.release_leases("worker-a")
+    assert db.claim_posts_for_analysis("worker-a", 10, lease_seconds=30) == []
+
+
+def deferred_ids(db, **kwargs):
+    return [dcard_id for dcard_id, _, _ in db.get_deferred_posts(10, **kwargs)]
+
+
+def test_deferred_queue_upserts_and_orders_by_score(db):
+    db.defer_posts([(1, 10.0, {"id": 1}), (2, 50.0, {"id": 2}), (3, 30.0, {"id": 3})], 'low_score')
+    # 已在佇列中的文章更新分數與列表資料，失敗時累加嘗試次數
+    db.defer_posts([(1, 80.0, {"id": 1, "title": "房貸"})], 'failed', failed=True)
+    db.defer_posts([(None, 99.0, {})], 'budget')
+
+    entries = db.get_deferred_posts(10)
+    assert [(dcard_id, score) for dcard_id, score, _ in entries] == [(1, 80.0), (2, 50.0), (3, 30.0)]
+    assert entries[0][2]["title"] == "房貸"
+    assert deferred_ids(db, min_score=40) == [1, 2]
+    assert deferred_ids(db, max_attempts=1) == [2, 3]
+    assert db.get_deferred_summary() == [('failed', 1, 80.0), ('low_score', 2, 50.0)]
+
+    # 已儲存的文章不再讀出，清理時一併移除
+    db.insert_post("文章2", "內容", "2025-03-01 10:00:00", dcard_id=2)
+    assert deferred_ids(db) == [1, 3]
+    assert db.remove_deferred_posts([3]) == 1
+    assert db.purge_deferred_posts(max_age_days=30, max_attempts=1) == 2
+    assert deferred_ids(db) == []
+
+
+def test_purge_drops_old_deferred_posts(db):
+    db.defer_posts([(1, 10.0, {"id": 1}), (2, 20.0, {"id": 2})], 'low_score')
+    db.conn.execute("UPDATE deferred_posts SET deferred_at = '2000-01-01 00:00:00' WHERE dcard_id = 1")
+    db.conn.commit()
+    assert db.purge_deferred_posts(max_age_days=30) == 1
+    assert deferred_ids(db) == [2]
@@ -0,0 +1,17 @@
+"""
+analysis/gpt_analyzer.py 的測試
+"""
+import pytest
+
+from analysis.gpt_analyzer import GPTAnalyzer
+
+pytest.importorskip("openai")
+
+
+def test_azure_response_format_uses_deployment_name(db):
+    analyzer = GPTAnalyzer(
+        api_key="test", endpoint_url="https://example.openai.azure.com", deployment="gpt-4o-prod", db=db
+    )
+    request = analyzer.build_request("標題", "內容")
+    assert request["model"] == "gpt-4o-prod"
+    assert request["response_format"]["type"] == "json_schema"
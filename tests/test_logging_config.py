@@ -0,0 +1,96 @@
+"""
+utils/logging_config.py 的測試
+"""
+import json
+import logging
+import sys
+import threading
+from logging.handlers import QueueHandler
+from types import SimpleNamespace
+
+import pytest
+
+from utils import logging_config
+from utils.logging_config import JsonFormatter, RateLimitFilter, setup_logging, shutdown_logging
+
+
+def make_record(lineno=10, level=logging.INFO, msg="訊息 %d", args=(1,), name="crawler.dcard_crawler"):
+    return logging.LogRecord(name, level, __file__, lineno, msg, args, None)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=100.0)
+    monkeypatch.setattr(logging_config, "time", SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+@pytest.fixture
+def root_logger(tmp_path, monkeypatch):
+    monkeypatch.setattr(logging_config, "LOG_DIR", str(tmp_path / "logs"))
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield root
+    shutdown_logging()
+    root.handlers[:] = handlers
+    root.setLevel(level)
+    if hasattr(root, "_dcard_configured"):
+        del root._dcard_configured
+
+
+def test_rate_limit_is_per_call_site_and_reports_suppressed(clock):
+    limiter = RateLimitFilter(rate=1, burst=2)
+    passed = [limiter.filter(make_record()) for _ in range(5)]
+    assert passed == [True, True, False, False, False]
+    # 其他呼叫位置與 WARNING 以上的訊息不受影響
+    assert limiter.filter(make_record(lineno=20))
+    assert limiter.filter(make_record(level=logging.WARNING))
+
+    clock.value += 1
+    record = make_record()
+    assert limiter.filter(record)
+    assert record.suppressed == 3
+    assert record.getMessage() == "訊息 1（已略過同一位置的 3 筆訊息）"
+    assert not limiter.filter(make_record())
+
+
+def test_rate_limit_disabled_when_rate_is_zero(clock):
+    limiter = RateLimitFilter(rate=0, burst=1)
+    assert all(limiter.filter(make_record()) for _ in range(50))
+
+
+def test_json_formatter_includes_suppressed_and_exception():
+    try:
+        raise ValueError("壞掉了")
+    except ValueError:
+        record = logging.LogRecord("analysis", logging.ERROR, __file__, 30, "失敗: %s", ("x",), sys.exc_info())
+    record.suppressed = 2
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "失敗: x"
+    assert entry["level"] == "ERROR" and entry["logger"] == "analysis" and entry["line"] == 30
+    assert entry["suppressed"] == 2
+    assert "ValueError: 壞掉了" in entry["exception"]
+
+
+def test_setup_logging_writes_through_queue_listener(root_logger):
+    root = setup_logging("test", json_format=True)
+    assert setup_logging("test") is root
+    queue_handlers = [handler for handler in root.handlers if isinstance(handler, QueueHandler)]
+    assert len(queue_handlers) == 1
+    assert any(isinstance(f, RateLimitFilter) for f in queue_handlers[0].filters)
+
+    logger = logging.getLogger("tests.worker")
+    threads = [
+        threading.Thread(target=logger.warning, args=("執行緒 %d", number)) for number in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 結束時寫完佇列中剩餘的紀錄
+    shutdown_logging()
+
+    with open(f"{logging_config.LOG_DIR}/test.log", encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f]
+    assert sorted(entry["message"] for entry in entries) == [f"執行緒 {number}" for number in range(4)]
+    assert {entry["logger"] for entry in entries} == {"tests.worker"}
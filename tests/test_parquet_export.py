@@ -0,0 +1,114 @@
+"""
+utils/parquet_export.py 的測試
+"""
+import glob
+import json
+import os
+
+import pytest
+
+from database.db_manager import DatabaseManager
+from utils import parquet_export
+from utils.parquet_export import ParquetExporter
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+def add_post(db, number, post_date):
+    db.insert_post(f"文章{number}", "內容", post_date)
+
+
+def analyze(db, post_id, analyzed_at="2025-04-01 10:00:00", banks=("土銀",)):
+    db.conn.execute(
+        "UPDATE house_posts SET relevance_score = 80, structured_data = ?, analyzed_at = ? WHERE id = ?",
+        (json.dumps({"房貸利率": "2.1%", "提到的銀行": list(banks)}, ensure_ascii=False), analyzed_at, post_id)
+    )
+    db.conn.commit()
+
+
+def make_exporter(db, tmp_path):
+    return ParquetExporter(export_dir=str(tmp_path / "exports"), db=DatabaseManager(db_path=db.db_path))
+
+
+def read_ids(export_dir):
+    files = glob.glob(os.path.join(export_dir, "post_month=*", "*.parquet"))
+    return sorted(id_ for path in files for id_ in pq.read_table(path, columns=["id"]).column("id").to_pylist())
+
+
+def test_incremental_export_only_writes_changed_posts(db, tmp_path):
+    add_post(db, 1, "2025-03-03 10:00:00")
+    add_post(db, 2, "2025-04-07 10:00:00")
+    add_post(db, 3, "2025-04-08 10:00:00")
+    analyze(db, 1)
+    analyze(db, 2)
+    exporter = make_exporter(db, tmp_path)
+
+    assert exporter.export() == 2
+    assert sorted(os.listdir(exporter.export_dir)) == ["_export_state.json", "post_month=2025-03", "post_month=2025-04"]
+    assert exporter.export() == 0
+
+    analyze(db, 3)
+    analyze(db, 1, analyzed_at="2025-04-02 10:00:00")
+    assert exporter.export() == 2
+    # 重新分析的文章再出現一次，不會留下暫存目錄
+    assert read_ids(exporter.export_dir) == [1, 1, 2, 3]
+    assert not glob.glob(os.path.join(exporter.export_dir, "_*-*"))
+
+
+def test_row_committed_later_in_same_second_with_lower_id_is_exported(db, tmp_path):
+    add_post(db, 1, "2025-03-03 10:00:00")
+    add_post(db, 2, "2025-03-04 10:00:00")
+    analyze(db, 2, analyzed_at="2025-04-01 10:00:00")
+    exporter = make_exporter(db, tmp_path)
+    assert exporter.export() == 1
+
+    # 另一個分析程序在同一秒寫入 id 較小的文章，但在匯出之後才提交
+    analyze(db, 1, analyzed_at="2025-04-01 10:00:00")
+    assert exporter.export() == 1
+    assert read_ids(exporter.export_dir) == [1, 2]
+
+
+def test_full_export_replaces_partitions(db, tmp_path):
+    for number in range(1, 4):
+        add_post(db, number, f"2025-03-0{number} 10:00:00")
+        analyze(db, number, banks=())
+    exporter = make_exporter(db, tmp_path)
+    exporter.export()
+    analyze(db, 2, analyzed_at="2025-04-02 10:00:00", banks=())
+    exporter.export()
+
+    assert exporter.export(full=True) == 3
+    files = glob.glob(os.path.join(exporter.export_dir, "post_month=2025-03", "*.parquet"))
+    assert len(files) == 1
+    table = pq.read_table(files[0])
+    assert sorted(table.column("id").to_pylist()) == [1, 2, 3]
+    # 沒有提到銀行時為空列表而非 null
+    assert table.column("banks").to_pylist() == [[], [], []]
+
+
+def test_failed_export_leaves_no_files_and_keeps_watermark(db, tmp_path, monkeypatch):
+    add_post(db, 1, "2025-03-03 10:00:00")
+    analyze(db, 1)
+    exporter = make_exporter(db, tmp_path)
+
+    def fail(rows, schema):
+        raise ValueError("寫入失敗")
+
+    monkeypatch.setattr(parquet_export, "rows_to_record_batch", fail)
+    assert exporter.export() is None
+    assert os.listdir(exporter.export_dir) == []
+
+    monkeypatch.undo()
+    assert exporter.export() == 1
+
+
+def test_legacy_watermark_forces_full_export(db, tmp_path):
+    add_post(db, 1, "2025-03-03 10:00:00")
+    analyze(db, 1)
+    exporter = make_exporter(db, tmp_path)
+    os.makedirs(exporter.export_dir)
+    with open(exporter.state_path, 'w', encoding='utf-8') as f:
+        json.dump({"analyzed_at": "2025-05-01 00:00:00", "id": 1}, f)
+
+    assert exporter.export() == 1
+    assert read_ids(exporter.export_dir) == [1]
@@ -0,0 +1,46 @@
+"""
+crawler/priority.py 的測試
+"""
+import math
+
+import pytest
+
+from crawler import priority
+from crawler.priority import engagement_score, keyword_score, rank_posts, score_post
+
+
+@pytest.fixture(autouse=True)
+def weights(monkeypatch):
+    monkeypatch.setattr(priority, "PRIORITY_KEYWORDS", {"房貸": 30, "利率": 20})
+    monkeypatch.setattr(priority, "PRIORITY_FIELD_WEIGHTS", {"title": 2.0, "topics": 1.5, "excerpt": 1.0})
+    monkeypatch.setattr(priority, "PRIORITY_ENGAGEMENT_WEIGHT", 3)
+
+
+def test_keyword_score_weights_each_field():
+    assert keyword_score({"title": "房貸問題"}) == 60
+    assert keyword_score({"topics": ["房貸", "買房"]}) == 45
+    assert keyword_score({"excerpt": "利率多少"}) == 20
+    # 同一關鍵字出現在多個欄位時各自計分，缺少的欄位視為空字串
+    assert keyword_score({"title": "房貸利率", "topics": ["房貸"], "excerpt": None}) == 60 + 40 + 45
+    assert keyword_score({}) == 0
+
+
+def test_engagement_score_is_logarithmic():
+    assert engagement_score({}) == 0
+    assert engagement_score({"commentCount": 9, "likeCount": 99}) == pytest.approx(3 * (math.log(10) + 0.5 * math.log(100)))
+    # 互動數增加十倍，分數只增加固定值，熱門但無關的文章不會蓋過關鍵字
+    assert engagement_score({"commentCount": 9999}) < keyword_score({"title": "房貸"})
+
+
+def test_rank_posts_sorts_and_splits_at_threshold():
+    posts = [
+        {"id": 1, "title": "午餐吃什麼", "commentCount": 500},
+        {"id": 2, "title": "房貸利率"},
+        {"id": 3, "excerpt": "利率"},
+        {"id": 4, "title": "房貸"},
+    ]
+    ranked, low = rank_posts(posts, min_score=25)
+    assert [post["id"] for _, post in ranked] == [2, 4]
+    assert [post["id"] for _, post in low] == [3, 1]
+    assert ranked[0][0] == score_post(posts[1]) == 100
+    assert rank_posts(posts, min_score=float("-inf"))[1] == []
@@ -0,0 +1,49 @@
+"""
+analysis/response_parser.py 的測試
+"""
+import json
+
+import pytest
+
+from analysis.prompts import STRUCTURED_TEXT_FIELDS, STRUCTURED_LIST_FIELD
+from analysis.response_parser import AnalysisParseError, parse_analysis, merge_analyses
+
+
+def make_response(score=80, **fields):
+    return json.dumps({"relevance_score": score, "structured_data": fields}, ensure_ascii=False)
+
+
+def test_parse_analysis_fills_missing_fields():
+    score, data = parse_analysis(make_response(85.6, 房貸利率="1.31%", 貸款年限=30))
+    assert score == 86
+    assert data["房貸利率"] == "1.31%"
+    assert data["貸款年限"] == "30"
+    assert set(data) == set(STRUCTURED_TEXT_FIELDS) | {STRUCTURED_LIST_FIELD}
+    assert data["房貸金額"] is None
+    assert data[STRUCTURED_LIST_FIELD] == []
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "not json",
+    "[1, 2]",
+    json.dumps({"relevance_score": "80", "structured_data": {}}),
+    json.dumps({"relevance_score": True, "structured_data": {}}),
+    json.dumps({"relevance_score": 120, "structured_data": {}}),
+    json.dumps({"relevance_score": 50, "structured_data": []}),
+    json.dumps({"relevance_score": 50, "structured_data": {"房貸金額": {"值": 1}}}),
+    json.dumps({"relevance_score": 50, "structured_data": {"提到的銀行": "台銀"}}),
+])
+def test_parse_analysis_rejects_invalid_responses(text):
+    with pytest.raises(AnalysisParseError):
+        parse_analysis(text)
+
+
+def test_merge_analyses_takes_max_score_first_values_and_unique_banks():
+    first = parse_analysis(make_response(40, 房貸金額="800萬", 提到的銀行=["台銀", "土銀"]))
+    second = parse_analysis(make_response(90, 房貸金額="900萬", 房貸利率="2%", 提到的銀行=["土銀", "國泰"]))
+    score, data = merge_analyses([first, second])
+    assert score == 90
+    assert data["房貸金額"] == "800萬"
+    assert data["房貸利率"] == "2%"
+    assert data[STRUCTURED_LIST_FIELD] == ["台銀", "土銀", "國泰"]
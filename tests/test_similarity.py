@@ -0,0 +1,71 @@
+"""
+analysis/similarity.py 的測試
+"""
+from analysis import similarity
+from analysis.similarity import SimilarityIndex
+
+POSTS = [
+    ("新青安寬限期", "新青安貸款寬限期五年，利率 1.775%，寬限期過後每月要還多少"),
+    ("公股銀行房貸利率", "土銀、台銀、合庫的房貸利率比較，首購可以拿到多少"),
+    ("租屋押金糾紛", "房東不退押金，租屋處漏水也不修，該怎麼辦"),
+    ("裝潢預算", "二十坪新成屋裝潢預算大概要抓多少，系統櫃怎麼挑"),
+]
+
+
+def build_index(db, tmp_path):
+    for number, (title, content) in enumerate(POSTS):
+        db.insert_post(title, content, f"2025-03-0{number + 1} 10:00:00")
+    index = SimilarityIndex(index_dir=str(tmp_path / "index"))
+    assert index.build(db) == len(POSTS)
+    return index
+
+
+def test_add_post_rereads_count_written_by_other_process(db, tmp_path):
+    index = build_index(db, tmp_path)
+    other = SimilarityIndex(index_dir=index.index_dir)
+    assert other.add_post(10, "寬限期結束", "寬限期結束後本息攤還壓力")
+    # index 的 meta 還是舊的筆數，寫入前必須重新讀取，否則會覆蓋或錯位
+    assert index.add_post(11, "押金", "押金退還")
+
+    reloaded = SimilarityIndex(index_dir=index.index_dir)
+    vectors, ids = reloaded._mapped()
+    assert list(ids) == [1, 2, 3, 4, 10, 11]
+    assert vectors.shape == (6, reloaded.meta["dim"])
+
+
+def test_update_post_reembeds_changed_content(db, tmp_path):
+    index = build_index(db, tmp_path)
+    db.add_update_listener(index.update_post)
+    query = "租屋押金不退"
+    assert index.query(query, top_k=1)[0][0] == 3
+
+    title, content = POSTS[2]
+    assert not index.update_post(3, title, content)
+    assert db.update_post_content(1, "押金不退怎麼辦", "房東不退租屋押金")
+
+    _, ids = index._mapped()
+    assert list(ids) == [1, 2, 3, 4]
+    assert 1 in [post_id for post_id, _ in index.query(query, top_k=2)]
+
+
+def test_update_post_supersedes_clustered_vector(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(similarity, "SIMILARITY_IVF_MIN_POSTS", 1)
+    index = build_index(db, tmp_path)
+    assert index.meta["ivf_indexed"] == len(POSTS)
+
+    assert index.update_post(1, "押金不退怎麼辦", "房東不退租屋押金")
+    _, ids = index._mapped()
+    assert sorted(ids) == [-1, 1, 2, 3, 4]
+    assert index.meta["superseded"] == 1
+    results = index.query("押金", top_k=10)
+    assert sorted(post_id for post_id, _ in results) == [1, 2, 3, 4]
+
+
+def test_sync_reembeds_posts_refreshed_without_listener(db, tmp_path):
+    index = build_index(db, tmp_path)
+    assert db.update_post_content(1, "押金不退怎麼辦", "房東不退租屋押金")
+    assert db.update_post_content(2, *POSTS[1]) is False
+
+    assert index.sync(db) == 1
+    assert index.meta["synced_at"]
+    assert 1 in [post_id for post_id, _ in index.query("租屋押金不退", top_k=2)]
@@ -0,0 +1,89 @@
+"""
+analysis/trends.py 的測試
+"""
+import json
+
+import pytest
+
+from analysis.trends import TrendAnalyzer
+
+
+def add_analyzed_post(db, post_id, post_date, rate, analyzed_at="2025-04-01 00:00:00"):
+    db.insert_post(f"文章{post_id}", "內容", post_date)
+    db.conn.execute(
+        "UPDATE house_posts SET relevance_score = 80, structured_data = ?, analyzed_at = ? WHERE id = ?",
+        (json.dumps({"房貸利率": rate}, ensure_ascii=False), analyzed_at, post_id)
+    )
+    db.conn.commit()
+
+
+def test_rolling_median_uses_calendar_weeks_and_post_level_rates(db):
+    add_analyzed_post(db, 1, "2025-01-06 10:00:00", "2.0%")
+    add_analyzed_post(db, 2, "2025-03-03 10:00:00", "1.8%")
+    add_analyzed_post(db, 3, "2025-03-17 10:00:00", "1.9%")
+    add_analyzed_post(db, 4, "2025-03-18 10:00:00", "2.1%")
+    trends = TrendAnalyzer(db=db)
+    trends.refresh()
+    report = trends.weekly_report(weeks=20)
+
+    # 中間沒有文章的週別也列出
+    assert len(report) == 11
+    assert report.loc["2025-02-03", "post_count"] == 0
+    # 1 月的利率不會落入 3 月的 4 週視窗
+    assert report.loc["2025-03-03", "rate_rolling_median"] == 1.8
+    # 視窗內所有文章利率 [1.8, 1.9, 2.1] 的中位數，而非每週中位數的中位數
+    assert report.loc["2025-03-17", "rate_rolling_median"] == 1.9
+
+
+def test_refresh_recomputes_requeued_and_reanalyzed_weeks(db):
+    add_analyzed_post(db, 1, "2025-03-17 10:00:00", "1.9%")
+    add_analyzed_post(db, 2, "2025-03-18 10:00:00", "2.1%")
+    trends = TrendAnalyzer(db=db)
+    assert trends.refresh() == 1
+    assert trends.refresh() == 0
+
+    db.requeue_posts_for_analysis([2])
+    assert trends.refresh() == 1
+    assert trends.weekly_report().loc["2025-03-17", "post_count"] == 1
+
+    db.requeue_posts_for_analysis([1])
+    assert trends.refresh() == 1
+    assert trends.weekly_report().empty
+
+
+def test_refresh_only_recomputes_weeks_touched_since_watermark(db, monkeypatch):
+    add_analyzed_post(db, 1, "2025-03-03 10:00:00", "1.9%")
+    add_analyzed_post(db, 2, "2025-03-17 10:00:00", "2.1%")
+    trends = TrendAnalyzer(db=db)
+    assert trends.refresh() == 2
+
+    loaded = []
+    original = trends.load_frame
+    monkeypatch.setattr(trends, "load_frame", lambda weeks=None: loaded.append(weeks) or original(weeks))
+    # 重新分析的時間與前一次相同（同一秒），仍由 change_seq 偵測到
+    db.conn.execute(
+        "UPDATE house_posts SET structured_data = ? WHERE id = 2",
+        (json.dumps({"房貸利率": "2.3%"}, ensure_ascii=False),)
+    )
+    db.conn.commit()
+    assert trends.refresh() == 1
+    assert loaded == [["2025-03-17"]]
+    assert trends.weekly_report().loc["2025-03-17", "rate_median"] == 2.3
+
+
+def test_rolling_median_is_read_from_rollup(db, monkeypatch):
+    add_analyzed_post(db, 1, "2025-03-03 10:00:00", "1.8%")
+    add_analyzed_post(db, 2, "2025-03-10 10:00:00", "2.0%")
+    add_analyzed_post(db, 3, "2025-03-11 10:00:00", "2.2%")
+    add_analyzed_post(db, 4, "2025-03-17 10:00:00", "2.4%")
+    trends = TrendAnalyzer(db=db)
+    trends.refresh()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("報表不應重新讀取文章資料表")
+
+    monkeypatch.setattr(trends, "load_frame", fail)
+    report = trends.weekly_report()
+    # 偶數篇時取中間兩筆的平均：[1.8, 2.0, 2.2, 2.4] -> 2.1
+    assert report.loc["2025-03-17", "rate_rolling_median"] == pytest.approx(2.1)
+    assert report.loc["2025-03-10", "rate_rolling_median"] == pytest.approx(2.0)
@@ -0,0 +1,331 @@
+"""
+資料庫備份工具
+- 以 SQLite 線上備份 API 分步複製資料庫，每一步之間釋放鎖，不會長時間阻擋其他程序寫入
+- 複本通過 integrity_check 後以串流方式壓縮，並在寫完後重新解壓比對 SHA-256
+- 依保留政策（最近 N 份、每日、每週）輪替舊備份，備份資訊記錄於 manifest.json
+用法:
+  python utils/backup.py create            建立備份並輪替舊備份
+  python utils/backup.py list              列出備份
+  python utils/backup.py verify [--all]    驗證最新（或全部）備份
+  python utils/backup.py restore <備份檔> --target <還原路徑>
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import argparse
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:  # zstandard 為可選套件
+    zstandard = None
+
+# 將專案根目錄加入系統路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import (
+    DB_NAME, BACKUP_DIR, BACKUP_PAGES_PER_STEP, BACKUP_STEP_SLEEP, BACKUP_COMPRESSION,
+    BACKUP_KEEP_LAST, BACKUP_KEEP_DAILY, BACKUP_KEEP_WEEKLY
+)
+from utils.helpers import ensure_directory
+from utils.logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DB_PATH = os.path.join(PROJECT_ROOT, 'database', DB_NAME)
+DEFAULT_BACKUP_DIR = os.path.join(PROJECT_ROOT, BACKUP_DIR)
+MANIFEST_NAME = 'manifest.json'
+CHUNK_SIZE = 1024 * 1024
+# 壓縮格式對應的副檔名
+EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst', 'none': ''}
+
+
+def open_compressed(path, mode, compression):
+    """以指定格式開啟壓縮檔的串流（mode 為 'rb' 或 'wb'）"""
+    if compression == 'gzip':
+        return gzip.open(path, mode, compresslevel=6) if mode == 'wb' else gzip.open(path, mode)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstd 壓縮需要安裝 zstandard")
+        raw = open(path, mode)
+        if mode == 'wb':
+            return zstandard.ZstdCompressor(level=10).stream_writer(raw, closefd=True)
+        return zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+    return open(path, mode)
+
+
+def hash_stream(stream):
+    """計算串流內容的 SHA-256"""
+    digest = hashlib.sha256()
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def check_integrity(db_path):
+    """執行 PRAGMA integrity_check，回傳 (是否通過, 結果訊息)"""
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("PRAGMA integrity_check").fetchall()
+        messages = [row[0] for row in rows]
+        return messages == ['ok'], "; ".join(messages[:5])
+    finally:
+        conn.close()
+
+
+def online_copy(db_path, target_path, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP):
+    """以線上備份 API 分步將資料庫複製到 target_path，回傳總頁數"""
+    progress = {'total': 0, 'steps': 0}
+
+    def on_progress(status, remaining, total):
+        progress['total'] = total
+        progress['steps'] += 1
+
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target, pages=pages, progress=on_progress, sleep=sleep)
+    finally:
+        target.close()
+        source.close()
+    logger.info(f"線上備份完成: {progress['total']} 頁，分 {progress['steps']} 步複製")
+    return progress['total']
+
+
+class BackupManager:
+    """管理資料庫備份的建立、驗證、還原與輪替"""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, backup_dir=DEFAULT_BACKUP_DIR, compression=BACKUP_COMPRESSION):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.compression = compression
+        self.manifest_path = os.path.join(backup_dir, MANIFEST_NAME)
+
+    def load_manifest(self):
+        """讀取備份清單（依建立時間由舊到新）"""
+        if not os.path.exists(self.manifest_path):
+            return []
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save_manifest(self, entries):
+        """寫入備份清單（先寫暫存檔再取代，避免中斷時損毀）"""
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.manifest_path)
+
+    def create_backup(self):
+        """建立一份壓縮備份並輪替舊備份，回傳備份檔路徑（失敗時回傳 None）"""
+        if not os.path.exists(self.db_path):
+            logger.warning(f"無法創建備份，資料庫不存在: {self.db_path}")
+            return None
+        ensure_directory(self.backup_dir)
+
+        created_at = datetime.now()
+        base_name = os.path.splitext(os.path.basename(self.db_path))[0]
+        # 檔名包含微秒，同一秒內建立的多份備份不會互相覆寫；極少數同一微秒的情況再加上序號
+        stamp = created_at.strftime('%Y%m%d_%H%M%S_%f')
+        existing = {entry['file'] for entry in self.load_manifest()}
+        file_name = f"{base_name}_{stamp}.sqlite{EXTENSIONS[self.compression]}"
+        counter = 1
+        while file_name in existing or os.path.exists(os.path.join(self.backup_dir, file_name)):
+            file_name = f"{base_name}_{stamp}_{counter}.sqlite{EXTENSIONS[self.compression]}"
+            counter += 1
+        backup_path = os.path.join(self.backup_dir, file_name)
+        snapshot_path = os.path.join(self.backup_dir, f".{file_name}.snapshot")
+        partial_path = f"{backup_path}.partial"
+
+        start = time.perf_counter()
+        try:
+            page_count = online_copy(self.db_path, snapshot_path)
+            ok, message = check_integrity(snapshot_path)
+            if not ok:
+                logger.error(f"備份複本未通過完整性檢查: {message}")
+                return None
+
+            # 串流壓縮，同時計算原始內容的 SHA-256
+            digest = hashlib.sha256()
+            raw_size = 0
+            with open(snapshot_path, 'rb') as source, open_compressed(partial_path, 'wb', self.compression) as target:
+                while True:
+                    chunk = source.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    raw_size += len(chunk)
+                    target.write(chunk)
+            sha256 = digest.hexdigest()
+
+            # 重新解壓比對，確認寫入的壓縮檔可以完整還原
+            with open_compressed(partial_path, 'rb', self.compression) as stream:
+                if hash_stream(stream) != sha256:
+                    logger.error("備份壓縮檔解壓後的內容與原始複本不符")
+                    return None
+            os.replace(partial_path, backup_path)
+        except (sqlite3.Error, OSError, RuntimeError) as e:
+            logger.error(f"創建備份失敗: {e}")
+            return None
+        finally:
+            for path in (snapshot_path, partial_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        entry = {
+            'file': file_name,
+            'created_at': created_at.strftime('%Y-%m-%d %H:%M:%S.%f'),
+            'compression': self.compression,
+            'pages': page_count,
+            'raw_size': raw_size,
+            'size': os.path.getsize(backup_path),
+            'sha256': sha256,
+        }
+        entries = self.load_manifest()
+        entries.append(entry)
+        self.save_manifest(entries)
+        logger.info(
+            f"已創建備份: {backup_path}（{raw_size / 1e6:.1f} MB -> {entry['size'] / 1e6:.1f} MB，"
+            f"耗時 {time.perf_counter() - start:.1f} 秒）"
+        )
+        self.prune()
+        return backup_path
+
+    def restore_to(self, entry, target_path):
+        """將備份解壓到 target_path，比對 SHA-256 並執行完整性檢查，回傳 (是否成功, 訊息)"""
+        backup_path = os.path.join(self.backup_dir, entry['file'])
+        if not os.path.exists(backup_path):
+            return False, "備份檔不存在"
+        digest = hashlib.sha256()
+        with open_compressed(backup_path, 'rb', entry['compression']) as source, open(target_path, 'wb') as target:
+            while True:
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                target.write(chunk)
+        if digest.hexdigest() != entry['sha256']:
+            return False, "SHA-256 不符"
+        return check_integrity(target_path)
+
+    def verify(self, entry):
+        """驗證一份備份：解壓到暫存檔、比對 SHA-256 並執行完整性檢查"""
+        temp_path = os.path.join(self.backup_dir, f".{entry['file']}.verify")
+        try:
+            ok, message = self.restore_to(entry, temp_path)
+        except (sqlite3.Error, OSError, RuntimeError) as e:
+            ok, message = False, str(e)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        if ok:
+            logger.info(f"備份驗證通過: {entry['file']}")
+        else:
+            logger.error(f"備份驗證失敗: {entry['file']}（{message}）")
+        return ok
+
+    def restore(self, file_name, target_path):
+        """將指定備份還原到 target_path（不覆寫已存在的檔案）"""
+        if os.path.exists(target_path):
+            logger.error(f"還原目標已存在，請先移除或指定其他路徑: {target_path}")
+            return False
+        entry = next((entry for entry in self.load_manifest() if entry['file'] == os.path.basename(file_name)), None)
+        if entry is None:
+            logger.error(f"備份清單中找不到: {file_name}")
+            return False
+        partial_path = f"{target_path}.partial"
+        try:
+            ok, message = self.restore_to(entry, partial_path)
+            if not ok:
+                logger.error(f"還原失敗: {message}")
+                return False
+            os.replace(partial_path, target_path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        logger.info(f"已將 {entry['file']} 還原至 {target_path}")
+        return True
+
+    def select_retained(self, entries, keep_last=BACKUP_KEEP_LAST,
+                        keep_daily=BACKUP_KEEP_DAILY, keep_weekly=BACKUP_KEEP_WEEKLY):
+        """依保留政策選出要保留的備份檔名：最近 keep_last 份，加上最近各天、各週最新的一份"""
+        newest_first = sorted(entries, key=lambda entry: entry['created_at'], reverse=True)
+        retained = {entry['file'] for entry in newest_first[:keep_last]}
+        days, weeks = set(), set()
+        for entry in newest_first:
+            # 舊版清單的建立時間沒有微秒，fromisoformat 兩種格式都能解析
+            created_at = datetime.fromisoformat(entry['created_at'])
+            day = created_at.date()
+            week = created_at.isocalendar()[:2]
+            if day not in days and len(days) < keep_daily:
+                days.add(day)
+                retained.add(entry['file'])
+            if week not in weeks and len(weeks) < keep_weekly:
+                weeks.add(week)
+                retained.add(entry['file'])
+        return retained
+
+    def prune(self):
+        """刪除不在保留政策內的備份，回傳刪除的數量"""
+        entries = self.load_manifest()
+        retained = self.select_retained(entries)
+        removed = 0
+        for entry in entries:
+            if entry['file'] in retained:
+                continue
+            path = os.path.join(self.backup_dir, entry['file'])
+            if os.path.exists(path):
+                os.remove(path)
+            removed += 1
+            logger.info(f"已刪除過期備份: {entry['file']}")
+        if removed:
+            self.save_manifest([entry for entry in entries if entry['file'] in retained])
+        return removed
+
+
+def main():
+    """主函數"""
+    setup_logging('utils')
+    parser = argparse.ArgumentParser(description='資料庫線上備份、驗證與還原')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('create', help='建立備份並輪替舊備份')
+    subparsers.add_parser('list', help='列出備份')
+    verify_parser = subparsers.add_parser('verify', help='驗證備份')
+    verify_parser.add_argument('--all', action='store_true', help='驗證所有備份（預設只驗證最新的一份）')
+    restore_parser = subparsers.add_parser('restore', help='還原備份')
+    restore_parser.add_argument('file', help='備份檔名')
+    restore_parser.add_argument('--target', required=True, help='還原後的資料庫路徑（不可已存在）')
+    args = parser.parse_args()
+
+    manager = BackupManager()
+    if args.command == 'create':
+        backup_path = manager.create_backup()
+        if backup_path:
+            print(f"已創建備份: {backup_path}")
+        return backup_path is not None
+    if args.command == 'restore':
+        return manager.restore(args.file, args.target)
+
+    entries = manager.load_manifest()
+    if not entries:
+        print("沒有任何備份")
+        return args.command == 'list'
+    if args.command == 'list':
+        print(f"{'檔案':<52}{'建立時間':<22}{'原始(MB)':>10}{'壓縮(MB)':>10}")
+        for entry in entries:
+            print(f"{entry['file']:<52}{entry['created_at'][:19]:<22}{entry['raw_size'] / 1e6:>10.1f}{entry['size'] / 1e6:>10.1f}")
+        return True
+    targets = entries if args.all else entries[-1:]
+    return all([manager.verify(entry) for entry in targets])
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,172 @@
+"""
+文章內容壓縮管理工具
+用法:
+  python utils/content_compression.py train [--samples 20000]   以目前的文章訓練新版本字典
+  python utils/content_compression.py compress                    以最新字典壓縮（或重新壓縮）文章內容
+  python utils/content_compression.py decompress                  還原為未壓縮的 TEXT
+  python utils/content_compression.py stats                       顯示各字典版本的儲存大小
+  python utils/content_compression.py benchmark [--runs 3]        比較壓縮前後的檔案大小與全表掃描速度
+壓縮或還原後可執行 VACUUM（compress/decompress 加上 --vacuum）以實際縮小資料庫檔案
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+
+# 將專案根目錄加入系統路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import TABLE_NAME, ZSTD_DICT_SAMPLES
+from database.db_manager import DatabaseManager, CONTENT_SQL
+from utils.logging_config import setup_logging
+
+# 效能測試的全表掃描查詢：讀取（並解壓）所有內容 / 只讀取不含內容的欄位
+# {content} 在未壓縮的複本上為原本的 content 欄位，在壓縮的複本上為 CONTENT_SQL
+SCAN_QUERIES = {
+    "讀取內容": f"SELECT LENGTH({{content}}) FROM {TABLE_NAME}",
+    "只讀中繼資料": f"SELECT SUM(COALESCE(relevance_score, 0)), COUNT(post_date) FROM {TABLE_NAME}",
+}
+
+
+def copy_database(source_path, target_path):
+    """以 SQLite 線上備份 API 複製資料庫"""
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def vacuum(db):
+    """重建資料庫檔案以釋放改寫內容後的空間"""
+    db.conn.commit()
+    db.conn.execute("VACUUM")
+
+
+def time_scan(db, query, runs):
+    """執行掃描查詢 runs 次，回傳最短秒數"""
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        cursor = db.conn.execute(query)
+        while cursor.fetchmany(5000):
+            pass
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def measure(db, runs, content_sql):
+    """回傳 (檔案大小, {查詢名稱: 秒數})"""
+    scans = {name: time_scan(db, query.format(content=content_sql), runs) for name, query in SCAN_QUERIES.items()}
+    return os.path.getsize(db.db_path), scans
+
+
+def benchmark(source_path, runs, samples):
+    """在暫存複本上比較未壓縮與壓縮後的檔案大小與掃描速度（不修改原資料庫）"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        plain_path = os.path.join(temp_dir, "plain.sqlite")
+        packed_path = os.path.join(temp_dir, "packed.sqlite")
+        copy_database(source_path, plain_path)
+
+        plain = DatabaseManager(db_path=plain_path)
+        plain.connect()
+        plain.initialize_db()
+        plain.decompress_contents()
+        vacuum(plain)
+        plain.close()
+        copy_database(plain_path, packed_path)
+
+        packed = DatabaseManager(db_path=packed_path)
+        packed.connect()
+        packed.initialize_db()
+        start = time.perf_counter()
+        if packed.train_content_dictionary(samples) is None:
+            packed.close()
+            return False
+        train_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        compressed_count = packed.compress_contents()
+        compress_seconds = time.perf_counter() - start
+        vacuum(packed)
+        stats = packed.get_content_storage_stats()
+
+        plain.connect()
+        plain_size, plain_scans = measure(plain, runs, "content")
+        packed_size, packed_scans = measure(packed, runs, CONTENT_SQL)
+        plain.close()
+        packed.close()
+
+    rows = sum(row[1] for row in stats)
+    raw_bytes = sum(row[3] or 0 for row in stats)
+    stored_bytes = sum(row[2] or 0 for row in stats)
+    print(f"字典訓練: {train_seconds:.2f} 秒，壓縮 {compressed_count} 篇: {compress_seconds:.2f} 秒")
+    print(f"內容大小: {raw_bytes / 1e6:.2f} MB -> {stored_bytes / 1e6:.2f} MB "
+          f"（{stored_bytes / raw_bytes:.1%}）" if raw_bytes else "內容大小: 0")
+    print(f"資料庫檔案: {plain_size / 1e6:.2f} MB -> {packed_size / 1e6:.2f} MB（{packed_size / plain_size:.1%}）")
+    print(f"{'掃描':<12}{'未壓縮(秒)':>12}{'壓縮(秒)':>12}{'未壓縮 列/秒':>16}{'壓縮 列/秒':>14}")
+    for name in SCAN_QUERIES:
+        plain_seconds, packed_seconds = plain_scans[name], packed_scans[name]
+        print(f"{name:<12}{plain_seconds:>12.3f}{packed_seconds:>12.3f}"
+              f"{rows / max(plain_seconds, 1e-9):>16.0f}{rows / max(packed_seconds, 1e-9):>14.0f}")
+    return True
+
+
+def print_stats(db):
+    """顯示各字典版本的文章數與儲存大小"""
+    rows = db.get_content_storage_stats()
+    print(f"{'字典版本':<10}{'文章數':>10}{'儲存(MB)':>12}{'原始(MB)':>12}{'比例':>8}")
+    for version, count, stored, raw in rows:
+        stored, raw = stored or 0, raw or 0
+        ratio = stored / raw if raw else 1
+        label = "未壓縮" if version is None else str(version)
+        print(f"{label:<10}{count:>10}{stored / 1e6:>12.2f}{raw / 1e6:>12.2f}{ratio:>8.1%}")
+
+
+def main():
+    """主函數"""
+    setup_logging('utils')
+    parser = argparse.ArgumentParser(description='文章內容 zstd 字典壓縮管理')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    train_parser = subparsers.add_parser('train', help='訓練新版本的壓縮字典')
+    train_parser.add_argument('--samples', type=int, default=ZSTD_DICT_SAMPLES, help='抽樣文章數')
+    for name in ('compress', 'decompress'):
+        command_parser = subparsers.add_parser(name, help='壓縮文章內容' if name == 'compress' else '還原文章內容')
+        command_parser.add_argument('--vacuum', action='store_true', help='完成後執行 VACUUM 縮小資料庫檔案')
+    subparsers.add_parser('stats', help='顯示內容儲存大小')
+    benchmark_parser = subparsers.add_parser('benchmark', help='比較壓縮前後的大小與掃描速度')
+    benchmark_parser.add_argument('--runs', type=int, default=3, help='每個掃描查詢的執行次數（取最快）')
+    benchmark_parser.add_argument('--samples', type=int, default=ZSTD_DICT_SAMPLES, help='訓練字典的抽樣文章數')
+    args = parser.parse_args()
+
+    db = DatabaseManager()
+    if not db.connect():
+        print("資料庫連接失敗")
+        return False
+    db.initialize_db()
+    try:
+        if args.command == 'benchmark':
+            db.close()
+            return benchmark(db.db_path, args.runs, args.samples)
+        if args.command == 'train':
+            version = db.train_content_dictionary(args.samples)
+            if version is None:
+                return False
+            print(f"已建立壓縮字典版本 {version}")
+        elif args.command in ('compress', 'decompress'):
+            count = db.compress_contents() if args.command == 'compress' else db.decompress_contents()
+            print(f"已處理 {count} 篇文章")
+            if args.vacuum:
+                vacuum(db)
+        print_stats(db)
+        return True
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
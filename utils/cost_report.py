@@ -0,0 +1,109 @@
+"""
+GPT 分析成本報表工具
+依模型、prompt 版本與分析模式彙總每篇文章記錄的 token 用量，並估算費用與 prompt caching 的效果
+- 快取率為快取 token 佔輸入 token 的比例，命中率為至少有部分輸入命中快取的文章比例
+- 快取節省為快取 token 以一般輸入價格計算與以快取價格計算的差額
+用法: python utils/cost_report.py [--since "2025-01-01 00:00:00"]
+"""
+import os
+import sys
+import argparse
+
+# 將專案根目錄加入系統路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import MODEL_PRICING, BATCH_PRICE_DISCOUNT, PROMPT_CACHE_MIN_TOKENS
+from database.db_manager import DatabaseManager
+from utils.logging_config import setup_logging
+
+
+def estimate_cost(model, mode, prompt_tokens, cached_tokens, completion_tokens):
+    """估算費用（美元），未知模型回傳 None"""
+    pricing = MODEL_PRICING.get(model)
+    if not pricing:
+        return None
+    uncached_tokens = prompt_tokens - cached_tokens
+    cost = (
+        uncached_tokens * pricing["input"]
+        + cached_tokens * pricing["cached_input"]
+        + completion_tokens * pricing["output"]
+    ) / 1_000_000
+    if mode == "batch":
+        cost *= BATCH_PRICE_DISCOUNT
+    return cost
+
+
+def estimate_cache_savings(model, mode, cached_tokens):
+    """估算 prompt caching 節省的費用（美元），未知模型回傳 None"""
+    pricing = MODEL_PRICING.get(model)
+    if not pricing:
+        return None
+    savings = cached_tokens * (pricing["input"] - pricing["cached_input"]) / 1_000_000
+    if mode == "batch":
+        savings *= BATCH_PRICE_DISCOUNT
+    return savings
+
+
+def build_report(rows):
+    """將彙總結果轉為報表文字"""
+    header = (
+        f"{'模型':<20}{'版本':<8}{'模式':<8}{'文章數':>8}{'輸入':>12}{'快取':>12}{'快取率':>8}{'命中率':>8}"
+        f"{'輸出':>12}{'每篇輸入':>10}{'費用(USD)':>12}{'快取節省':>10}"
+    )
+    lines = [header, "-" * len(header)]
+    total_cost = 0.0
+    total_savings = 0.0
+    short_prompts = False
+    for model, version, mode, posts, prompt_tokens, cached_tokens, completion_tokens, cache_hits in rows:
+        cost = estimate_cost(model, mode, prompt_tokens, cached_tokens, completion_tokens)
+        savings = estimate_cache_savings(model, mode, cached_tokens)
+        cache_rate = cached_tokens / prompt_tokens if prompt_tokens else 0
+        hit_rate = cache_hits / posts if posts else 0
+        avg_prompt = prompt_tokens / posts if posts else 0
+        short_prompts = short_prompts or avg_prompt < PROMPT_CACHE_MIN_TOKENS
+        cost_text = f"{cost:.4f}" if cost is not None else "未知"
+        savings_text = f"{savings:.4f}" if savings is not None else "未知"
+        if cost is not None:
+            total_cost += cost
+        if savings is not None:
+            total_savings += savings
+        lines.append(
+            f"{str(model):<20}{str(version):<8}{str(mode):<8}{posts:>8}{prompt_tokens:>12}"
+            f"{cached_tokens:>12}{cache_rate:>8.1%}{hit_rate:>8.1%}{completion_tokens:>12}{avg_prompt:>10.0f}"
+            f"{cost_text:>12}{savings_text:>10}"
+        )
+    lines.append("-" * len(header))
+    lines.append(f"估算總費用: {total_cost:.4f} USD（其中 prompt caching 節省 {total_savings:.4f} USD）")
+    if short_prompts:
+        lines.append(
+            f"注意: 部分組合的平均輸入少於 {PROMPT_CACHE_MIN_TOKENS} token，"
+            "OpenAI 只快取至少此長度的相同前綴，這些請求幾乎不會命中快取"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    """主函數"""
+    setup_logging('utils')
+    parser = argparse.ArgumentParser(description='GPT 分析 token 用量與成本報表')
+    parser.add_argument('--since', type=str, help='只統計此時間之後分析的文章 (格式: YYYY-MM-DD HH:MM:SS)')
+    args = parser.parse_args()
+
+    db = DatabaseManager()
+    if not db.connect():
+        print("資料庫連接失敗")
+        return False
+    db.initialize_db()
+    rows = db.get_token_usage_summary(since=args.since)
+    db.close()
+
+    if not rows:
+        print("沒有任何含 token 用量記錄的分析結果")
+        return True
+
+    print(build_report(rows))
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
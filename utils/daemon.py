@@ -0,0 +1,160 @@
+"""
+常駐模式排程器
+- 爬蟲與 GPT 分析依各自的間隔（加上隨機抖動）週期執行
+- 週期之間保留 HTTP session、Cloudflare cookies、瀏覽器、OpenAI 客戶端與資料庫連線
+- 離峰時段（OFF_PEAK_HOURS）的爬蟲週期會接著排空延後佇列中的低優先文章
+- 收到 SIGTERM / SIGINT 時完成目前的文章後停止，釋放分析租約並關閉資源
+- 每個週期的耗時記錄於 logs/daemon_cycles.jsonl
+"""
+import os
+import sys
+import json
+import time
+import random
+import signal
+import logging
+import threading
+from datetime import datetime
+
+# 將專案根目錄加入系統路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import DAEMON_CRAWL_INTERVAL, DAEMON_ANALYZE_INTERVAL, DAEMON_JITTER, OFF_PEAK_HOURS
+from utils.logging_config import LOG_DIR
+
+logger = logging.getLogger(__name__)
+
+CYCLE_LOG_PATH = os.path.join(LOG_DIR, 'daemon_cycles.jsonl')
+
+
+def jittered(interval, jitter=DAEMON_JITTER):
+    """回傳加上 ±jitter 比例隨機抖動後的間隔"""
+    return interval * (1 + random.uniform(-jitter, jitter))
+
+
+def in_off_peak(now=None, hours=OFF_PEAK_HOURS):
+    """目前是否在離峰時段 [開始, 結束) 內，開始大於結束時表示跨越午夜"""
+    hour = (now or datetime.now()).hour
+    start, end = hours
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+class CrawlerDaemon:
+    """常駐執行爬蟲與分析的排程器"""
+
+    def __init__(self, db, crawler=None, analyzer=None, batch=False,
+                 crawl_interval=DAEMON_CRAWL_INTERVAL, analyze_interval=DAEMON_ANALYZE_INTERVAL):
+        """初始化排程器
+
+        db: 爬蟲與分析器共用的 DatabaseManager
+        crawler / analyzer: 已初始化的 DcardCrawler / GPTAnalyzer，為 None 時不執行該任務
+        batch: 分析週期使用 Batch API（每週期提交或查詢一次，不等待批次完成）
+        """
+        self.db = db
+        self.crawler = crawler
+        self.analyzer = analyzer
+        self.batch = batch
+        self.intervals = {}
+        if crawler is not None:
+            self.intervals['crawl'] = crawl_interval
+        if analyzer is not None:
+            self.intervals['analyze'] = analyze_interval
+        self.stop_event = threading.Event()
+        # 各任務的週期耗時（毫秒），結束時輸出統計
+        self.latencies = {task: [] for task in self.intervals}
+
+    def handle_signal(self, signum, frame):
+        """第一次收到訊號時排空目前工作後停止，第二次則立即中斷"""
+        if self.stop_event.is_set():
+            logger.warning("再次收到停止訊號，立即中斷")
+            raise KeyboardInterrupt
+        logger.info(f"收到訊號 {signal.Signals(signum).name}，完成目前工作後停止")
+        self.stop_event.set()
+
+    def install_signal_handlers(self):
+        """註冊 SIGTERM / SIGINT 處理（僅能在主執行緒中註冊）"""
+        signal.signal(signal.SIGTERM, self.handle_signal)
+        signal.signal(signal.SIGINT, self.handle_signal)
+
+    def run_task(self, task):
+        """執行一次指定任務，回傳是否成功"""
+        if task == 'crawl':
+            success = self.crawler.crawl(close=False, stop_event=self.stop_event, incremental=True)
+            if success and in_off_peak() and not self.stop_event.is_set():
+                success = self.crawler.drain_deferred(close=False, stop_event=self.stop_event)
+            return success
+        if self.batch:
+            return self.analyzer.analyze_posts_batch(wait=False)
+        return self.analyzer.analyze_posts(stop_event=self.stop_event)
+
+    def run_cycle(self, task):
+        """執行一個週期並記錄耗時"""
+        logger.info(f"開始 {task} 週期")
+        start = time.perf_counter()
+        try:
+            success = bool(self.run_task(task))
+        except Exception as e:
+            logger.error(f"{task} 週期發生錯誤: {e}")
+            success = False
+        latency_ms = round((time.perf_counter() - start) * 1000, 1)
+        self.latencies[task].append(latency_ms)
+        logger.info(f"{task} 週期結束，耗時 {latency_ms} ms，{'成功' if success else '失敗'}")
+
+        record = {
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'task': task,
+            'latency_ms': latency_ms,
+            'success': success,
+        }
+        try:
+            with open(CYCLE_LOG_PATH, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+        except OSError as e:
+            logger.warning(f"寫入週期記錄失敗: {e}")
+        return success
+
+    def run(self):
+        """執行排程直到收到停止訊號；所有任務在啟動時先各執行一次"""
+        if not self.intervals:
+            logger.error("沒有需要執行的任務")
+            return False
+
+        if threading.current_thread() is threading.main_thread():
+            self.install_signal_handlers()
+        logger.info(
+            "常駐模式啟動: " + ", ".join(f"{task} 每 {interval} 秒" for task, interval in self.intervals.items())
+        )
+
+        next_run = {task: time.monotonic() for task in self.intervals}
+        try:
+            while not self.stop_event.is_set():
+                task = min(next_run, key=next_run.get)
+                wait = next_run[task] - time.monotonic()
+                if wait > 0:
+                    # 等待期間收到停止訊號會立即醒來
+                    self.stop_event.wait(wait)
+                    continue
+                self.run_cycle(task)
+                next_run[task] = time.monotonic() + jittered(self.intervals[task])
+        finally:
+            self.shutdown()
+        return True
+
+    def shutdown(self):
+        """釋放分析租約、關閉瀏覽器與資料庫並輸出週期耗時統計"""
+        if self.analyzer is not None:
+            self.db.release_leases(self.analyzer.worker_id)
+        if self.crawler is not None:
+            self.crawler.close()
+        self.db.close()
+
+        for task, values in self.latencies.items():
+            if values:
+                ordered = sorted(values)
+                logger.info(
+                    f"{task} 共 {len(values)} 個週期，耗時中位數 {ordered[len(ordered) // 2]} ms，"
+                    f"最長 {ordered[-1]} ms"
+                )
+        logger.info("常駐模式已停止")
@@ -12,19 +12,8 @@ from openai import OpenAI, AzureOpenAI
 # 將專案根目錄加入系統路徑
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# 設定日誌
-log_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logs')
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
+from utils.logging_config import setup_logging
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(log_dir, f'gpt_test_{datetime.now().strftime("%Y%m%d")}.log'), encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
 logger = logging.getLogger(__name__)
 
 class GPTTester:
@@ -135,6 +124,7 @@ class GPTTester:
 
 def main():
     """主函數"""
+    setup_logging(f'gpt_test_{datetime.now().strftime("%Y%m%d")}', console=True)
     print("===== GPT API 連接測試工具 =====")
     
     # 嘗試從環境變數獲取 API 金鑰與端點 URL
@@ -10,13 +10,6 @@ from datetime import datetime, timedelta
 # 將專案根目錄加入系統路徑
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# 設定日誌
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    filename=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logs', 'utils.log'),
-    encoding='utf-8'
-)
 logger = logging.getLogger(__name__)
 
 def ensure_directory(directory_path):
@@ -77,24 +70,10 @@ def format_timestamp(timestamp_str):
         logger.error(f"日期格式化失敗: {e}")
         return timestamp_str
         
-def create_backup(file_path):
-    """創建文件備份"""
-    try:
-        if os.path.exists(file_path):
-            backup_path = f"{file_path}.{datetime.now().strftime('%Y%m%d%H%M%S')}.bak"
-            import shutil
-            shutil.copy2(file_path, backup_path)
-            logger.info(f"已創建備份: {backup_path}")
-            return backup_path
-        else:
-            logger.warning(f"無法創建備份，文件不存在: {file_path}")
-            return None
-    except Exception as e:
-        logger.error(f"創建備份失敗: {e}")
-        return None
-
 # 測試程式碼
 if __name__ == "__main__":
+    from utils.logging_config import setup_logging
+    setup_logging('utils')
     test_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test')
     ensure_directory(test_dir)
     
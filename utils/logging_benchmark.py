@@ -0,0 +1,130 @@
+"""
+日誌效能測試
+比較三種設定下，多執行緒大量記錄每篇文章訊息時呼叫端（熱路徑）的耗時：
+  1. 同步 FileHandler（原本各模組 basicConfig 的做法）
+  2. QueueHandler + 單一背景寫入執行緒
+  3. QueueHandler + 背景寫入 + 依呼叫位置限速
+用法: python utils/logging_benchmark.py [--threads 8] [--messages 20000] [--json] [--disk-latency-us 50]
+--disk-latency-us 模擬較慢的儲存裝置（例如網路磁碟），每筆寫入額外等待指定微秒
+"""
+import os
+import sys
+import time
+import queue
+import logging
+import argparse
+import tempfile
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+# 將專案根目錄加入系統路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.logging_config import LOG_FORMAT, RateLimitFilter, JsonFormatter
+
+
+class SlowFileHandler(logging.FileHandler):
+    """每筆寫入後額外等待，模擬較慢的儲存裝置"""
+
+    def __init__(self, path, latency):
+        super().__init__(path, encoding='utf-8')
+        self.latency = latency
+
+    def emit(self, record):
+        super().emit(record)
+        if self.latency:
+            time.sleep(self.latency)
+
+
+def build_file_handler(path, use_json, latency=0):
+    """建立寫入 path 的 FileHandler"""
+    handler = SlowFileHandler(path, latency)
+    handler.setFormatter(JsonFormatter() if use_json else logging.Formatter(LOG_FORMAT))
+    return handler
+
+
+def emit_messages(logger, thread_count, message_count):
+    """以多個執行緒同時記錄訊息，回傳呼叫端的總耗時（秒）"""
+    barrier = threading.Barrier(thread_count + 1)
+
+    def worker(worker_id):
+        barrier.wait()
+        for index in range(message_count):
+            logger.info(f"成功獲取文章內容: 工作緒{worker_id} 第{index}篇 房貸利率與寬限期討論")
+
+    threads = [threading.Thread(target=worker, args=(worker_id,)) for worker_id in range(thread_count)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def run_scenario(name, temp_dir, thread_count, message_count, use_queue, rate_limit, use_json, latency):
+    """執行一個情境，回傳 (熱路徑耗時, 含寫完所有紀錄的總耗時, 寫入行數)"""
+    path = os.path.join(temp_dir, f"{name}.log")
+    logger = logging.getLogger(f"benchmark.{name}")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    file_handler = build_file_handler(path, use_json, latency)
+
+    listener = None
+    if use_queue:
+        log_queue = queue.SimpleQueue()
+        queue_handler = QueueHandler(log_queue)
+        if rate_limit:
+            queue_handler.addFilter(RateLimitFilter())
+        logger.addHandler(queue_handler)
+        listener = QueueListener(log_queue, file_handler)
+        listener.start()
+    else:
+        logger.addHandler(file_handler)
+
+    start = time.perf_counter()
+    hot_seconds = emit_messages(logger, thread_count, message_count)
+    if listener is not None:
+        listener.stop()
+    file_handler.close()
+    total_seconds = time.perf_counter() - start
+
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    with open(path, 'r', encoding='utf-8') as f:
+        line_count = sum(1 for _ in f)
+    return hot_seconds, total_seconds, line_count
+
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description='日誌效能測試')
+    parser.add_argument('--threads', type=int, default=8, help='同時記錄日誌的執行緒數')
+    parser.add_argument('--messages', type=int, default=20000, help='每個執行緒記錄的訊息數')
+    parser.add_argument('--json', action='store_true', help='日誌檔使用 JSON 格式')
+    parser.add_argument('--disk-latency-us', type=float, default=0, help='模擬每筆寫入的額外延遲（微秒）')
+    args = parser.parse_args()
+
+    scenarios = [
+        ("sync", "同步 FileHandler", False, False),
+        ("queue", "Queue + 背景寫入", True, False),
+        ("queue_limited", "Queue + 背景寫入 + 限速", True, True),
+    ]
+    total_messages = args.threads * args.messages
+    latency = args.disk_latency_us / 1e6
+    print(
+        f"{args.threads} 個執行緒，共 {total_messages} 筆訊息{'（JSON）' if args.json else ''}"
+        f"{f'，模擬寫入延遲 {args.disk_latency_us:g} μs' if latency else ''}"
+    )
+    print(f"{'設定':<24}{'每筆(μs)':>10}{'熱路徑(秒)':>12}{'含寫入(秒)':>12}{'寫入行數':>10}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, label, use_queue, rate_limit in scenarios:
+            hot, total, lines = run_scenario(
+                name, temp_dir, args.threads, args.messages, use_queue, rate_limit, args.json, latency
+            )
+            print(f"{label:<24}{hot / total_messages * 1e6:>10.2f}{hot:>12.3f}{total:>12.3f}{lines:>10}")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
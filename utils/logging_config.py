@@ -0,0 +1,133 @@
+"""
+日誌設定
+由程式入口（main.py 或各模組的 __main__）呼叫一次 setup_logging，
+各模組只需 logging.getLogger(__name__)，不在匯入時設定日誌
+- 記錄日誌的執行緒只把紀錄放入佇列，由單一背景執行緒（QueueListener）寫入檔案與終端機
+- 同一行程式碼的 INFO/DEBUG 訊息依 LOG_RATE_LIMIT 限速，略過的筆數附加在下一筆訊息中
+- LOG_JSON 為 True 時日誌檔改為每行一筆 JSON
+"""
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+# 將專案根目錄加入系統路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import LOG_JSON, LOG_RATE_LIMIT, LOG_RATE_BURST
+
+LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logs')
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# 目前的背景寫入執行緒，shutdown_logging 時停止
+_listener = None
+
+
+class RateLimitFilter(logging.Filter):
+    """依呼叫位置（模組與行號）限制 INFO/DEBUG 訊息的速率
+
+    每個呼叫位置各自有一個 token bucket；超過速率的訊息直接丟棄，
+    不會進入佇列，下一筆通過的訊息會附上略過的筆數
+    """
+
+    def __init__(self, rate=LOG_RATE_LIMIT, burst=LOG_RATE_BURST):
+        super().__init__()
+        self.rate = rate
+        self.burst = max(1, burst)
+        # {(logger 名稱, 行號): [剩餘額度, 上次更新時間, 略過筆數]}
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if self.rate <= 0 or record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.lineno)
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = [float(self.burst), now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed:
+            record.suppressed = suppressed
+            record.msg = f"{record.getMessage()}（已略過同一位置的 {suppressed} 筆訊息）"
+            record.args = None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """將日誌紀錄格式化為單行 JSON"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        if getattr(record, 'suppressed', 0):
+            entry['suppressed'] = record.suppressed
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def setup_logging(log_name, console=False, level=logging.INFO, json_format=None):
+    """設定根日誌記錄器寫入 logs/<log_name>.log，重複呼叫時不會重複加入 handler
+
+    json_format: 日誌檔是否輸出 JSON，None 時依 LOG_JSON 設定（終端機一律為文字格式）
+    """
+    global _listener
+    root = logging.getLogger()
+    if getattr(root, '_dcard_configured', False):
+        return root
+
+    os.makedirs(LOG_DIR, exist_ok=True)
+    use_json = LOG_JSON if json_format is None else json_format
+    file_handler = logging.FileHandler(os.path.join(LOG_DIR, f'{log_name}.log'), encoding='utf-8')
+    file_handler.setFormatter(JsonFormatter() if use_json else logging.Formatter(LOG_FORMAT))
+    handlers = [file_handler]
+    if console:
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        handlers.append(console_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter())
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    root._dcard_configured = True
+    return root
+
+
+def shutdown_logging():
+    """寫出佇列中剩餘的紀錄並停止背景寫入執行緒"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
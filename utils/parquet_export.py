@@ -0,0 +1,271 @@
+"""
+將已分析文章匯出為 Parquet 檔案
+- 依 post_date 的月份分區寫入 <EXPORT_DIR>/post_month=YYYY-MM/part-<時間>.parquet
+- 以 Arrow record batch 串流寫出，記憶體用量只與 EXPORT_BATCH_SIZE 有關
+- 以 change_seq 水位做增量匯出，水位記錄於 <EXPORT_DIR>/_export_state.json；
+  change_seq 依提交順序遞增，不會像秒級的 analyzed_at 一樣漏掉同一秒內較晚提交的文章；
+  重新分析過的文章會在之後的匯出中再出現一次，使用時請依 id 取 analyzed_at 最新的一筆
+- 先寫入 <EXPORT_DIR>/_staging-<時間>/，全部成功後才移入分區；失敗時刪除暫存檔案，不留下不完整的分區檔
+- --full 以新匯出的分區取代所有既有分區，不會與舊檔案重複
+用法: python utils/parquet_export.py [--full] [--no-content]
+"""
+import os
+import sys
+import glob
+import shutil
+import logging
+import argparse
+from datetime import datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow 僅匯出功能需要
+    pa = None
+
+# 將專案根目錄加入系統路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import EXPORT_DIR, EXPORT_BATCH_SIZE
+from database.db_manager import DatabaseManager
+from utils.logging_config import setup_logging
+from utils.helpers import ensure_directory, load_json, save_json
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE_NAME = "_export_state.json"
+UNKNOWN_MONTH = "unknown"
+# 暫存與待刪除目錄以底線開頭，pyarrow / pandas 讀取資料集時會略過
+STAGING_PREFIX = "_staging-"
+REPLACED_PREFIX = "_replaced-"
+PARTITION_PREFIX = "post_month="
+
+# iter_analyzed_posts 回傳的欄位名稱（結構化欄位轉為英文欄位名）
+SOURCE_COLUMNS = [
+    "id", "title", "content", "post_date", "post_month", "created_at", "analyzed_at",
+    "relevance_score", "prompt_version", "analysis_model",
+    "loan_amount", "interest_rate", "loan_term", "loan_to_value", "monthly_payment", "banks", "change_seq",
+]
+
+
+def build_schema(include_content=True):
+    """Parquet 檔案的欄位定義"""
+    fields = [
+        pa.field("id", pa.int64()),
+        pa.field("title", pa.string()),
+        pa.field("content", pa.string()),
+        pa.field("post_date", pa.timestamp("s")),
+        pa.field("created_at", pa.timestamp("s")),
+        pa.field("analyzed_at", pa.timestamp("s")),
+        pa.field("relevance_score", pa.int32()),
+        pa.field("prompt_version", pa.string()),
+        pa.field("analysis_model", pa.string()),
+        pa.field("loan_amount", pa.string()),
+        pa.field("interest_rate", pa.string()),
+        pa.field("loan_term", pa.string()),
+        pa.field("loan_to_value", pa.string()),
+        pa.field("monthly_payment", pa.string()),
+        pa.field("banks", pa.list_(pa.string())),
+    ]
+    if not include_content:
+        fields = [field for field in fields if field.name != "content"]
+    return pa.schema(fields)
+
+
+def _to_timestamp(array):
+    """將 'YYYY-MM-DD HH:MM:SS' 字串欄位轉為 timestamp，無法解析者為 null"""
+    return pc.strptime(array, format="%Y-%m-%d %H:%M:%S", unit="s", error_is_null=True)
+
+
+def rows_to_record_batch(rows, schema):
+    """將一批資料列轉為 Arrow record batch，回傳 (record batch, 月份欄位)"""
+    columns = dict(zip(SOURCE_COLUMNS, zip(*rows)))
+    arrays = {
+        "id": pa.array(columns["id"], pa.int64()),
+        "title": pa.array(columns["title"], pa.string()),
+        "post_date": _to_timestamp(pa.array(columns["post_date"], pa.string())),
+        "created_at": _to_timestamp(pa.array(columns["created_at"], pa.string())),
+        "analyzed_at": _to_timestamp(pa.array(columns["analyzed_at"], pa.string())),
+        "relevance_score": pa.array(columns["relevance_score"], pa.int32()),
+        "prompt_version": pa.array(columns["prompt_version"], pa.string()),
+        "analysis_model": pa.array(columns["analysis_model"], pa.string()),
+        # 銀行列表在 SQL 中以 \x1f 串接，於 Arrow 中向量化切回列表；沒有提到銀行時為空列表而非 null
+        "banks": pc.fill_null(
+            pc.split_pattern(pa.array(columns["banks"], pa.string()), pattern="\x1f"),
+            pa.scalar([], pa.list_(pa.string()))
+        ),
+    }
+    for name in ("loan_amount", "interest_rate", "loan_term", "loan_to_value", "monthly_payment"):
+        arrays[name] = pa.array([None if value is None else str(value) for value in columns[name]], pa.string())
+    if "content" in schema.names:
+        arrays["content"] = pa.array(columns["content"], pa.string())
+
+    months = pc.fill_null(pa.array(columns["post_month"], pa.string()), UNKNOWN_MONTH)
+    record_batch = pa.RecordBatch.from_arrays([arrays[name] for name in schema.names], schema=schema)
+    return record_batch, months
+
+
+class ParquetExporter:
+    """以月份分區、增量方式匯出已分析文章"""
+
+    def __init__(self, export_dir=None, batch_size=EXPORT_BATCH_SIZE, include_content=True, db=None):
+        """初始化匯出器"""
+        if pa is None:
+            raise ImportError("匯出 Parquet 需要 pyarrow，請執行 pip install pyarrow")
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.export_dir = export_dir or os.path.join(project_root, EXPORT_DIR)
+        self.state_path = os.path.join(self.export_dir, STATE_FILE_NAME)
+        self.batch_size = batch_size
+        self.schema = build_schema(include_content)
+        self.db = db or DatabaseManager()
+
+    def load_watermark(self):
+        """讀取上次匯出的 change_seq 水位，沒有水位時回傳 None"""
+        if not os.path.exists(self.state_path):
+            return None
+        state = load_json(self.state_path) or {}
+        return state.get("change_seq")
+
+    def has_legacy_state(self):
+        """水位檔是否為舊版的 (analyzed_at, id) 格式"""
+        if not os.path.exists(self.state_path):
+            return False
+        state = load_json(self.state_path) or {}
+        return "change_seq" not in state and bool(state.get("analyzed_at"))
+
+    def export(self, full=False):
+        """執行匯出，回傳匯出的文章數，失敗時回傳 None
+
+        full 為 True 時忽略水位重新匯出全部文章，並取代所有既有分區
+        """
+        ensure_directory(self.export_dir)
+        if self.remove_leftovers() and not full:
+            logger.warning("上次完整匯出未完成，本次改為完整匯出")
+            full = True
+        if self.has_legacy_state() and not full:
+            logger.warning("水位檔為舊版格式，本次改為完整匯出")
+            full = True
+        if not self.db.connect():
+            return None
+        self.db.initialize_db()
+
+        since = None if full else self.load_watermark()
+        if since is not None:
+            logger.info(f"增量匯出: change_seq > {since}")
+
+        run_id = datetime.now().strftime('%Y%m%d%H%M%S%f')
+        staging_dir = os.path.join(self.export_dir, f"{STAGING_PREFIX}{run_id}")
+        writers = {}
+        exported = 0
+        watermark = since or 0
+        try:
+            for rows in self.db.iter_analyzed_posts(since=since, batch_size=self.batch_size):
+                record_batch, months = rows_to_record_batch(rows, self.schema)
+                for month in pc.unique(months).to_pylist():
+                    part = record_batch.filter(pc.equal(months, month))
+                    writer = writers.get(month)
+                    if writer is None:
+                        partition_dir = os.path.join(staging_dir, f"{PARTITION_PREFIX}{month}")
+                        ensure_directory(partition_dir)
+                        writer = pq.ParquetWriter(
+                            os.path.join(partition_dir, f"part-{run_id}.parquet"),
+                            self.schema,
+                            compression="zstd"
+                        )
+                        writers[month] = writer
+                    writer.write_batch(part)
+                exported += len(rows)
+                watermark = max(watermark, rows[-1][-1] or 0)
+            for writer in writers.values():
+                writer.close()
+        except Exception as e:
+            logger.error(f"匯出失敗，刪除本次寫出的暫存檔案: {e}")
+            for writer in writers.values():
+                try:
+                    writer.close()
+                except Exception:
+                    pass
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            return None
+        finally:
+            self.db.close()
+
+        self.publish(staging_dir, run_id, full)
+        # 所有檔案都成功移入分區後才推進水位
+        if exported or full:
+            save_json({"change_seq": watermark, "exported_at": run_id}, self.state_path)
+        logger.info(f"已匯出 {exported} 篇文章到 {len(writers)} 個月份分區")
+        return exported
+
+    def partition_dirs(self, root):
+        """列出 root 下的月份分區目錄"""
+        return sorted(glob.glob(os.path.join(root, f"{PARTITION_PREFIX}*")))
+
+    def publish(self, staging_dir, run_id, full):
+        """將暫存目錄中的檔案移入分區
+
+        增量匯出時新增 part 檔到各分區；完整匯出時先將既有分區整個移到待刪除目錄，
+        再移入新分區，最後刪除舊分區
+        """
+        replaced_dir = None
+        if full:
+            replaced_dir = os.path.join(self.export_dir, f"{REPLACED_PREFIX}{run_id}")
+            old_partitions = self.partition_dirs(self.export_dir)
+            if old_partitions:
+                ensure_directory(replaced_dir)
+                for partition_dir in old_partitions:
+                    os.replace(partition_dir, os.path.join(replaced_dir, os.path.basename(partition_dir)))
+
+        for staged_partition in self.partition_dirs(staging_dir):
+            target_partition = os.path.join(self.export_dir, os.path.basename(staged_partition))
+            if not os.path.exists(target_partition):
+                os.replace(staged_partition, target_partition)
+                continue
+            for staged_file in os.listdir(staged_partition):
+                os.replace(os.path.join(staged_partition, staged_file), os.path.join(target_partition, staged_file))
+
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        if replaced_dir:
+            shutil.rmtree(replaced_dir, ignore_errors=True)
+
+    def remove_leftovers(self):
+        """刪除先前異常中斷的匯出留下的暫存目錄，回傳是否有中斷的完整匯出
+
+        完整匯出在替換分區途中中斷時，尚未被取代的舊分區先移回，
+        分區新舊混雜且水位未更新，呼叫端需再做一次完整匯出
+        """
+        interrupted_full = False
+        for replaced_dir in glob.glob(os.path.join(self.export_dir, f"{REPLACED_PREFIX}*")):
+            for partition_dir in self.partition_dirs(replaced_dir):
+                target_partition = os.path.join(self.export_dir, os.path.basename(partition_dir))
+                if not os.path.exists(target_partition):
+                    os.replace(partition_dir, target_partition)
+            shutil.rmtree(replaced_dir, ignore_errors=True)
+            interrupted_full = True
+        for staging_dir in glob.glob(os.path.join(self.export_dir, f"{STAGING_PREFIX}*")):
+            logger.warning(f"刪除未完成匯出的暫存目錄: {staging_dir}")
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        return interrupted_full
+
+
+def main():
+    """主函數"""
+    setup_logging('export')
+    parser = argparse.ArgumentParser(description='匯出已分析文章為 Parquet 檔案')
+    parser.add_argument('--full', action='store_true', help='忽略上次匯出的水位，重新匯出全部文章')
+    parser.add_argument('--no-content', action='store_true', help='不匯出文章內容欄位')
+    parser.add_argument('--output', type=str, help='匯出目錄（預設為 config 中的 EXPORT_DIR）')
+    args = parser.parse_args()
+
+    exporter = ParquetExporter(export_dir=args.output, include_content=not args.no_content)
+    exported = exporter.export(full=args.full)
+    if exported is None:
+        print("匯出失敗，詳見日誌")
+        return False
+    print(f"已匯出 {exported} 篇文章至 {exporter.export_dir}")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,125 @@
+"""
+相似文章查詢效能測試
+以合成的分群向量建立索引，量測 top-k 查詢的延遲（p50 / p95）：
+  1. 暴力搜尋（文章數未達 SIMILARITY_IVF_MIN_POSTS 時的做法）
+  2. IVF 分群搜尋，並以暴力搜尋的結果計算 recall@k
+  3. IVF 分群搜尋 + 尾端附加的向量（建立索引後爬蟲新增的文章）
+另外量測將查詢文字轉為向量的耗時
+用法: python utils/similarity_benchmark.py [--posts 10000 100000] [--queries 200] [--top 10] [--tail 2000]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+# 將專案根目錄加入系統路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import SIMILARITY_DIM, SIMILARITY_N_FEATURES
+from analysis.similarity import SimilarityIndex
+
+SAMPLE_TEXT = "新青安貸款寬限期五年，利率 1.775%，寬限期過後每月本息攤還要多少？公股銀行房貸成數可以到八成嗎"
+
+
+def synthetic_vectors(count, dim, rng, n_topics=200, noise=0.6):
+    """產生圍繞若干主題分布的正規化向量，模擬真實文章的分群結構"""
+    topics = rng.standard_normal((n_topics, dim)).astype(np.float32)
+    vectors = topics[rng.integers(n_topics, size=count)] + noise * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def create_index(index_dir, vectors, use_ivf, tail):
+    """將向量寫成索引檔案，use_ivf 時建立分群，最後 tail 筆作為建立後才附加的向量"""
+    index = SimilarityIndex(index_dir=index_dir)
+    os.makedirs(index_dir)
+    rng = np.random.default_rng(0)
+    components = rng.standard_normal((vectors.shape[1], SIMILARITY_N_FEATURES)).astype(np.float32)
+    np.savez(index._path("model.npz"), idf=np.ones(SIMILARITY_N_FEATURES, dtype=np.float32), components=components)
+
+    indexed = len(vectors) - tail
+    vectors[:indexed].tofile(index._path("vectors.f32"))
+    np.arange(1, indexed + 1, dtype=np.int64).tofile(index._path("ids.i64"))
+    meta = {
+        "count": indexed,
+        "dim": vectors.shape[1],
+        "n_features": SIMILARITY_N_FEATURES,
+        "ivf_indexed": index._build_ivf(index_dir, indexed, vectors.shape[1]) if use_ivf else 0,
+        "superseded": 0,
+        "built_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    index._save_meta(meta)
+    index.load()
+    if tail:
+        with open(index._path("vectors.f32"), 'ab') as f:
+            f.write(vectors[indexed:].tobytes())
+        with open(index._path("ids.i64"), 'ab') as f:
+            f.write(np.arange(indexed + 1, len(vectors) + 1, dtype=np.int64).tobytes())
+        index.meta["count"] = len(vectors)
+        index._save_meta(index.meta)
+    return index
+
+
+def measure(index, queries, top_k):
+    """逐筆查詢，回傳 (每筆耗時毫秒, 查詢結果)"""
+    index.search(queries[0], top_k)  # 預熱 memory map
+    latencies, results = [], []
+    for vector in queries:
+        start = time.perf_counter()
+        results.append(index.search(vector, top_k))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies), results
+
+
+def recall(results, truth):
+    """以暴力搜尋結果為標準計算 recall@k"""
+    hits = sum(len({post_id for post_id, _ in got} & {post_id for post_id, _ in expected}) for got, expected in zip(results, truth))
+    return hits / max(sum(len(expected) for expected in truth), 1)
+
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description='相似文章查詢效能測試')
+    parser.add_argument('--posts', type=int, nargs='+', default=[10000, 100000], help='索引的文章數（可指定多個）')
+    parser.add_argument('--queries', type=int, default=200, help='每種設定的查詢次數')
+    parser.add_argument('--top', type=int, default=10, help='每次查詢回傳的文章數')
+    parser.add_argument('--tail', type=int, default=2000, help='建立索引後附加在尾端的文章數')
+    parser.add_argument('--dim', type=int, default=SIMILARITY_DIM, help='向量維度')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    print(f"維度 {args.dim}，每種設定 {args.queries} 次查詢，top {args.top}")
+    print(f"{'設定':<28}{'文章數':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'recall':>10}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for count in args.posts:
+            vectors = synthetic_vectors(count, args.dim, rng)
+            queries = synthetic_vectors(args.queries, args.dim, rng)
+            tail = min(args.tail, count // 2)
+            scenarios = [
+                ("brute", "暴力搜尋", False, 0),
+                ("ivf", "IVF 分群", True, 0),
+                ("ivf_tail", f"IVF 分群 + 尾端 {tail} 筆", True, tail),
+            ]
+            truth = None
+            for name, label, use_ivf, scenario_tail in scenarios:
+                index = create_index(os.path.join(temp_dir, f"{name}-{count}"), vectors.copy(), use_ivf, scenario_tail)
+                latencies, results = measure(index, queries, args.top)
+                if truth is None:
+                    truth = results
+                print(
+                    f"{label:<28}{count:>10}{np.percentile(latencies, 50):>10.2f}"
+                    f"{np.percentile(latencies, 95):>10.2f}{recall(results, truth):>10.3f}"
+                )
+
+        start = time.perf_counter()
+        for _ in range(args.queries):
+            index.embed(SAMPLE_TEXT)
+        print(f"查詢文字轉向量: 每筆 {(time.perf_counter() - start) / args.queries * 1000:.2f} ms")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)